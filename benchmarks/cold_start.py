@@ -0,0 +1,214 @@
+"""
+Measures the cold-start time of each INNDiE CLI subcommand against a local stand-in for AWS.
+
+Every sample runs the CLI in a fresh interpreter, so it includes Python startup, imports, the
+bucket lookup and connection setup. By default a moto server is started on a free port; pass
+--endpoint-url to use a stand-in that is already running.
+
+    python benchmarks/cold_start.py --save-baseline baseline.json
+    python benchmarks/cold_start.py --baseline baseline.json --threshold 1.25
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN_CLI = "import sys; from inndie.client import cli; sys.exit(cli())"
+
+CHECK_LAZY_IMPORT = "import sys; import inndie.client; " \
+                    "sys.exit(1 if 'boto3' in sys.modules or 'botocore' in sys.modules else 0)"
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_moto_server(command):
+    """
+    Starts a moto server and waits for it to accept connections.
+
+    :param command: The moto server executable.
+    :return: A tuple of the process and its endpoint URL.
+    """
+    port = get_free_port()
+    process = subprocess.Popen([command, "-p", str(port)], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, "http://127.0.0.1:{}".format(port)
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("The moto server did not start on port {}".format(port))
+
+
+def make_import_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def make_env(endpoint_url, cache_dir):
+    env = make_import_env()
+    env.update({
+        "INNDIE_ENDPOINT_URL": endpoint_url,
+        "INNDIE_CACHE_DIR": cache_dir,
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1"
+    })
+    return env
+
+
+def run_cli(args, env):
+    """
+    Runs the CLI once in a fresh interpreter.
+
+    :return: The wall time in seconds.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", RUN_CLI] + args, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def make_commands(work_dir):
+    """
+    :param work_dir: A scratch directory for the files the commands read and write.
+    :return: A list of `(name, args)` tuples, in the order they are run. Later commands rely on
+    the objects earlier commands upload.
+    """
+    model = os.path.join(work_dir, "model.h5")
+    dataset = os.path.join(work_dir, "dataset.zip")
+    log_file = os.path.join(work_dir, "log.txt")
+    results = os.path.join(work_dir, "results")
+    os.makedirs(os.path.join(results, "checkpoints"))
+    for path in [model, dataset, log_file, os.path.join(results, "metrics.csv"),
+                 os.path.join(results, "checkpoints", "last.h5")]:
+        with open(path, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+
+    return [
+        ("--help", ["--help"]),
+        ("upload-model", ["upload-model", model]),
+        ("download-model", ["download-model", model]),
+        ("upload-dataset", ["upload-dataset", dataset]),
+        ("download-dataset", ["download-dataset", dataset]),
+        ("update-training-progress", ["update-training-progress", "bench", "1/10"]),
+        ("create-heartbeat", ["create-heartbeat", "bench"]),
+        ("remove-heartbeat", ["remove-heartbeat", "bench"]),
+        ("set-training-log-file", ["set-training-log-file", "bench", log_file]),
+        ("upload-training-results", ["upload-training-results", "bench", results])
+    ]
+
+
+def run_benchmark(endpoint_url, repeat):
+    """
+    :param endpoint_url: The endpoint of the AWS stand-in.
+    :param repeat: The number of samples to take of each command.
+    :return: A dict of command name to a dict of timing statistics in milliseconds.
+    """
+    work_dir = tempfile.mkdtemp(prefix="inndie-bench-")
+    try:
+        env = make_env(endpoint_url, os.path.join(work_dir, "cache"))
+        commands = make_commands(work_dir)
+
+        # Create the bucket and fill the bucket cache, like any machine after its first command
+        run_cli(["create-heartbeat", "bench"], env)
+
+        results = {}
+        for name, args in commands:
+            samples = [run_cli(args, env) * 1000 for _ in range(repeat)]
+            results[name] = {
+                "median_ms": statistics.median(samples),
+                "min_ms": min(samples),
+                "max_ms": max(samples)
+            }
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    :param results: The results of this run.
+    :param baseline: The stored results to compare against.
+    :param threshold: How many times slower than the baseline a command may be.
+    :return: A list of `(name, median_ms, baseline_median_ms)` tuples for the slow commands.
+    """
+    regressions = []
+    for name, stats in results.items():
+        if name in baseline and stats["median_ms"] > baseline[name]["median_ms"] * threshold:
+            regressions.append((name, stats["median_ms"], baseline[name]["median_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", help="The endpoint of a running AWS stand-in.")
+    parser.add_argument("--moto-server", default="moto_server",
+                        help="The moto server executable to start if --endpoint-url is not given.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="The number of samples to take of each command.")
+    parser.add_argument("--baseline", help="A baseline file to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="How many times slower than the baseline a command may be.")
+    parser.add_argument("--save-baseline", help="A file to save the results to.")
+    args = parser.parse_args()
+
+    if subprocess.run([sys.executable, "-c", CHECK_LAZY_IMPORT],
+                      env=make_import_env()).returncode != 0:
+        print("Importing inndie.client imported boto3 or botocore")
+        return 1
+
+    moto_process = None
+    endpoint_url = args.endpoint_url
+    if endpoint_url is None:
+        moto_process, endpoint_url = start_moto_server(args.moto_server)
+
+    try:
+        results = run_benchmark(endpoint_url, args.repeat)
+    finally:
+        if moto_process is not None:
+            moto_process.terminate()
+            moto_process.wait()
+
+    print("{:<28} {:>10} {:>10} {:>10}".format("command", "median ms", "min ms", "max ms"))
+    for name, stats in results.items():
+        print("{:<28} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name, stats["median_ms"], stats["min_ms"], stats["max_ms"]))
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, median_ms, baseline_ms in regressions:
+            print("REGRESSION {}: {:.1f} ms (baseline {:.1f} ms)".format(
+                name, median_ms, baseline_ms))
+        if len(regressions) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
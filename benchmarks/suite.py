@@ -0,0 +1,383 @@
+"""
+Benchmarks every INNDiE operation in-process against a local stand-in for AWS, with no network.
+
+Each `impl_*` function is timed with warm clients, like a long-running process would see it. The
+suite covers upload and download throughput across file sizes and file counts, the latency of
+the control-plane commands, the AWS API calls each operation makes and its peak Python memory.
+With --cli, the cold-start time of each CLI subcommand (see cold_start.py) is included too.
+
+By default a moto server is started on a free port; pass --endpoint-url to use a stand-in that
+is already running.
+
+    python benchmarks/suite.py --save-baseline suite-baseline.json
+    python benchmarks/suite.py --baseline suite-baseline.json --threshold 1.25
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cold_start
+
+MIB = 1024 * 1024
+
+DEFAULT_SIZES = "1MiB,16MiB,64MiB"
+DEFAULT_COUNTS = "100,1000"
+SMALL_FILE_SIZE = 4 * 1024
+
+
+def parse_sizes(text):
+    """
+    :param text: A comma-separated list of sizes, such as "1MiB,16MiB".
+    :return: A list of sizes in bytes.
+    """
+    from inndie import transfer
+    return [transfer.parse_byte_size(it) for it in text.split(",")]
+
+
+def format_size(size):
+    if size % MIB == 0:
+        return "{}MiB".format(size // MIB)
+    return "{}KiB".format(size // 1024)
+
+
+def write_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for offset in range(0, size, MIB):
+            f.write(os.urandom(min(MIB, size - offset)))
+
+
+def write_files(root, count, size):
+    """
+    Writes `count` random files of `size` bytes, spread over a few subdirectories.
+    """
+    for index in range(count):
+        write_file(os.path.join(root, "part-{}".format(index % 10), "{:06d}.bin".format(index)),
+                   size)
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Case:
+    """
+    One benchmark. `function` is timed after `setup` runs, and `size` is the number of bytes it
+    transfers, if any.
+    """
+
+    def __init__(self, name, function, setup=None, size=None):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.size = size
+
+
+def make_cases(work_dir, bucket_name, sizes, counts):
+    """
+    :param work_dir: A scratch directory for the files the operations read and write.
+    :param bucket_name: The S3 bucket name.
+    :param sizes: The file sizes to measure single-file throughput with.
+    :param counts: The file counts to measure directory throughput with.
+    :return: A list of `Case`s, in the order they are run. Later cases rely on the objects
+    earlier cases upload.
+    """
+    from inndie import client, heartbeat
+
+    region = None
+    cases = []
+
+    def add(name, function, setup=None, size=None):
+        cases.append(Case(name, function, setup, size))
+
+    # Bulk transfers of one file
+    for size in sizes:
+        path = os.path.join(work_dir, "single", "data-{}.bin".format(format_size(size)))
+        write_file(path, size)
+        add("upload-dataset {}".format(format_size(size)),
+            lambda path=path: client.impl_upload_dataset(path, bucket_name, region), size=size)
+        add("download-dataset {}".format(format_size(size)),
+            lambda path=path: client.impl_download_dataset(path, bucket_name, region),
+            lambda path=path: remove(path), size)
+
+    size = max(sizes)
+    path = os.path.join(work_dir, "resumable", "data-{}.bin".format(format_size(size)))
+    write_file(path, size)
+    add("upload-dataset {} --resume".format(format_size(size)),
+        lambda: client.impl_upload_dataset(path, bucket_name, region, resume=True), size=size)
+    add("download-dataset {} --resume".format(format_size(size)),
+        lambda: client.impl_download_dataset(path, bucket_name, region, resume=True),
+        lambda: remove(path), size)
+
+    # Bulk transfers of many small files
+    for count in counts:
+        root = os.path.join(work_dir, "dirs", "files-{}".format(count))
+        packed_root = os.path.join(work_dir, "packed", "files-{}".format(count))
+        write_files(root, count, SMALL_FILE_SIZE)
+        shutil.copytree(root, packed_root)
+        size = count * SMALL_FILE_SIZE
+        add("upload-dataset {} files".format(count),
+            lambda root=root: client.impl_upload_dataset(root, bucket_name, region), size=size)
+        add("download-dataset {} files".format(count),
+            lambda root=root: client.impl_download_dataset(root, bucket_name, region),
+            lambda root=root: remove(root), size)
+        add("upload-dataset {} files --pack-small-files".format(count),
+            lambda root=packed_root: client.impl_upload_dataset(root, bucket_name, region,
+                                                                pack=True), size=size)
+        add("download-dataset {} packed files".format(count),
+            lambda root=packed_root: client.impl_download_dataset(root, bucket_name, region),
+            lambda root=packed_root: remove(root), size)
+
+        results = os.path.join(work_dir, "results", "files-{}".format(count))
+        write_files(results, count, SMALL_FILE_SIZE)
+        add("upload-training-results {} files".format(count),
+            lambda results=results: client.impl_upload_training_results(
+                "bench", results, bucket_name, region), size=size)
+        add("upload-training-results {} files --sync".format(count),
+            lambda results=results: client.impl_upload_training_results(
+                "bench", results, bucket_name, region, sync=True))
+
+    # Models are stored by content hash, so each sample uploads new content
+    model = os.path.join(work_dir, "model", "model.h5")
+    size = min(sizes[-1], 16 * MIB)
+    add("upload-model", lambda: client.impl_upload_model(model, bucket_name, region),
+        lambda: write_file(model, size), size)
+    add("upload-model (unchanged)", lambda: client.impl_upload_model(model, bucket_name, region))
+    add("download-model", lambda: client.impl_download_model(model, bucket_name, region),
+        lambda: remove(model), size)
+
+    # The control plane
+    script = os.path.join(work_dir, "script", "train.py")
+    write_file(script, SMALL_FILE_SIZE)
+    client.make_client("s3", region).upload_file(script, bucket_name,
+                                                 "inndie-training-scripts/train.py")
+    log_file = os.path.join(work_dir, "log", "log.txt")
+    write_file(log_file, 64 * 1024)
+    records = [{"step": step, "loss": 1.0 / (step + 1)} for step in range(1000)]
+
+    add("ensure-s3-bucket", lambda: client.ensure_s3_bucket(region))
+    add("ensure-configuration", lambda: client.impl_ensure_configuration(region))
+    add("download-training-script",
+        lambda: client.impl_download_training_script(script, bucket_name, region),
+        lambda: remove(script))
+    add("update-training-progress",
+        lambda: client.impl_update_training_progress("bench", "1/10", bucket_name, region))
+    add("put-training-metrics 1000 records",
+        lambda: client.impl_put_training_metrics("bench", records, bucket_name, region))
+    add("create-heartbeat",
+        lambda: client.impl_create_heartbeat("bench", bucket_name, region))
+    add("create-heartbeat --lease",
+        lambda: client.impl_create_heartbeat("bench", bucket_name, region,
+                                             heartbeat.DEFAULT_INTERVAL * 3, 1))
+    add("emit-heartbeats",
+        lambda: client.impl_emit_heartbeats("bench", bucket_name, region, lambda: True))
+    add("remove-heartbeat",
+        lambda: client.impl_remove_heartbeat("bench", bucket_name, region))
+    add("set-training-log-file",
+        lambda: client.impl_set_training_log_file("bench", log_file, bucket_name, region))
+    add("stream-training-log",
+        lambda: client.impl_stream_training_log("bench", log_file, bucket_name, region,
+                                                lambda: True))
+    return cases
+
+
+def count_api_calls():
+    from inndie import session
+    return sum(session.get_api_call_counts().values())
+
+
+def run_case(case, repeat):
+    """
+    Times a case `repeat` times, then runs it once more with tracemalloc on to find its peak
+    Python memory. tracemalloc slows Python code down, so that run is not timed.
+
+    :return: A dict of statistics.
+    """
+    samples = []
+    api_calls = 0
+    for _ in range(repeat):
+        if case.setup is not None:
+            case.setup()
+        before = count_api_calls()
+        start = time.perf_counter()
+        case.function()
+        samples.append(time.perf_counter() - start)
+        api_calls = count_api_calls() - before
+
+    if case.setup is not None:
+        case.setup()
+    tracemalloc.start()
+    try:
+        case.function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(samples)
+    stats = {
+        "median_ms": median * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "api_calls": api_calls,
+        "peak_mib": peak / MIB
+    }
+    if case.size is not None:
+        stats["mib_per_second"] = case.size / MIB / median if median > 0 else None
+    return stats
+
+
+def run_suite(repeat, sizes, counts, selected=None):
+    """
+    :param repeat: The number of samples to take of each case.
+    :param sizes: The file sizes to measure single-file throughput with.
+    :param counts: The file counts to measure directory throughput with.
+    :param selected: A list of substrings; only the cases whose name contains one are run. `None`
+    runs every case.
+    :return: A dict of case name to a dict of statistics, or to a dict with the "error" if the
+    case failed.
+    """
+    from inndie import client, download_cache, output
+
+    work_dir = tempfile.mkdtemp(prefix="inndie-suite-")
+    try:
+        # Every sample should hit S3, not the local download cache
+        download_cache.configure(enabled=False)
+        with output.silenced():
+            bucket_name = client.ensure_s3_bucket(None)
+            cases = make_cases(work_dir, bucket_name, sizes, counts)
+
+            results = {}
+            for case in cases:
+                if selected is not None and not any(it in case.name for it in selected):
+                    continue
+                try:
+                    results[case.name] = run_case(case, repeat)
+                except Exception as e:
+                    results[case.name] = {"error": "{}: {}".format(type(e).__name__, e)}
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    :param results: The results of this run.
+    :param baseline: The stored results to compare against.
+    :param threshold: How many times slower, or how many times more memory, than the baseline a
+    case may take. Any increase in API calls is a regression.
+    :return: A list of `(name, description)` tuples.
+    """
+    regressions = []
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old is None or "error" in old:
+            continue
+        if "error" in stats:
+            regressions.append((name, "failed: {}".format(stats["error"])))
+            continue
+
+        if stats["median_ms"] > old["median_ms"] * threshold:
+            regressions.append((name, "{:.1f} ms (baseline {:.1f} ms)".format(
+                stats["median_ms"], old["median_ms"])))
+        if "api_calls" in old and stats["api_calls"] > old["api_calls"]:
+            regressions.append((name, "{} API calls (baseline {})".format(
+                stats["api_calls"], old["api_calls"])))
+        # Allow 1 MiB of slack so tiny allocations do not trip the threshold
+        if "peak_mib" in old and stats["peak_mib"] > old["peak_mib"] * threshold + 1:
+            regressions.append((name, "{:.1f} MiB peak memory (baseline {:.1f} MiB)".format(
+                stats["peak_mib"], old["peak_mib"])))
+    return regressions
+
+
+def print_results(results):
+    print("{:<48} {:>10} {:>10} {:>9} {:>9}".format("case", "median ms", "MiB/s", "API calls",
+                                                    "peak MiB"))
+    for name, stats in results.items():
+        if "error" in stats:
+            print("{:<48} {}".format(name, stats["error"].splitlines()[0]))
+            continue
+        throughput = stats.get("mib_per_second")
+        print("{:<48} {:>10.1f} {:>10} {:>9} {:>9}".format(
+            name, stats["median_ms"], "{:.1f}".format(throughput) if throughput else "",
+            stats.get("api_calls", ""),
+            "{:.1f}".format(stats["peak_mib"]) if "peak_mib" in stats else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", help="The endpoint of a running AWS stand-in.")
+    parser.add_argument("--moto-server", default="moto_server",
+                        help="The moto server executable to start if --endpoint-url is not given.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="The number of samples to take of each case.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="The file sizes to measure single-file throughput with.")
+    parser.add_argument("--counts", default=DEFAULT_COUNTS,
+                        help="The file counts to measure directory throughput with.")
+    parser.add_argument("--only", action="append",
+                        help="Only run the cases whose name contains this. May be repeated.")
+    parser.add_argument("--cli", action="store_true",
+                        help="Also measure the cold-start time of each CLI subcommand.")
+    parser.add_argument("--baseline", help="A baseline file to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="How many times slower, or how many times more memory, than the "
+                             "baseline a case may take.")
+    parser.add_argument("--save-baseline", help="A file to save the results to.")
+    args = parser.parse_args()
+
+    moto_process = None
+    endpoint_url = args.endpoint_url
+    if endpoint_url is None:
+        # ensure-configuration attaches an AWS managed policy, which moto only knows about if it
+        # is asked to load them
+        os.environ["MOTO_IAM_LOAD_MANAGED_POLICIES"] = "true"
+        moto_process, endpoint_url = cold_start.start_moto_server(args.moto_server)
+
+    cache_dir = tempfile.mkdtemp(prefix="inndie-suite-cache-")
+    # Set before inndie is imported, since the session reads the endpoint when it is imported
+    os.environ.update(cold_start.make_env(endpoint_url, cache_dir))
+    sys.path.insert(0, cold_start.REPO_ROOT)
+
+    try:
+        results = run_suite(args.repeat, parse_sizes(args.sizes),
+                            [int(it) for it in args.counts.split(",")], args.only)
+        if args.cli:
+            for name, stats in cold_start.run_benchmark(endpoint_url, args.repeat).items():
+                results["cli " + name] = stats
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if moto_process is not None:
+            moto_process.terminate()
+            moto_process.wait()
+
+    print_results(results)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, description in regressions:
+            print("REGRESSION {}: {}".format(name, description))
+        if len(regressions) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
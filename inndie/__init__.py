@@ -0,0 +1,18 @@
+from inndie.api import BackgroundTask, InndieClient
+from inndie.errors import InndieError, NotFoundError
+from inndie.resumable import IntegrityError
+from inndie.steps import StepError
+from inndie.transfer import TransferError, get_transfer_settings
+from inndie.waiters import WaiterTimeoutError
+
+__all__ = [
+    "BackgroundTask",
+    "InndieClient",
+    "InndieError",
+    "IntegrityError",
+    "NotFoundError",
+    "StepError",
+    "TransferError",
+    "WaiterTimeoutError",
+    "get_transfer_settings"
+]
@@ -0,0 +1,218 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from inndie.local_state import get_cache_dir
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# Events of these types only need their latest value written, so an event replaces any pending
+# event with the same coalescing key
+COALESCE_KEYS = {
+    "progress": ("job_id",),
+    "heartbeat": ("job_id",),
+    "log": ("job_id",),
+    "results": ("job_id", "output_dir")
+}
+
+# Events of these types can take minutes to write, so they are written on their own thread and
+# never hold up the small writes, such as heartbeats
+BULK_TYPES = {"results"}
+
+
+def get_default_socket_path():
+    """
+    :return: The default agent socket path. Can be overridden with the `INNDIE_AGENT_SOCKET`
+    environment variable.
+    """
+    return os.environ.get("INNDIE_AGENT_SOCKET", os.path.join(get_cache_dir(), "agent.sock"))
+
+
+def get_coalesce_key(event):
+    """
+    :param event: The event.
+    :return: The key that identifies redundant events.
+    """
+    event_type = event["type"]
+    return (event_type,) + tuple(event.get(it) for it in COALESCE_KEYS[event_type])
+
+
+class Agent:
+    """
+    Collects events and periodically flushes them. Redundant events (for example, several
+    progress updates for the same job) are coalesced so that only the latest one is written.
+    """
+
+    def __init__(self, handlers, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        :param handlers: A dict of event type to a function that writes an event of that type.
+        :param flush_interval: The most seconds an event waits before it is written.
+        """
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.flush_requested = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="inndie-agent-flush", daemon=True)
+        self.bulk_executor = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix="inndie-agent-bulk")
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, event):
+        """
+        Queues an event. `flush` and `shutdown` events control the agent itself.
+
+        :param event: The event.
+        :return: A response to send back to the sender.
+        """
+        event_type = event.get("type") if isinstance(event, dict) else None
+        if event_type == "flush":
+            self.request_flush()
+        elif event_type == "shutdown":
+            self.stop()
+        elif event_type in self.handlers and event_type in COALESCE_KEYS:
+            with self.condition:
+                self.pending[get_coalesce_key(event)] = event
+        else:
+            return {"ok": False, "error": "Unknown event: {}".format(event)}
+
+        return {"ok": True}
+
+    def request_flush(self):
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops the agent once everything pending has been written.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def wait(self):
+        self.thread.join()
+
+    def write(self, event):
+        """
+        Writes one event. A failed event is reported and dropped so that it cannot block the
+        events after it.
+        """
+        try:
+            self.handlers[event["type"]](event)
+        except Exception as e:
+            print("Failed to write event {}: {}".format(event, e), file=sys.stderr)
+
+    def flush(self):
+        """
+        Writes every pending event. Bulk events are handed to their own thread, where they are
+        written one at a time in the order they were flushed.
+        """
+        with self.condition:
+            events = list(self.pending.values())
+            self.pending.clear()
+            self.flush_requested = False
+
+        for event in events:
+            if event["type"] in BULK_TYPES:
+                self.bulk_executor.submit(self.write, event)
+            else:
+                self.write(event)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.stopped and not self.flush_requested:
+                    self.condition.wait(self.flush_interval)
+                stopped = self.stopped
+
+            self.flush()
+            if stopped:
+                self.bulk_executor.shutdown(wait=True)
+                return
+
+
+def handle_lines(agent, lines, respond):
+    """
+    Submits JSON-lines events to the agent.
+
+    :param agent: The agent.
+    :param lines: An iterable of lines, each holding one JSON event.
+    :param respond: A function to send a response dict back with.
+    """
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+
+        try:
+            event = json.loads(line)
+        except ValueError as e:
+            respond({"ok": False, "error": "Invalid JSON: {}".format(e)})
+            continue
+
+        respond(agent.submit(event))
+
+
+def serve_stdin(agent, stdin=None):
+    """
+    Reads events from stdin until EOF, then stops the agent. Stdout is left to the handlers, so
+    only rejected events are reported, on stderr.
+    """
+    def respond(response):
+        if not response["ok"]:
+            print(response["error"], file=sys.stderr)
+
+    handle_lines(agent, stdin if stdin is not None else sys.stdin, respond)
+    agent.stop()
+
+
+def make_socket_server(agent, socket_path):
+    """
+    Makes a server that reads events from clients connected to a Unix socket.
+
+    :param agent: The agent.
+    :param socket_path: The path of the Unix socket to listen on. A stale socket is replaced.
+    :return: The server. Call `serve_forever` on it.
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def respond(response):
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+            handle_lines(agent, (it.decode("utf-8") for it in self.rfile), respond)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    return server
+
+
+def send_events(socket_path, events):
+    """
+    Sends events to a running agent.
+
+    :param socket_path: The path of the agent's Unix socket.
+    :param events: A list of events.
+    :return: The agent's response to each event.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as f:
+            responses = []
+            for event in events:
+                f.write((json.dumps(event) + "\n").encode("utf-8"))
+                f.flush()
+                responses.append(json.loads(f.readline().decode("utf-8")))
+            return responses
@@ -0,0 +1,331 @@
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from inndie import client
+from inndie import heartbeat
+from inndie import log_stream
+from inndie import metrics
+from inndie import model_store
+from inndie import output
+from inndie import transfer
+from inndie.errors import InndieError, NotFoundError
+
+NOT_FOUND_CODES = ["404", "NoSuchKey", "NoSuchBucket", "NotFound"]
+
+
+def translate_errors(function):
+    """
+    Runs a method with `report` silenced and raises AWS errors as `InndieError`s, or as
+    `NotFoundError`s for missing objects. The AWS error is kept as the cause.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        from botocore.exceptions import BotoCoreError, ClientError
+        try:
+            with output.silenced():
+                return function(*args, **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in NOT_FOUND_CODES:
+                raise NotFoundError(str(e)) from e
+            raise InndieError(str(e)) from e
+        except BotoCoreError as e:
+            raise InndieError(str(e)) from e
+
+    return wrapper
+
+
+class BackgroundTask:
+    """
+    A writer that runs on a background thread until it is stopped.
+    """
+
+    def __init__(self, future, stop_event):
+        self.future = future
+        self.stop_event = stop_event
+
+    def stop(self, timeout=None):
+        """
+        Stops the task and waits for it to finish.
+
+        :param timeout: The most seconds to wait, or `None` to wait until it finishes.
+        :return: The task's result.
+        """
+        self.stop_event.set()
+        return self.future.result(timeout)
+
+
+class InndieClient:
+    """
+    Runs INNDiE operations in-process. The client resolves the S3 bucket once and keeps its AWS
+    clients warm, so each call only pays for its own requests. Methods return their results
+    instead of printing them and raise `InndieError`s.
+
+    The `*_async` methods return a `Future` right away and do the work on a background thread.
+    If several updates of the same kind for the same job are waiting, only the latest is
+    written, so a training loop can report as often as it likes without blocking on S3.
+    """
+
+    def __init__(self, region=None, bucket_name=None, max_workers=4):
+        """
+        :param region: The region, or `None` to pull the region from the environment.
+        :param bucket_name: The S3 bucket name, or `None` to find (or create) the INNDiE bucket
+        when it is first needed.
+        :param max_workers: The most background updates that run at once.
+        """
+        self.region = region
+        self._bucket_name = bucket_name
+        self._bucket_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._running = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.s3 = client.make_client("s3", region)
+        self.control_s3 = client.make_control_client("s3", region)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Waits for the background updates to finish.
+        """
+        self._executor.shutdown(wait=True)
+
+    @property
+    @translate_errors
+    def bucket_name(self):
+        with self._bucket_lock:
+            if self._bucket_name is None:
+                self._bucket_name = client.ensure_s3_bucket(self.region)
+            return self._bucket_name
+
+    @translate_errors
+    def ensure_configuration(self):
+        """
+        Makes sure the AWS resources INNDiE uses exist.
+        """
+        client.impl_ensure_configuration(self.region)
+
+    @translate_errors
+    def upload_model(self, model_path, transfer_settings=None):
+        """
+        :param model_path: The model file. Its name is the name of the model.
+        :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None`
+        for boto3's defaults.
+        :return: The model's content hash.
+        """
+        content_hash, _ = model_store.upload_model(
+            self.s3, self.bucket_name, model_path, os.path.basename(model_path),
+            client.make_transfer_config(transfer_settings))
+        return content_hash
+
+    @translate_errors
+    def download_model(self, model_path, transfer_settings=None):
+        """
+        :param model_path: The file path to download to, ending with the name of the model.
+        :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None`
+        for boto3's defaults.
+        :return: The `TransferSummary`.
+        """
+        return client.impl_download_model(model_path, self.bucket_name, self.region,
+                                          transfer_settings)
+
+    @translate_errors
+    def download_training_script(self, script_path):
+        """
+        :param script_path: The file path to download to, ending with the name of the script.
+        :return: The `TransferSummary`.
+        """
+        return client.impl_download_training_script(script_path, self.bucket_name, self.region)
+
+    @translate_errors
+    def upload_dataset(self, dataset_path, transfer_settings=None, **options):
+        """
+        :param dataset_path: The dataset file or directory.
+        :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None`
+        for boto3's defaults.
+        :param options: The other options of `impl_upload_dataset`, such as `pack=True`.
+        :return: The `TransferSummary`.
+        """
+        return client.impl_upload_dataset(dataset_path, self.bucket_name, self.region,
+                                          transfer_settings, **options)
+
+    @translate_errors
+    def download_dataset(self, dataset_path, transfer_settings=None, **options):
+        """
+        :param dataset_path: The path to download to, ending with the name of the dataset.
+        :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None`
+        for boto3's defaults.
+        :param options: The other options of `impl_download_dataset`, such as `resume=True`.
+        :return: The `TransferSummary`.
+        """
+        return client.impl_download_dataset(dataset_path, self.bucket_name, self.region,
+                                            transfer_settings, **options)
+
+    @translate_errors
+    def update_progress(self, job_id, progress_text):
+        """
+        :return: The key of the progress file.
+        """
+        return client.impl_update_training_progress(job_id, progress_text, self.bucket_name,
+                                                    self.region)
+
+    @translate_errors
+    def put_metrics(self, job_id, records):
+        """
+        :param records: An iterable of metrics records (dicts).
+        :return: The number of records written.
+        """
+        return client.impl_put_training_metrics(job_id, records, self.bucket_name, self.region)
+
+    def metrics_writer(self, job_id, min_flush_interval=metrics.DEFAULT_MIN_FLUSH_INTERVAL,
+                       max_batch_records=metrics.DEFAULT_MAX_BATCH_RECORDS):
+        """
+        :return: A started `MetricsWriter` for the job. Call `close` on it when training ends.
+        """
+        writer = metrics.MetricsWriter(self.control_s3, self.bucket_name,
+                                       client.create_progress_prefix(job_id), min_flush_interval,
+                                       max_batch_records)
+        writer.start()
+        return writer
+
+    @translate_errors
+    def create_heartbeat(self, job_id, lease=None, step=None):
+        """
+        :return: The key of the heartbeat file.
+        """
+        return client.impl_create_heartbeat(job_id, self.bucket_name, self.region, lease, step)
+
+    @translate_errors
+    def remove_heartbeat(self, job_id):
+        """
+        :return: The key of the heartbeat file.
+        """
+        return client.impl_remove_heartbeat(job_id, self.bucket_name, self.region)
+
+    @translate_errors
+    def set_log_file(self, job_id, log_file):
+        """
+        :return: The key of the log file.
+        """
+        return client.impl_set_training_log_file(job_id, log_file, self.bucket_name, self.region)
+
+    @translate_errors
+    def upload_results(self, job_id, output_dir, max_workers=transfer.DEFAULT_MAX_WORKERS,
+                       sync=False, **options):
+        """
+        :param options: The other options of `impl_upload_training_results`, such as
+        `pack=True`.
+        :return: The `TransferSummary`. Raises a `TransferError` if any file failed to upload.
+        """
+        return client.impl_upload_training_results(job_id, output_dir, self.bucket_name,
+                                                   self.region, max_workers, sync, **options)
+
+    @translate_errors
+    def fetch_results(self, job_id, output_dir, relative_paths=None,
+                      max_workers=transfer.DEFAULT_MAX_WORKERS):
+        """
+        :return: The `TransferSummary`. Raises a `TransferError` if any file failed to download.
+        """
+        return client.impl_fetch_training_results(job_id, output_dir, self.bucket_name,
+                                                  self.region, relative_paths, max_workers)
+
+    def update_progress_async(self, job_id, progress_text):
+        """
+        :return: A `Future` of the key of the progress file.
+        """
+        return self._submit_latest(("progress", job_id), self.update_progress,
+                                   (job_id, progress_text))
+
+    def create_heartbeat_async(self, job_id, lease=None, step=None):
+        """
+        :return: A `Future` of the key of the heartbeat file.
+        """
+        return self._submit_latest(("heartbeat", job_id), self.create_heartbeat,
+                                   (job_id, lease, step))
+
+    def set_log_file_async(self, job_id, log_file):
+        """
+        :return: A `Future` of the key of the log file.
+        """
+        return self._submit_latest(("log", job_id), self.set_log_file, (job_id, log_file))
+
+    def start_heartbeats(self, job_id, interval=heartbeat.DEFAULT_INTERVAL, lease=None):
+        """
+        Renews a leased heartbeat in the background.
+
+        :return: The started `HeartbeatEmitter`. Call `stop` on it when training ends.
+        """
+        emitter = heartbeat.HeartbeatEmitter(self.control_s3, self.bucket_name,
+                                             client.create_heartbeat_key(job_id), interval,
+                                             lease)
+        emitter.start()
+        return emitter
+
+    def start_log_stream(self, job_id, log_file,
+                         flush_interval=log_stream.DEFAULT_FLUSH_INTERVAL,
+                         max_buffer_bytes=log_stream.DEFAULT_MAX_BUFFER_BYTES):
+        """
+        Streams a log file to S3 in the background as it is written.
+
+        :return: A `BackgroundTask`. Stopping it uploads the consolidated log file and returns
+        its key.
+        """
+        streamer = log_stream.TrainingLogStreamer(self.control_s3, self.bucket_name,
+                                                  client.create_progress_prefix(job_id),
+                                                  log_file, max_buffer_bytes)
+        stop_event = threading.Event()
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(translate_errors(streamer.run)(stop_event.is_set,
+                                                                 flush_interval))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="inndie-log-stream", daemon=True).start()
+        return BackgroundTask(future, stop_event)
+
+    def _submit_latest(self, key, function, args):
+        """
+        Queues a call, replacing any call with the same key that has not started yet. Calls with
+        the same key run one at a time, in order.
+
+        :return: The `Future` of the call, which is shared with any calls it replaced.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending[1] = args
+                return pending[0]
+
+            future = Future()
+            self._pending[key] = [future, args]
+            if key in self._running:
+                return future
+            self._running.add(key)
+
+        self._executor.submit(self._run_latest, key, function)
+        return future
+
+    def _run_latest(self, key, function):
+        while True:
+            with self._lock:
+                pending = self._pending.pop(key, None)
+                if pending is None:
+                    self._running.discard(key)
+                    return
+
+            future, args = pending
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
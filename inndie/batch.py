@@ -0,0 +1,170 @@
+import json
+
+from inndie import steps
+from inndie import transfer
+from inndie.errors import InndieError
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class BatchError(InndieError):
+    """
+    Raised when a batch file is invalid.
+    """
+    pass
+
+
+def load_operations(text, file_format="jsonl"):
+    """
+    Parses a batch file. Each operation is an object with an "op" naming the operation, an
+    optional unique "id", an optional "after" list of the ids it must run after, and the
+    operation's arguments. Argument names may use dashes or underscores.
+
+    :param text: The contents of the batch file.
+    :param file_format: "jsonl" for one JSON object per line, or "yaml" for a YAML list. Reading
+    YAML needs PyYAML.
+    :return: A list of operations, each a dict with "id", "op", "after" and "args".
+    """
+    if file_format == "yaml":
+        try:
+            import yaml
+        except ImportError:
+            raise BatchError("Reading YAML batch files needs PyYAML. Install it with: "
+                             "pip install pyyaml")
+        raw = yaml.safe_load(text) or []
+        if not isinstance(raw, list):
+            raise BatchError("A YAML batch file must contain a list of operations")
+    else:
+        raw = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if len(line.strip()) == 0:
+                continue
+            try:
+                raw.append(json.loads(line))
+            except ValueError as e:
+                raise BatchError("Line {} is not valid JSON: {}".format(number, e))
+
+    operations = []
+    ids = set()
+    for index, it in enumerate(raw, 1):
+        if not isinstance(it, dict) or "op" not in it:
+            raise BatchError("Operation {} must be an object with an \"op\"".format(index))
+
+        args = {key.replace("-", "_"): value for key, value in it.items()
+                if key not in ["id", "op", "after"]}
+        operation_id = str(it.get("id", index))
+        if operation_id in ids:
+            raise BatchError("Duplicate operation id: {}".format(operation_id))
+        ids.add(operation_id)
+
+        after = it.get("after", [])
+        if not isinstance(after, list):
+            after = [after]
+        operations.append({"id": operation_id, "op": it["op"],
+                           "after": [str(dependency) for dependency in after], "args": args})
+
+    for operation in operations:
+        for dependency in operation["after"]:
+            if dependency not in ids:
+                raise BatchError("Operation {} runs after unknown operation {}".format(
+                    operation["id"], dependency))
+
+    return operations
+
+
+def find_cycle(dependencies):
+    """
+    :param dependencies: A dict of operation id to the list of ids it runs after.
+    :return: A list of ids that wait on each other in a cycle, or `None`.
+    """
+    done = set()
+
+    def visit(operation_id, path):
+        if operation_id in path:
+            return path[path.index(operation_id):] + [operation_id]
+        if operation_id in done:
+            return None
+        for dependency in dependencies[operation_id]:
+            cycle = visit(dependency, path + [operation_id])
+            if cycle is not None:
+                return cycle
+        done.add(operation_id)
+        return None
+
+    for operation_id in dependencies:
+        cycle = visit(operation_id, [])
+        if cycle is not None:
+            return cycle
+    return None
+
+
+def make_result(value):
+    """
+    :param value: What an operation returned.
+    :return: A JSON-serializable form of the value.
+    """
+    if isinstance(value, transfer.TransferSummary):
+        return {
+            "files": value.files,
+            "bytes": value.bytes,
+            "seconds": round(value.seconds, 3),
+            "failures": [{"path": path, "key": key, "error": str(error)}
+                         for path, key, error in value.failures]
+        }
+    return value
+
+
+def run_operations(operations, handlers, sequential=False,
+                   max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Runs a batch of operations. Independent operations run concurrently, and an operation that
+    runs after a failed one is skipped.
+
+    :param operations: The operations from `load_operations`.
+    :param handlers: A dict of operation name to a function that takes the operation's arguments
+    as keyword arguments.
+    :param sequential: Whether to run each operation after the one before it instead.
+    :param max_concurrency: The most operations that run at once.
+    :return: A list with one result dict per operation, in the batch's order. Each has the "id",
+    "op" and "ok", and either the "result" and "seconds" or the "error".
+    """
+    def make_step(operation):
+        handler = handlers.get(operation["op"])
+
+        def step():
+            if handler is None:
+                raise BatchError("Unknown operation: {}".format(operation["op"]))
+            return handler(**operation["args"])
+
+        return step
+
+    batch_steps = []
+    for index, operation in enumerate(operations):
+        after = list(operation["after"])
+        if sequential and index > 0:
+            after.append(operations[index - 1]["id"])
+        batch_steps.append((operation["id"], make_step(operation), after))
+
+    cycle = find_cycle({name: after for name, _, after in batch_steps})
+    if cycle is not None:
+        raise BatchError("Operations wait on each other: {}".format(" -> ".join(cycle)))
+
+    try:
+        results = steps.run_steps(batch_steps, max_concurrency)
+        errors = {}
+    except steps.StepError as e:
+        results = e.results
+        errors = dict(e.failures)
+
+    output = []
+    for operation in operations:
+        line = {"id": operation["id"], "op": operation["op"]}
+        if operation["id"] in results:
+            value, seconds = results[operation["id"]]
+            line.update(ok=True, seconds=round(seconds, 3), result=make_result(value))
+        else:
+            error = errors[operation["id"]]
+            line.update(ok=False, skipped=isinstance(error, steps.SkippedError),
+                        error=str(error))
+        output.append(line)
+    return output
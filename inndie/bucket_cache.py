@@ -0,0 +1,123 @@
+import hashlib
+import os
+import time
+
+from inndie import session
+from inndie.local_state import get_cache_dir, read_json, write_json
+
+# How long a cached bucket name is trusted without asking S3, in seconds
+DEFAULT_TTL = 3600
+
+settings = {
+    "enabled": True,
+    "ttl": DEFAULT_TTL
+}
+
+
+def configure(enabled=None, ttl=None):
+    """
+    Changes the bucket cache settings for this process.
+
+    :param enabled: Whether to use the cache, or `None` to leave the setting unchanged.
+    :param ttl: The TTL in seconds, or `None` to leave the setting unchanged.
+    """
+    if enabled is not None:
+        settings["enabled"] = enabled
+    if ttl is not None:
+        settings["ttl"] = ttl
+
+
+def get_cache_file():
+    return os.path.join(get_cache_dir(), "bucket-cache.json")
+
+
+def get_owner():
+    """
+    :return: A name for the account and endpoint that buckets are looked up in: the profile, how
+    the credentials were found, and the endpoint URL. Keys from the environment are part of it
+    too, since they can belong to any account. Instance role credentials rotate, so their keys
+    are left out.
+    """
+    boto_session = session.get_session()
+    credentials = boto_session.get_credentials()
+    method = credentials.method if credentials is not None else None
+    access_key = credentials.access_key if method == "env" else None
+    owner = "{}/{}/{}/{}".format(boto_session.profile_name, method, access_key,
+                                 session.settings["endpoint_url"])
+    return hashlib.sha256(owner.encode("utf-8")).hexdigest()[:16]
+
+
+def region_key(region):
+    """
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: The key the region's entry is stored under. It includes `get_owner`, so changing
+    AWS_PROFILE or INNDIE_ENDPOINT_URL never finds the bucket of another account or endpoint.
+    """
+    if region is None:
+        region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
+    return "{}/{}".format(region if region is not None else "default", get_owner())
+
+
+def read_cache():
+    entries = read_json(get_cache_file(), {})
+    return entries if isinstance(entries, dict) else {}
+
+
+def write_cache(entries):
+    """
+    :param entries: The cache entries keyed by `region_key`.
+    """
+    write_json(get_cache_file(), entries)
+
+
+def get_entry(region):
+    """
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: The cached entry `{"bucket": ..., "validated": ...}`, or `None` if there is none.
+    """
+    entry = read_cache().get(region_key(region))
+    if not isinstance(entry, dict) or "bucket" not in entry or "validated" not in entry:
+        return None
+    return entry
+
+
+def is_fresh(entry):
+    """
+    :param entry: A cache entry.
+    :return: True if the entry was validated within the TTL.
+    """
+    return time.time() - entry["validated"] < settings["ttl"]
+
+
+def put_bucket(region, bucket_name):
+    """
+    Records the bucket name for the region and marks it as just validated.
+
+    :param region: The region, or `None` to pull the region from the environment.
+    :param bucket_name: The name of the bucket.
+    """
+    entries = read_cache()
+    entries[region_key(region)] = {"bucket": bucket_name, "validated": time.time()}
+    write_cache(entries)
+
+
+def invalidate(region, all_regions=False):
+    """
+    Removes cached bucket names.
+
+    :param region: The region, or `None` to pull the region from the environment.
+    :param all_regions: Whether to remove the entries for every region, account and endpoint
+    instead.
+    :return: The number of entries removed.
+    """
+    entries = read_cache()
+    if all_regions:
+        if os.path.exists(get_cache_file()):
+            os.remove(get_cache_file())
+        return len(entries)
+
+    if entries.pop(region_key(region), None) is None:
+        return 0
+
+    write_cache(entries)
+    return 1
@@ -1,10 +1,40 @@
+import contextlib
+import functools
 import json
-import tempfile
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-import boto3
 import os.path
 
+from inndie import agent
+from inndie import batch
+from inndie import bucket_cache
+from inndie import compression
+from inndie import datasets
+from inndie import download_cache
+from inndie import heartbeat
+from inndie import job_status
+from inndie import log_stream
+from inndie import manifest
+from inndie import security_group
+from inndie import metrics
+from inndie import model_store
+from inndie import output
+from inndie import packed_results
+from inndie import packing
+from inndie import resumable
+from inndie import scheduler
+from inndie import session
+from inndie import steps
+from inndie import tracing
+from inndie import transfer
+from inndie import waiters
+from inndie.errors import InndieError
+
 all_perm = {
     "FromPort": -1,
     "IpProtocol": "-1",
@@ -23,66 +53,106 @@ all_http_perm = {
 
 
 def make_client(name, region):
-    if region is None:
-        return boto3.client(name)
-    else:
-        return boto3.client(name, region_name=region)
+    return session.get_client(name, region)
 
 
-def make_resource(name):
-    return boto3.resource(name)
+def make_control_client(name, region):
+    """
+    :return: The client for control-plane writes (progress, heartbeats, logs and metrics). Wrap
+    each write in `scheduler.control()`.
+    """
+    return session.get_client(name, region, control=True)
 
 
-def revoke_all_perms(sg):
-    """
-    Revokes all permissions from the SecurityGroup.
+def make_resource(name, region=None):
+    return session.get_resource(name, region)
 
-    :param sg: The SecurityGroup.
+
+def paginate(client, operation_name, result_key, **kwargs):
+    """
+    Iterates over every item a listing operation returns, across all of its pages. Operations
+    that cannot be paginated are called once.
+
+    :param client: The client to use.
+    :param operation_name: The name of the client method, such as "describe_subnets".
+    :param result_key: The key of the list of items in each response.
+    :param kwargs: The arguments to the operation.
+    :return: A generator of items. Stopping early skips fetching the remaining pages.
     """
-    if len(sg.ip_permissions) > 0:
-        sg.revoke_ingress(IpPermissions=sg.ip_permissions)
+    if client.can_paginate(operation_name):
+        pages = client.get_paginator(operation_name).paginate(**kwargs)
+    else:
+        pages = [getattr(client, operation_name)(**kwargs)]
 
-    if len(sg.ip_permissions_egress) > 0:
-        sg.revoke_egress(IpPermissions=sg.ip_permissions_egress)
+    for page in pages:
+        for item in page.get(result_key, []):
+            yield item
 
 
-def ensure_ec2_gress(sg_id, region):
+def operation_accepts(client, operation_name, parameter_name):
     """
-    Rewrites the ingress and egress permissions for the SecurityGroup. All existing ingress and
-    egress permissions are revoked. The permissions that INNDiE needs are authorized.
+    :param client: The client to use.
+    :param operation_name: The API name of the operation, such as "ListBuckets".
+    :param parameter_name: The API name of the parameter.
+    :return: True if the client's version of the operation accepts the parameter.
+    """
+    input_shape = client.meta.service_model.operation_model(operation_name).input_shape
+    return input_shape is not None and parameter_name in input_shape.members
+
+
+def ensure_ec2_gress(sg_id, region, dry_run=False):
+    """
+    Reconciles the ingress and egress permissions for the SecurityGroup with the permissions that
+    INNDiE needs. Only the rules that differ are revoked or authorized, so nothing is changed
+    when nothing has drifted.
 
     :param sg_id: The SecurityGroup's GroupId.
     :param region: The region, or `None` to pull the region from the environment.
-    :return: Nothing.
+    :param dry_run: Whether to only plan the changes instead of making them.
+    :return: The `GressPlan`.
     """
-    ec2 = boto3.resource('ec2', region_name=region)
-    sg = ec2.SecurityGroup(sg_id)
-
-    revoke_all_perms(sg)
-
-    sg.authorize_egress(IpPermissions=[all_perm])
-    sg.authorize_ingress(IpPermissions=[all_http_perm])
+    client = make_client("ec2", region)
+    sg = client.describe_security_groups(GroupIds=[sg_id])["SecurityGroups"][0]
+    plan = security_group.GressPlan(sg.get("IpPermissions", []),
+                                    sg.get("IpPermissionsEgress", []),
+                                    [all_http_perm], [all_perm])
+    if dry_run:
+        return plan
+
+    # Authorize before revoking so that the group is never left without the rules INNDiE needs
+    if len(plan.authorize_egress) > 0:
+        client.authorize_security_group_egress(
+            GroupId=sg_id, IpPermissions=security_group.collapse_rules(plan.authorize_egress))
+    if len(plan.authorize_ingress) > 0:
+        client.authorize_security_group_ingress(
+            GroupId=sg_id, IpPermissions=security_group.collapse_rules(plan.authorize_ingress))
+    if len(plan.revoke_egress) > 0:
+        client.revoke_security_group_egress(
+            GroupId=sg_id, IpPermissions=security_group.collapse_rules(plan.revoke_egress))
+    if len(plan.revoke_ingress) > 0:
+        client.revoke_security_group_ingress(
+            GroupId=sg_id, IpPermissions=security_group.collapse_rules(plan.revoke_ingress))
+
+    return plan
 
 
 def get_single_security_group(client, sg_name, desc):
     """
-    Ensures that exactly one matching SecurityGroup exists. If there is one match, its permissions
-    are remade. If there is more than one match, a RuntimeError is raised. If there are no matches,
-    a new SecurityGroup is made.
+    Ensures that exactly one matching SecurityGroup exists. If there is more than one match, a
+    RuntimeError is raised. If there are no matches, a new SecurityGroup is made.
 
     :param client: The EC2 client to use.
     :param sg_name: The name of the SecurityGroup.
     :param desc: The description of the SecurityGroup, if it needs to be created.
     :return: The GroupId of the matching SecurityGroup.
     """
-    security_groups = client.describe_security_groups(
-        Filters=[
-            {
-                "Name": "group-name",
-                "Values": [sg_name]
-            }
-        ]
-    )["SecurityGroups"]
+    security_groups = paginate(client, "describe_security_groups", "SecurityGroups",
+                               Filters=[
+                                   {
+                                       "Name": "group-name",
+                                       "Values": [sg_name]
+                                   }
+                               ])
 
     sgs = [it for it in security_groups if it["GroupName"] == sg_name]
     if len(sgs) > 1:
@@ -101,16 +171,21 @@ def get_single_security_group(client, sg_name, desc):
     return sg_id
 
 
-def ensure_ec2_security_group(region):
+def ensure_ec2_security_group(region, dry_run=False):
     """
-    Ensures that the EC2 SecurityGroup exists.
+    Ensures that the EC2 SecurityGroup exists and has the permissions INNDiE needs.
     :param region: The region, or `None` to pull the region from the environment.
+    :param dry_run: Whether to only print the permission changes instead of making them. The
+    SecurityGroup is still created if it does not exist.
     :return: The GroupId of the SecurityGroup.
     """
     sg_name = "inndie-autogenerated-ec2-sg"
     client = make_client("ec2", region)
     sg_id = get_single_security_group(client, sg_name, "INNDiE autogenerated for EC2.")
-    ensure_ec2_gress(sg_id, region)
+    plan = ensure_ec2_gress(sg_id, region, dry_run)
+    if dry_run or not plan.is_empty():
+        output.report("{} permissions for {}:\n{}\n".format(
+            "Planned" if dry_run else "Changed", sg_id, plan.format()))
     return sg_id
 
 
@@ -121,28 +196,41 @@ def select_subnet(region):
     :return: The SubnetId.
     """
     client = make_client("ec2", region)
-    return client.describe_subnets(Filters=[])["Subnets"][0]["SubnetId"]
+    subnets = paginate(client, "describe_subnets", "Subnets",
+                       Filters=[{"Name": "state", "Values": ["available"]}])
+    for subnet in subnets:
+        return subnet["SubnetId"]
+
+    raise RuntimeError("Found no available subnets.")
 
 
 def ensure_role(client, role_name):
     """
-    Ensures that a SINGLE matching IAM role exists. Throws a `RuntimeError` if there are multiple
-    matching roles.
+    Looks up an IAM role by name. Role names are unique, so there is at most one match.
 
     :param client: The iam client to use.
     :param role_name: The name of the IAM role.
     :return: The ARN of the matching IAM role, or `None` if there was no matching role.
     """
-    roles = client.list_roles(PathPrefix="/")["Roles"]
-    matching_roles = [it for it in roles if it["RoleName"] == role_name]
-    if len(matching_roles) == 1:
-        return matching_roles[0]["Arn"]
-    elif len(matching_roles) > 1:
-        raise RuntimeError("Found multiple matching roles: {}".format(role_name, roles))
-    else:
+    try:
+        return client.get_role(RoleName=role_name)["Role"]["Arn"]
+    except client.exceptions.NoSuchEntityException:
         return None
 
 
+def iam_role_exists(client, role_name):
+    """
+    :param client: The IAM client to use.
+    :param role_name: The name of the IAM role.
+    :return: True if the role exists.
+    """
+    try:
+        client.get_role(RoleName=role_name)
+        return True
+    except client.exceptions.NoSuchEntityException:
+        return False
+
+
 def ensure_ec2_role(region, role_name="inndie-autogenerated-ec2-role"):
     """
     Ensures the EC2 role exists. Creates the role if it does not exist.
@@ -174,6 +262,10 @@ def ensure_ec2_role(region, role_name="inndie-autogenerated-ec2-role"):
 
         role_arn = role["Arn"]
 
+        # IAM is eventually consistent, so wait for the new role to be visible before using it
+        waiters.wait_until(lambda: iam_role_exists(client, role_name),
+                           "IAM role {} to exist".format(role_name))
+
         client.attach_role_policy(RoleName=role_name,
                                   PolicyArn="arn:aws:iam::aws:policy/AmazonS3FullAccess")
 
@@ -191,36 +283,99 @@ def ensure_ec2_instance_profile(region, profile_name="inndie-autogenerated-ec2-i
     :return: The instance profile Arn.
     """
     client = make_client("iam", region)
-    iam_resource = make_resource('iam')
 
     # Get or create the instance profile
     try:
-        local_profile = client.get_instance_profile(InstanceProfileName=profile_name)
-    except:
-        local_profile = client.create_instance_profile(InstanceProfileName=profile_name)
-
-    instance_profile = iam_resource.InstanceProfile(
-        local_profile['InstanceProfile']['InstanceProfileName'])
+        instance_profile = client.get_instance_profile(
+            InstanceProfileName=profile_name)["InstanceProfile"]
+    except client.exceptions.NoSuchEntityException:
+        instance_profile = client.create_instance_profile(
+            InstanceProfileName=profile_name)["InstanceProfile"]
 
-    if role_name not in [role.name for role in instance_profile.roles]:
+    if role_name not in [role["RoleName"] for role in instance_profile["Roles"]]:
         # Add the role if it does not exist
-        instance_profile.add_role(RoleName=role_name)
+        client.add_role_to_instance_profile(InstanceProfileName=profile_name, RoleName=role_name)
+
+    return instance_profile["Arn"]
+
+
+def get_cached_s3_bucket(client, region):
+    """
+    Looks up the bucket in the local bucket cache. An entry older than the cache TTL is
+    revalidated with a HEAD on the bucket instead of listing every bucket again.
+
+    :param client: The S3 client to use.
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: The name of the cached bucket, or `None` if there is no usable entry.
+    """
+    if not bucket_cache.settings["enabled"]:
+        return None
+
+    entry = bucket_cache.get_entry(region)
+    if entry is None:
+        return None
+
+    if bucket_cache.is_fresh(entry):
+        return entry["bucket"]
+
+    try:
+        client.head_bucket(Bucket=entry["bucket"])
+    except client.exceptions.ClientError:
+        bucket_cache.invalidate(region)
+        return None
 
-    return instance_profile.arn
+    bucket_cache.put_bucket(region, entry["bucket"])
+    return entry["bucket"]
 
 
 def ensure_s3_bucket(region):
     """
-    Ensures that a matching S3 bucket exists.
+    Ensures that a matching S3 bucket exists. The bucket name is cached locally per region; see
+    `get_cached_s3_bucket`.
 
     :param region: The region, or `None` to pull the region from the environment.
     :return: The name of the bucket.
     """
     client = make_client("s3", region)
+    cached_bucket = get_cached_s3_bucket(client, region)
+    if cached_bucket is not None:
+        return cached_bucket
+
+    bucket_name = find_or_create_s3_bucket(client, region)
+    if bucket_cache.settings["enabled"]:
+        bucket_cache.put_bucket(region, bucket_name)
+    return bucket_name
+
+
+def s3_bucket_exists(client, bucket_name):
+    """
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :return: True if the bucket exists and can be accessed.
+    """
+    try:
+        client.head_bucket(Bucket=bucket_name)
+        return True
+    except client.exceptions.ClientError:
+        return False
+
+
+def find_or_create_s3_bucket(client, region):
+    """
+    Finds the INNDiE bucket, creating it if it does not exist.
+
+    :param client: The S3 client to use.
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: The name of the bucket.
+    """
     prefix = "inndie-autogenerated-"  # Used to identify the bucket that INNDiE manages
 
     def get_inndie_bucket():
-        buckets = client.list_buckets()["Buckets"]
+        # Filter by prefix on the server if this version of the API supports it
+        if operation_accepts(client, "ListBuckets", "Prefix"):
+            buckets = paginate(client, "list_buckets", "Buckets", Prefix=prefix)
+        else:
+            buckets = paginate(client, "list_buckets", "Buckets")
 
         # Return the first matching bucket name, if there is one
         for bucket in buckets:
@@ -251,12 +406,10 @@ def ensure_s3_bucket(region):
             # Otherwise the region will be us-east-1
             client.create_bucket(ACL='private', Bucket=bucket_name)
 
-        # Busy loop until the bucket is created. Otherwise, we will set the public access block
-        # too early and its configuration will be lost
-        while True:
-            inndie_bucket = get_inndie_bucket()
-            if inndie_bucket is not None:
-                break
+        # Wait until the bucket is created. Otherwise, we will set the public access block too
+        # early and its configuration will be lost
+        waiters.wait_until(lambda: s3_bucket_exists(client, bucket_name),
+                           "S3 bucket {} to exist".format(bucket_name))
 
         client.put_public_access_block(Bucket=bucket_name, PublicAccessBlockConfiguration={
             'BlockPublicAcls': True,
@@ -270,42 +423,201 @@ def ensure_s3_bucket(region):
 
 def impl_ensure_configuration(region):
     """
-    Ensures all the configuration INNDiE needs is in place.
+    Ensures all the configuration INNDiE needs is in place. Steps that do not depend on each other
+    run concurrently, and the time each step took is printed.
 
     :param region: The region, or `None` to pull the region from the environment.
     """
-    ensure_s3_bucket(region)
-    ensure_ec2_security_group(region)
-    ensure_ec2_role(region)
-    ensure_ec2_instance_profile(region)
+    start = time.monotonic()
+    try:
+        results = steps.run_steps([
+            ("s3-bucket", lambda: ensure_s3_bucket(region), []),
+            ("ec2-security-group", lambda: ensure_ec2_security_group(region), []),
+            ("ec2-role", lambda: ensure_ec2_role(region), []),
+            ("ec2-instance-profile", lambda: ensure_ec2_instance_profile(region), ["ec2-role"])
+        ])
+    except steps.StepError as e:
+        print_step_timings(e.results)
+        raise
+
+    print_step_timings(results)
+    output.report("Ensured configuration in {:.2f}s\n".format(time.monotonic() - start))
+
+
+def print_step_timings(results):
+    """
+    :param results: The results from `run_steps`.
+    """
+    for name, (result, seconds) in results.items():
+        output.report("Ensured {} in {:.2f}s: {}".format(name, seconds, result))
 
 
-def impl_upload_model(model_path, bucket_name, region):
+def run_file_transfer(direction, bucket_name, key, path, region, transfer_settings=None,
+                      show_progress=False, resume=False):
     """
-    Uploads a model to S3.
+    Uploads or downloads one file with the given transfer settings.
 
-    :param model_path: The file path to the model to upload, ending with the name of the model.
+    :param direction: "upload" or "download".
     :param bucket_name: The S3 bucket name.
+    :param key: The key of the object.
+    :param path: The local file path.
     :param region: The region, or `None` to pull the region from the environment.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None` for
+    boto3's defaults.
+    :param show_progress: Whether to print progress while the file transfers.
+    :param resume: Whether to save the transfer's progress so that an interrupted transfer
+    continues where it stopped when it is run again.
+    :return: The `TransferSummary`.
     """
     client = make_client("s3", region)
-    key = "inndie-models/" + os.path.basename(model_path)
-    client.upload_file(model_path, bucket_name, key)
-    print("Uploaded to: {}\n".format(key))
+    if resume:
+        if transfer_settings is None:
+            transfer_settings = transfer.get_transfer_settings()
+        session.ensure_max_pool_connections(transfer_settings["max_concurrency"])
+
+        def transfer_function(transfer_path):
+            return run_resumable_transfer(client, direction, bucket_name, key, transfer_path,
+                                          transfer_settings, show_progress)
+    else:
+        config = make_transfer_config(transfer_settings)
+
+        def transfer_function(transfer_path):
+            return transfer.transfer_file(client, direction, bucket_name, key, transfer_path,
+                                          config, show_progress)
+
+    if direction == "upload" or not download_cache.settings["enabled"]:
+        return transfer_function(path)
+
+    start = time.monotonic()
+    hit, summary = download_cache.fetch(client, bucket_name, key, path, transfer_function)
+    if hit:
+        summary = transfer.TransferSummary()
+        summary.seconds = time.monotonic() - start
+        output.report("Served from the download cache ({} bytes saved)\n".format(
+            os.path.getsize(path)))
+    else:
+        summary.transferred = [(path, key)]
+    return summary
+
+
+def run_resumable_transfer(client, direction, bucket_name, key, path, transfer_settings,
+                           show_progress=False):
+    """
+    Uploads or downloads one file in parts of the transfer's chunk size, saving its progress.
+
+    :return: The `TransferSummary`.
+    """
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    callback = None
+    if show_progress:
+        callback = transfer.ProgressReporter(key)
+
+    if direction == "upload":
+        if transfer_settings["multipart_threshold"] > os.path.getsize(path):
+            return transfer.transfer_file(client, direction, bucket_name, key, path,
+                                          transfer.make_transfer_config(transfer_settings),
+                                          show_progress)
+        size = resumable.upload_file(client, bucket_name, path, key,
+                                     transfer_settings["multipart_chunksize"],
+                                     transfer_settings["max_concurrency"], callback,
+                                     transfer_settings["max_bandwidth"])
+    else:
+        size = resumable.download_file(client, bucket_name, key, path,
+                                       transfer_settings["multipart_chunksize"],
+                                       transfer_settings["max_concurrency"], callback,
+                                       transfer_settings["max_bandwidth"])
+
+    summary.seconds = time.monotonic() - start
+    summary.files = 1
+    summary.bytes = size
+    summary.transferred.append((path, key))
+    return summary
+
+
+def make_transfer_config(transfer_settings):
+    """
+    :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None` for
+    boto3's defaults.
+    :return: The TransferConfig, or `None` for boto3's defaults. The connection pool is grown to
+    fit the transfer's concurrency.
+    """
+    if transfer_settings is None:
+        return None
 
+    session.ensure_max_pool_connections(transfer_settings["max_concurrency"])
+    return transfer.make_transfer_config(transfer_settings)
 
-def impl_download_model(model_path, bucket_name, region):
+
+def impl_upload_model(model_path, bucket_name, region, transfer_settings=None,
+                      show_progress=False):
+    """
+    Uploads a model to S3. Models are stored by content hash, so the transfer is skipped if the
+    same content was uploaded before (under any name).
+
+    :param model_path: The file path to the model to upload, ending with the name of the model.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None` for
+    boto3's defaults.
+    :param show_progress: Whether to print progress while the file transfers.
+    :return: The `TransferSummary`.
+    """
+    name = os.path.basename(model_path)
+    config = make_transfer_config(transfer_settings)
+    callback = None
+    if show_progress:
+        callback = transfer.ProgressReporter(name, os.path.getsize(model_path))
+
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    content_hash, uploaded = model_store.upload_model(make_client("s3", region), bucket_name,
+                                                      model_path, name, config, callback)
+    summary.seconds = time.monotonic() - start
+    summary.files = 1 if uploaded > 0 else 0
+    summary.bytes = uploaded
+
+    if uploaded == 0:
+        output.report("Model content {} is already stored, skipped the upload\n".format(
+            content_hash))
+    output.report("Uploaded to: {}\n".format(model_store.get_blob_key(content_hash)))
+    output.report("Named in: {}\n".format(model_store.get_alias_key(name)))
+    output.report(summary.format())
+    return summary
+
+
+def upload_model_file(client, bucket_name, path, key):
+    """
+    Uploads a model file to the content-addressed model store. Has the same signature as
+    `transfer.upload_file`.
+
+    :return: The number of bytes uploaded, which is 0 if the content was already stored.
+    """
+    _, uploaded = model_store.upload_model(client, bucket_name, path,
+                                           key[len(model_store.MODEL_PREFIX):])
+    return uploaded
+
+
+def impl_download_model(model_path, bucket_name, region, transfer_settings=None,
+                        show_progress=False):
     """
     Downloads a model from S3.
 
     :param model_path: The file path to download to, ending with the name of the model.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None` for
+    boto3's defaults.
+    :param show_progress: Whether to print progress while the file transfers.
+    :return: The `TransferSummary`.
     """
-    client = make_client("s3", region)
-    key = "inndie-models/" + os.path.basename(model_path)
-    client.download_file(bucket_name, key, model_path)
-    print("Downloaded from: {}\n".format(key))
+    key = model_store.resolve_model_key(make_client("s3", region), bucket_name,
+                                        os.path.basename(model_path))
+    summary = run_file_transfer("download", bucket_name, key, model_path, region, transfer_settings,
+                                show_progress)
+    output.report("Downloaded from: {}\n".format(key))
+    output.report(summary.format())
+    return summary
 
 
 def impl_download_training_script(script_path, bucket_name, region):
@@ -315,40 +627,119 @@ def impl_download_training_script(script_path, bucket_name, region):
     :param script_path: The file path to download to, ending with the name of the script.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :return: The `TransferSummary`.
     """
-    client = make_client("s3", region)
     key = "inndie-training-scripts/" + os.path.basename(script_path)
-    client.download_file(bucket_name, key, script_path)
-    print("Downloaded from: {}\n".format(key))
+    summary = run_file_transfer("download", bucket_name, key, script_path, region)
+    output.report("Downloaded from: {}\n".format(key))
+    return summary
 
 
-def impl_upload_dataset(dataset_path, bucket_name, region):
+def impl_upload_dataset(dataset_path, bucket_name, region, transfer_settings=None,
+                        show_progress=False, max_workers=transfer.DEFAULT_MAX_WORKERS,
+                        pack=False, small_file_threshold=packing.DEFAULT_SMALL_FILE_THRESHOLD,
+                        shard_size=packing.DEFAULT_SHARD_SIZE, resume=False):
     """
-    Uploads a dataset to S3.
+    Uploads a dataset to S3. A dataset can be a single file or a directory. The files in a
+    directory are uploaded in parallel under `inndie-datasets/<name>/` along with a manifest.
 
     :param dataset_path: The file path to the dataset to upload, ending with the name of the
     dataset.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings` for a single
+    file, or `None` for boto3's defaults.
+    :param show_progress: Whether to print progress while a single file transfers.
+    :param max_workers: The most objects of a directory to upload at once.
+    :param pack: Whether to pack the small files of a directory into shards.
+    :param small_file_threshold: Files smaller than this are packed.
+    :param shard_size: The most file bytes put in one shard.
+    :param resume: Whether an interrupted upload continues where it stopped when it is run
+    again. This applies to each file that is large enough to be uploaded in parts.
+    :return: The `TransferSummary`.
     """
-    client = make_client("s3", region)
-    key = "inndie-datasets/" + os.path.basename(dataset_path)
-    client.upload_file(dataset_path, bucket_name, key)
-    print("Uploaded to: {}\n".format(key))
-
-
-def impl_download_dataset(dataset_path, bucket_name, region):
+    if os.path.isdir(dataset_path):
+        session.ensure_max_pool_connections(max_workers)
+        prefix = create_dataset_key(dataset_path)
+        upload_function = transfer.upload_file
+        if resume:
+            upload_function = make_resumable_function(resumable.upload_file, transfer_settings)
+        summary = datasets.upload_directory(make_client("s3", region), bucket_name, prefix,
+                                            dataset_path, max_workers, pack,
+                                            small_file_threshold, shard_size, upload_function)
+        output.report("Uploaded to: {}/\n".format(prefix))
+        output.report(summary.format())
+        return summary
+
+    key = create_dataset_key(dataset_path)
+    summary = run_file_transfer("upload", bucket_name, key, dataset_path, region,
+                                transfer_settings, show_progress, resume)
+    output.report("Uploaded to: {}\n".format(key))
+    output.report(summary.format())
+    return summary
+
+
+def impl_download_dataset(dataset_path, bucket_name, region, transfer_settings=None,
+                          show_progress=False, max_workers=transfer.DEFAULT_MAX_WORKERS,
+                          resume=False):
     """
-    Downloads a dataset from S3.
+    Downloads a dataset from S3. If the dataset was uploaded from a directory, it is downloaded
+    into a directory in parallel.
 
     :param dataset_path: The file path to download to, ending with the name of the dataset.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings` for a single
+    file, or `None` for boto3's defaults.
+    :param show_progress: Whether to print progress while a single file transfers.
+    :param max_workers: The most objects of a directory to download at once.
+    :param resume: Whether an interrupted download continues where it stopped when it is run
+    again. For a directory, this applies to each file that is not packed.
+    :return: The `TransferSummary`.
     """
+    key = create_dataset_key(dataset_path)
     client = make_client("s3", region)
-    key = "inndie-datasets/" + os.path.basename(dataset_path)
-    client.download_file(bucket_name, key, dataset_path)
-    print("Downloaded from: {}\n".format(key))
+    dataset_manifest = datasets.load_manifest(client, bucket_name, key)
+    if dataset_manifest is not None:
+        session.ensure_max_pool_connections(max_workers)
+        download_function = transfer.download_file
+        if resume:
+            download_function = make_resumable_function(resumable.download_file,
+                                                        transfer_settings)
+        summary = datasets.download_directory(client, bucket_name, dataset_manifest,
+                                              dataset_path, max_workers, download_function)
+        output.report("Downloaded from: {}/\n".format(key))
+        output.report(summary.format())
+        return summary
+
+    summary = run_file_transfer("download", bucket_name, key, dataset_path, region,
+                                transfer_settings, show_progress, resume)
+    output.report("Downloaded from: {}\n".format(key))
+    output.report(summary.format())
+    return summary
+
+
+def make_resumable_function(function, transfer_settings):
+    """
+    :param function: `resumable.upload_file` or `resumable.download_file`.
+    :param transfer_settings: The settings from `transfer.get_transfer_settings`, or `None` for
+    the default profile.
+    :return: The function with the transfer's part size, concurrency and bandwidth filled in, for
+    use as the transfer function of a directory dataset.
+    """
+    if transfer_settings is None:
+        transfer_settings = transfer.get_transfer_settings()
+    return functools.partial(function, part_size=transfer_settings["multipart_chunksize"],
+                             max_workers=transfer_settings["max_concurrency"],
+                             max_bandwidth=transfer_settings["max_bandwidth"])
+
+
+def create_dataset_key(dataset_path):
+    """
+    :param dataset_path: The path to a dataset file or directory.
+    :return: The key of a single-file dataset, or the prefix of a directory dataset.
+    """
+    return "inndie-datasets/" + os.path.basename(os.path.normpath(dataset_path))
 
 
 def impl_update_training_progress(job_id, progress_text, bucket_name, region):
@@ -359,31 +750,98 @@ def impl_update_training_progress(job_id, progress_text, bucket_name, region):
     :param progress_text: The text to write into the progress file.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :return: The key of the progress file.
+    """
+    client = make_control_client("s3", region)
+    remote_path = create_progress_prefix(job_id) + "/progress.txt"
+    with scheduler.control():
+        client.put_object(Body=progress_text.encode("utf-8"), Bucket=bucket_name,
+                          Key=remote_path)
+    job_status.update(client, bucket_name, create_progress_prefix(job_id),
+                      progress=job_status.make_progress_field(progress_text))
+    output.report("Updated progress in: {}\n".format(remote_path))
+    return remote_path
+
+
+def impl_put_training_metrics(job_id, records, bucket_name, region,
+                              min_flush_interval=metrics.DEFAULT_MIN_FLUSH_INTERVAL,
+                              max_batch_records=metrics.DEFAULT_MAX_BATCH_RECORDS):
+    """
+    Writes structured training metrics. Records are batched and written as compressed JSON-lines
+    chunks at a bounded rate, and progress.txt points at the latest record.
+
+    :param job_id: The unique Job ID.
+    :param records: An iterable of metrics records (dicts). It may block while waiting for new
+    records; batched records are still written once they are due.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param min_flush_interval: The fewest seconds between chunks.
+    :param max_batch_records: The most records held in memory before a chunk is written early.
+    :return: The number of records written.
     """
-    local_file, path = tempfile.mkstemp()
+    writer = metrics.MetricsWriter(make_control_client("s3", region), bucket_name,
+                                   create_progress_prefix(job_id), min_flush_interval,
+                                   max_batch_records)
+    writer.start()
+    count = 0
     try:
-        with open(local_file, "w") as f:
-            f.write(progress_text)
-        client = make_client("s3", region)
-        remote_path = create_progress_prefix(job_id) + "/progress.txt"
-        client.upload_file(path, bucket_name, remote_path)
-        print("Updated progress in: {}\n".format(remote_path))
+        for record in records:
+            writer.add(record)
+            count += 1
     finally:
-        os.remove(path)
+        writer.close()
+    output.report("Wrote {} metrics record(s) in {} chunk(s) to: {}/metrics\n".format(
+        count, writer.chunks, writer.prefix))
+    return count
 
 
-def impl_create_heartbeat(job_id, bucket_name, region):
+def impl_create_heartbeat(job_id, bucket_name, region, lease=None, step=None):
     """
     Creates a heartbeat that INNDiE uses to check if the training script is running properly.
 
     :param job_id: The unique Job ID.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :param lease: The number of seconds the heartbeat is valid for, or `None` to write a heartbeat
+    that never expires.
+    :param step: The training step counter to include with a leased heartbeat, or `None`.
+    :return: The key of the heartbeat file.
     """
-    client = make_client("s3", region)
-    remote_path = create_progress_prefix(job_id) + "/heartbeat.txt"
-    client.put_object(Body="1", Bucket=bucket_name, Key=remote_path)
-    print("Created heartbeat file in: {}\n".format(remote_path))
+    client = make_control_client("s3", region)
+    remote_path = create_heartbeat_key(job_id)
+    if lease is None:
+        body = "1"
+    else:
+        body = heartbeat.make_record(True, lease, step=step)
+    with scheduler.control():
+        client.put_object(Body=body, Bucket=bucket_name, Key=remote_path)
+    job_status.update(client, bucket_name, create_progress_prefix(job_id),
+                      heartbeat=heartbeat.make_status_field(body))
+    output.report("Created heartbeat file in: {}\n".format(remote_path))
+    return remote_path
+
+
+def impl_emit_heartbeats(job_id, bucket_name, region, should_stop,
+                         interval=heartbeat.DEFAULT_INTERVAL, lease=None):
+    """
+    Renews a leased heartbeat every `interval` seconds until `should_stop` returns True, then
+    marks the job as no longer alive.
+
+    :param job_id: The unique Job ID.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param should_stop: A function that returns True when the heartbeat should stop.
+    :param interval: The number of seconds between writes.
+    :param lease: The number of seconds each heartbeat is valid for, or `None` for the default.
+    """
+    emitter = heartbeat.HeartbeatEmitter(make_control_client("s3", region), bucket_name,
+                                         create_heartbeat_key(job_id), interval, lease)
+    emitter.start()
+    output.report("Emitting heartbeats to: {}\n".format(emitter.key), flush=True)
+    while not should_stop():
+        time.sleep(0.2)
+    emitter.stop()
+    output.report("Stopped heartbeats after {} write(s)\n".format(emitter.sequence))
 
 
 def impl_remove_heartbeat(job_id, bucket_name, region):
@@ -393,11 +851,16 @@ def impl_remove_heartbeat(job_id, bucket_name, region):
     :param job_id: The unique Job ID.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :return: The key of the heartbeat file.
     """
-    client = make_client("s3", region)
-    remote_path = create_progress_prefix(job_id) + "/heartbeat.txt"
-    client.put_object(Body="0", Bucket=bucket_name, Key=remote_path)
-    print("Removed heartbeat file in: {}\n".format(remote_path))
+    client = make_control_client("s3", region)
+    remote_path = create_heartbeat_key(job_id)
+    with scheduler.control():
+        client.put_object(Body="0", Bucket=bucket_name, Key=remote_path)
+    job_status.update(client, bucket_name, create_progress_prefix(job_id), finished=True,
+                      heartbeat=heartbeat.make_status_field("0"))
+    output.report("Removed heartbeat file in: {}\n".format(remote_path))
+    return remote_path
 
 
 def impl_set_training_log_file(job_id, log_file, bucket_name, region):
@@ -408,37 +871,614 @@ def impl_set_training_log_file(job_id, log_file, bucket_name, region):
     :param log_file: The log file to read from.
     :param bucket_name: The S3 bucket name.
     :param region: The region, or `None` to pull the region from the environment.
+    :return: The key of the log file.
     """
     client = make_client("s3", region)
     remote_path = create_progress_prefix(job_id) + "/log.txt"
-    with open(log_file, "r") as f:
-        client.put_object(Body=f.read(), Bucket=bucket_name, Key=remote_path)
-        print("Set training log file in: {}\n".format(remote_path))
+    # Stream the file from disk instead of reading it into memory
+    size = transfer.upload_file(client, bucket_name, log_file, remote_path)
+    job_status.update(client, bucket_name, create_progress_prefix(job_id),
+                      log={"key": remote_path, "size": size, "timestamp": round(time.time(), 3)})
+    output.report("Set training log file in: {}\n".format(remote_path))
+    return remote_path
+
+
+def impl_stream_training_log(job_id, log_file, bucket_name, region, should_stop,
+                             flush_interval=log_stream.DEFAULT_FLUSH_INTERVAL,
+                             max_buffer_bytes=log_stream.DEFAULT_MAX_BUFFER_BYTES):
+    """
+    Streams the training log to S3 as it is written, uploading only the new bytes on each flush.
+    When streaming ends, the consolidated log file is uploaded.
+
+    :param job_id: The unique Job ID.
+    :param log_file: The log file to tail.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param should_stop: A function that returns True when streaming should end.
+    :param flush_interval: The number of seconds between flushes.
+    :param max_buffer_bytes: The most bytes of the log held in memory at once.
+    :return: The key of the consolidated log file.
+    """
+    client = make_control_client("s3", region)
+    streamer = log_stream.TrainingLogStreamer(client, bucket_name, create_progress_prefix(job_id),
+                                              log_file, max_buffer_bytes)
+    remote_path = streamer.run(should_stop, flush_interval)
+    output.report("Streamed {} bytes in {} segment(s). Set training log file in: {}\n".format(
+        streamer.offset, streamer.next_segment, remote_path))
+    return remote_path
+
+
+def impl_watch_jobs(job_ids, bucket_name, region, should_stop,
+                    interval=job_status.DEFAULT_WATCH_INTERVAL,
+                    max_workers=job_status.DEFAULT_WATCH_WORKERS):
+    """
+    Polls the status objects of jobs every `interval` seconds until `should_stop` returns True,
+    printing one JSON line for each job whose status changed. Every job is printed on the first
+    poll. Unchanged jobs cost one conditional GET each and no body.
+
+    :param job_ids: The IDs of the jobs to watch, or an empty list to watch every job, including
+    jobs that start while watching.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param should_stop: A function that returns True when watching should end. It is checked
+    after each poll.
+    :param interval: The number of seconds between polls.
+    :param max_workers: The most jobs to poll at once.
+    """
+    session.ensure_max_pool_connections(max_workers)
+    client = make_client("s3", region)
+    watcher = job_status.JobWatcher(client, bucket_name, create_progress_prefix, max_workers)
+    while True:
+        polled = list(job_ids)
+        if len(polled) == 0:
+            polled = job_status.list_jobs(client, bucket_name, create_progress_prefix(""))
+
+        for job_id, status in watcher.poll(polled):
+            stale = None
+            if status is not None and "lease" in status.get("heartbeat", {}):
+                stale = heartbeat.is_stale(status["heartbeat"])
+            output.report(json.dumps({"job_id": job_id, "stale": stale, "status": status}),
+                          flush=True)
+
+        deadline = time.monotonic() + interval
+        while not should_stop() and time.monotonic() < deadline:
+            time.sleep(min(0.2, interval))
+        if should_stop():
+            return
 
 
-def impl_upload_training_results(job_id, output_dir, bucket_name, region):
+def is_process_alive(pid):
+    """
+    :param pid: The process ID.
+    :return: True if the process is still running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def impl_upload_training_results(job_id, output_dir, bucket_name, region,
+                                 max_workers=transfer.DEFAULT_MAX_WORKERS, sync=False, pack=False,
+                                 small_file_threshold=packing.DEFAULT_SMALL_FILE_THRESHOLD,
+                                 shard_size=packing.DEFAULT_SHARD_SIZE):
+    """
+    Uploads the results from running a training script. The output directory is walked
+    recursively and the files are uploaded in parallel.
+
+    :param job_id: The unique Job ID.
+    :param output_dir: The directory containing the results.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param max_workers: The maximum number of files to upload at once.
+    :param sync: Whether to only upload the files that changed since the last sync. The state of
+    the last sync is kept in a manifest, locally and under the job's results prefix.
+    :param pack: Whether to pack small files into tar shards under the job's results prefix,
+    with an index of where each file is. Model files are never packed.
+    :param small_file_threshold: Files smaller than this are packed.
+    :param shard_size: The most file bytes put in one shard.
+    :return: The `TransferSummary`. Raises a `TransferError` if any file failed to upload, or an
+    `InndieError` before uploading anything if the output directory does not exist or two model
+    files have the same name.
+    """
+    if not os.path.isdir(output_dir):
+        raise InndieError("Not a directory: {}".format(output_dir))
+
+    files = [(path, relative_path, create_training_result_key(job_id, relative_path))
+             for path, relative_path in transfer.walk_files(output_dir)]
+    # Model files are keyed by their name alone, so two of them would overwrite each other
+    model_paths = {}
+    for _, relative_path, key in files:
+        if key.startswith(model_store.MODEL_PREFIX):
+            model_paths.setdefault(key, []).append(relative_path)
+    clashes = ["{} ({})".format(key, ", ".join(paths)) for key, paths in sorted(model_paths.items())
+               if len(paths) > 1]
+    if len(clashes) > 0:
+        raise InndieError("Model files have the same name: {}".format("; ".join(clashes)))
+
+    session.ensure_max_pool_connections(max_workers)
     client = make_client("s3", region)
-    files_to_upload = [os.path.join(output_dir, it) for it in os.listdir(output_dir)]
-    files_to_upload = [it for it in files_to_upload if os.path.isfile(it)]
-    for elem in files_to_upload:
-        ext = os.path.splitext(elem)[1].lower()
-        # Upload model files to the model prefix instead of the test result prefix so that users
-        # can select them as models to start new Jobs with.
-        if ext == ".h5" or ext == ".hdf5":
-            impl_upload_model(os.path.abspath(elem), bucket_name, region)
+    remote_prefix = create_results_prefix(job_id)
+
+    if sync:
+        old_manifest = manifest.load_manifest(client, bucket_name, remote_prefix)
+        files, entries = manifest.plan_sync(files, old_manifest, max_workers)
+        output.report("{} file(s) changed since the last sync\n".format(len(files)))
+
+    shards = []
+    if pack:
+        _, shards = packing.plan_shards(
+            [(path, relative_path) for path, relative_path, key in files
+             if not key.startswith(model_store.MODEL_PREFIX)],
+            small_file_threshold, shard_size)
+    packed_paths = set(path for members in shards for path, _ in members)
+
+    def upload_result_file(client, bucket_name, path, key):
+        if key.startswith(model_store.MODEL_PREFIX):
+            return upload_model_file(client, bucket_name, path, key)
+        return transfer.upload_file(client, bucket_name, path, key)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The shards upload alongside the files that are not packed
+        shards_future = executor.submit(output.bind(packed_results.upload_shards), client,
+                                        bucket_name, remote_prefix, shards, max_workers)
+        summary = transfer.upload_files(client, bucket_name,
+                                        [(path, key) for path, _, key in files
+                                         if path not in packed_paths],
+                                        max_workers, upload_result_file)
+        packed_entries, packed_summary = shards_future.result()
+
+    summary.files += packed_summary.files
+    summary.bytes += packed_summary.bytes
+    summary.transferred += packed_summary.transferred
+    summary.failures += packed_summary.failures
+    summary.seconds = time.monotonic() - start
+    output.report(summary.format())
+
+    if pack:
+        old_index = packed_results.load_index(client, bucket_name, remote_prefix)
+        index = packed_results.empty_index()
+        index["files"] = dict(old_index["files"], **packed_entries)
+        # A file that is uploaded on its own now must not be read from an older shard
+        uploaded_paths = set(path for path, _ in summary.transferred)
+        for path, relative_path, _ in files:
+            if path in uploaded_paths and path not in packed_paths:
+                index["files"].pop(relative_path, None)
+        if index != old_index:
+            packed_results.save_index(client, bucket_name, remote_prefix, index, old_index)
+
+    if sync:
+        # Files that failed to upload keep their old entry so they are retried on the next sync
+        failed_paths = set(path for path, _, _ in summary.failures)
+        for path, relative_path, _ in files:
+            if path in failed_paths:
+                if relative_path in old_manifest["files"]:
+                    entries[relative_path] = old_manifest["files"][relative_path]
+                else:
+                    del entries[relative_path]
+
+        if entries != old_manifest["files"]:
+            new_manifest = manifest.empty_manifest()
+            new_manifest["files"] = entries
+            manifest.save_manifest(client, bucket_name, remote_prefix, new_manifest)
+
+    results = {
+        "prefix": remote_prefix,
+        "manifest": None,
+        "index": packed_results.get_index_key(remote_prefix) if pack else None,
+        "files": summary.files,
+        "bytes": summary.bytes,
+        "failures": len(summary.failures),
+        "timestamp": round(time.time(), 3)
+    }
+    if sync:
+        results["manifest"] = remote_prefix + "/" + manifest.MANIFEST_NAME
+    job_status.update(make_control_client("s3", region), bucket_name,
+                      create_progress_prefix(job_id), results=results)
+
+    summary.raise_for_failures()
+    return summary
+
+
+def impl_fetch_training_results(job_id, output_dir, bucket_name, region, relative_paths=None,
+                                max_workers=transfer.DEFAULT_MAX_WORKERS):
+    """
+    Downloads the results of a training job. Packed files are read with ranged GETs of their
+    shards, so fetching a few of them does not download whole shards.
+
+    :param job_id: The unique Job ID.
+    :param output_dir: The directory to download the results into.
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param relative_paths: The paths of the result files to download, relative to the output
+    directory they were uploaded from, or `None` to download every result file.
+    :param max_workers: The most objects or ranges to download at once.
+    :return: The `TransferSummary`. Raises a `TransferError` if any file failed to download.
+    """
+    session.ensure_max_pool_connections(max_workers)
+    client = make_client("s3", region)
+    remote_prefix = create_results_prefix(job_id)
+    index = packed_results.load_index(client, bucket_name, remote_prefix)
+
+    if relative_paths is None:
+        packed = dict(index["files"])
+        keys = {}
+        for page in client.get_paginator("list_objects_v2").paginate(
+                Bucket=bucket_name, Prefix=remote_prefix + "/"):
+            for it in page.get("Contents", []):
+                relative_path = it["Key"][len(remote_prefix) + 1:]
+                if not packed_results.is_internal_key(remote_prefix, it["Key"]) and \
+                        relative_path != manifest.MANIFEST_NAME and relative_path not in packed:
+                    keys[relative_path] = it["Key"]
+    else:
+        packed = {it: index["files"][it] for it in relative_paths if it in index["files"]}
+        keys = {}
+        for relative_path in relative_paths:
+            if relative_path in packed:
+                continue
+            key = create_training_result_key(job_id, relative_path)
+            if key.startswith(model_store.MODEL_PREFIX):
+                key = model_store.resolve_model_key(client, bucket_name,
+                                                    key[len(model_store.MODEL_PREFIX):])
+            keys[relative_path] = key
+
+    downloads = [(packing.get_safe_path(output_dir, relative_path), key)
+                 for relative_path, key in sorted(keys.items())]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The packed files download alongside the files that are not packed
+        packed_future = executor.submit(output.bind(packed_results.fetch_files), client,
+                                        bucket_name, packed, output_dir, max_workers)
+        summary = transfer.download_files(client, bucket_name, downloads, max_workers)
+        packed_summary = packed_future.result()
+
+    summary.files += packed_summary.files
+    summary.bytes += packed_summary.bytes
+    summary.transferred += packed_summary.transferred
+    summary.failures += packed_summary.failures
+    summary.seconds = time.monotonic() - start
+    output.report("Downloaded {} packed file(s)\n".format(packed_summary.files))
+    output.report(summary.format())
+    summary.raise_for_failures()
+    return summary
+
+
+def create_training_result_key(job_id, relative_path):
+    """
+    :param job_id: The unique Job ID.
+    :param relative_path: The path of the result file relative to the output directory.
+    :return: The key to upload the result file to.
+    """
+    ext = os.path.splitext(relative_path)[1].lower()
+    # Upload model files to the model prefix instead of the test result prefix so that users
+    # can select them as models to start new Jobs with.
+    if ext == ".h5" or ext == ".hdf5":
+        return model_store.get_model_key(os.path.basename(relative_path))
+    else:
+        return create_results_prefix(job_id) + "/" + relative_path
+
+
+def make_agent_handlers(bucket_name, region):
+    """
+    Makes the functions the agent uses to write each type of event.
+
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: A dict of event type to handler.
+    """
+    def handle_progress(event):
+        impl_update_training_progress(event["job_id"], event["text"], bucket_name, region)
+
+    def handle_heartbeat(event):
+        if event.get("alive", True):
+            impl_create_heartbeat(event["job_id"], bucket_name, region, event.get("lease"),
+                                  event.get("step"))
         else:
-            key = "inndie-training-results/{}/{}".format(job_id, os.path.basename(elem))
-            client.upload_file(elem, bucket_name, key)
-            print("Uploaded to: {}\n".format(key))
+            impl_remove_heartbeat(event["job_id"], bucket_name, region)
+
+    def handle_log(event):
+        impl_set_training_log_file(event["job_id"], event["log_file"], bucket_name, region)
+
+    def handle_results(event):
+        impl_upload_training_results(event["job_id"], event["output_dir"], bucket_name, region,
+                                     sync=event.get("sync", True), pack=event.get("pack", False))
+
+    return {
+        "progress": handle_progress,
+        "heartbeat": handle_heartbeat,
+        "log": handle_log,
+        "results": handle_results
+    }
+
+
+def make_batch_handlers(region):
+    """
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: A dict of batch operation name to a function that takes the operation's arguments.
+    The S3 bucket is looked up once, when the first operation that needs it runs.
+    """
+    bucket_names = []
+    lock = threading.Lock()
+
+    def get_bucket_name():
+        with lock:
+            if len(bucket_names) == 0:
+                bucket_names.append(ensure_s3_bucket(region))
+            return bucket_names[0]
+
+    def with_bucket(function):
+        def handler(**kwargs):
+            return function(bucket_name=get_bucket_name(), region=region, **kwargs)
+        return handler
+
+    def with_transfer_settings(function):
+        def handler(transfer_profile="default", **kwargs):
+            overrides = {}
+            for name in ["multipart_threshold", "multipart_chunksize", "max_bandwidth"]:
+                if isinstance(kwargs.get(name), str):
+                    overrides[name] = transfer.parse_byte_size(kwargs.pop(name))
+                elif name in kwargs:
+                    overrides[name] = kwargs.pop(name)
+            if "max_concurrency" in kwargs:
+                overrides["max_concurrency"] = kwargs.pop("max_concurrency")
+            transfer_settings = transfer.get_transfer_settings(transfer_profile, **overrides)
+            return with_bucket(function)(transfer_settings=transfer_settings, **kwargs)
+        return handler
+
+    return {
+        "ensure-configuration": lambda: impl_ensure_configuration(region),
+        "upload-model": with_transfer_settings(impl_upload_model),
+        "download-model": with_transfer_settings(impl_download_model),
+        "download-training-script": with_bucket(impl_download_training_script),
+        "upload-dataset": with_transfer_settings(impl_upload_dataset),
+        "download-dataset": with_transfer_settings(impl_download_dataset),
+        "update-training-progress": with_bucket(impl_update_training_progress),
+        "put-training-metrics": with_bucket(impl_put_training_metrics),
+        "create-heartbeat": with_bucket(impl_create_heartbeat),
+        "remove-heartbeat": with_bucket(impl_remove_heartbeat),
+        "set-training-log-file": with_bucket(impl_set_training_log_file),
+        "upload-training-results": with_bucket(impl_upload_training_results),
+        "fetch-training-results": with_bucket(impl_fetch_training_results)
+    }
+
+
+def impl_agent(bucket_name, region, socket_path, use_stdin,
+               flush_interval=agent.DEFAULT_FLUSH_INTERVAL):
+    """
+    Runs the agent until it is shut down. The agent keeps its clients warm and writes events to
+    S3 in the background.
+
+    :param bucket_name: The S3 bucket name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param socket_path: The Unix socket to read events from, if not reading from stdin.
+    :param use_stdin: Whether to read events from stdin instead of a socket.
+    :param flush_interval: The most seconds an event waits before it is written.
+    """
+    the_agent = agent.Agent(make_agent_handlers(bucket_name, region), flush_interval)
+    the_agent.start()
+
+    server = None
+    if not use_stdin:
+        server = agent.make_socket_server(the_agent, socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        output.report("Agent listening on: {}\n".format(socket_path), flush=True)
+
+    try:
+        if use_stdin:
+            agent.serve_stdin(the_agent)
+        the_agent.wait()
+    except KeyboardInterrupt:
+        # Write everything that is still pending before exiting
+        the_agent.stop()
+        the_agent.wait()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            os.remove(socket_path)
+
+
+def make_stop_condition(until_pid):
+    """
+    Makes a stop condition for long-running commands. SIGINT and SIGTERM are handled so that the
+    command can finish cleanly instead of exiting immediately.
+
+    :param until_pid: A process ID to stop after, or `None` to run until interrupted.
+    :return: A function that returns True when the command should stop.
+    """
+    stop_requested = []
+
+    def request_stop(signum, frame):
+        stop_requested.append(signum)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    def should_stop():
+        if len(stop_requested) > 0:
+            return True
+        return until_pid is not None and not is_process_alive(until_pid)
+
+    return should_stop
 
 
 def create_progress_prefix(job_id):
     return "inndie-training-progress/{}".format(job_id)
 
 
+def create_heartbeat_key(job_id):
+    return create_progress_prefix(job_id) + "/heartbeat.txt"
+
+
+def create_results_prefix(job_id):
+    return "inndie-training-results/{}".format(job_id)
+
+
+class ByteSize(click.ParamType):
+    """
+    A number of bytes, such as "8MB", "64MiB" or "1048576".
+    """
+    name = "size"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return transfer.parse_byte_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
 @click.group()
-def cli():
-    return
+@click.option("--bucket-cache/--no-bucket-cache", "use_bucket_cache", default=True,
+              envvar="INNDIE_BUCKET_CACHE",
+              help="Whether to cache the resolved S3 bucket name locally.")
+@click.option("--bucket-cache-ttl", type=int, default=bucket_cache.DEFAULT_TTL,
+              envvar="INNDIE_BUCKET_CACHE_TTL", show_default=True,
+              help="Seconds a cached bucket name is used before it is revalidated.")
+@click.option("--max-pool-connections", type=click.IntRange(min=1),
+              default=session.DEFAULT_MAX_POOL_CONNECTIONS,
+              envvar="INNDIE_MAX_POOL_CONNECTIONS", show_default=True,
+              help="The size of the connection pool shared by each AWS client.")
+@click.option("--count-api-calls", is_flag=True, envvar="INNDIE_COUNT_API_CALLS",
+              help="Print the number of AWS API calls the command made to stderr.")
+@click.option("--download-cache/--no-download-cache", "use_download_cache", default=True,
+              envvar="INNDIE_DOWNLOAD_CACHE",
+              help="Whether to keep downloaded models, datasets and training scripts in a local "
+                   "cache.")
+@click.option("--download-cache-size", type=ByteSize(),
+              default=download_cache.DEFAULT_MAX_BYTES, envvar="INNDIE_DOWNLOAD_CACHE_SIZE",
+              show_default=True,
+              help="The most bytes kept in the download cache. The least recently used files "
+                   "are evicted first.")
+@click.option("--compress", "codec", type=click.Choice(compression.CODECS),
+              envvar="INNDIE_COMPRESS",
+              help="Compress uploaded datasets, training logs and training results with this "
+                   "codec. Files that are already compressed, such as .h5 and .zip files, are "
+                   "uploaded as-is. Downloads decompress automatically.")
+@click.option("--compression-level", type=int, envvar="INNDIE_COMPRESSION_LEVEL",
+              help="The compression level. Defaults to 6 for gzip and 3 for zstd.")
+@click.option("--compression-threads", type=click.IntRange(min=-1), default=0,
+              envvar="INNDIE_COMPRESSION_THREADS", show_default=True,
+              help="The number of threads zstd compresses with. 0 compresses on the transfer's "
+                   "own thread and -1 uses every CPU.")
+@click.option("--bulk-bandwidth", type=ByteSize(), envvar="INNDIE_BULK_BANDWIDTH",
+              help="The bytes per second shared by every model, dataset and result transfer, "
+                   "such as 50MB. The rest of the link is left for progress, heartbeat, log "
+                   "and metrics writes. Unlimited by default.")
+@click.option("--control-connections", type=click.IntRange(min=1),
+              default=scheduler.DEFAULT_CONTROL_CONNECTIONS,
+              envvar="INNDIE_CONTROL_CONNECTIONS", show_default=True,
+              help="The connections reserved for progress, heartbeat, log and metrics writes.")
+@click.option("--scheduler-stats", is_flag=True, envvar="INNDIE_SCHEDULER_STATS",
+              help="Print the queue depth and wait times of control-plane writes and how long "
+                   "bulk transfers were paused to stderr.")
+@click.option("--trace", is_flag=True, envvar="INNDIE_TRACE",
+              help="Trace every AWS API call and print a table of the calls, latencies, retries "
+                   "and bytes per operation to stderr.")
+@click.option("--trace-file", type=click.Path(dir_okay=False, writable=True),
+              envvar="INNDIE_TRACE_FILE",
+              help="Trace every AWS API call and write the calls and the summary to this file as "
+                   "JSON.")
+@click.option("--chrome-trace", type=click.Path(dir_okay=False, writable=True),
+              envvar="INNDIE_CHROME_TRACE",
+              help="Trace every AWS API call and write a timeline in the Chrome trace format to "
+                   "this file. Open it in chrome://tracing or https://ui.perfetto.dev.")
+@click.option("--job-status/--no-job-status", "use_job_status", default=False,
+              envvar="INNDIE_JOB_STATUS",
+              help="Whether progress, heartbeat, log and result commands also update the job's "
+                   "status.json, which watch-jobs polls. Each update costs a conditional GET and "
+                   "a PUT of status.json.")
+@click.option("--model-copies/--no-model-copies", "use_model_copies", default=False,
+              envvar="INNDIE_MODEL_COPIES",
+              help="Whether uploaded models are also copied to inndie-models/<name> for readers "
+                   "that look models up by key. The copy doubles the storage of every model. "
+                   "Commands find models through their alias either way.")
+@click.pass_context
+def cli(ctx, use_bucket_cache, bucket_cache_ttl, max_pool_connections, count_api_calls,
+        use_download_cache, download_cache_size, codec, compression_level, compression_threads,
+        bulk_bandwidth, control_connections, scheduler_stats, trace, trace_file, chrome_trace,
+        use_job_status, use_model_copies):
+    bucket_cache.configure(enabled=use_bucket_cache, ttl=bucket_cache_ttl)
+    download_cache.configure(enabled=use_download_cache, max_bytes=download_cache_size)
+    if codec == "zstd":
+        try:
+            compression.import_zstandard()
+        except RuntimeError as e:
+            raise click.BadParameter(str(e), param_hint="--compress")
+    compression.configure(codec=codec, level=compression_level, threads=compression_threads)
+    job_status.configure(enabled=use_job_status)
+    model_store.configure(named_copies=use_model_copies)
+    session.configure(max_pool_connections=max_pool_connections,
+                      control_pool_connections=control_connections)
+    scheduler.configure(control_connections=control_connections, bulk_bandwidth=bulk_bandwidth)
+    if count_api_calls:
+        ctx.call_on_close(print_api_call_counts)
+    if scheduler_stats:
+        ctx.call_on_close(print_scheduler_stats)
+    if trace or trace_file is not None or chrome_trace is not None:
+        tracing.reset()
+        tracing.configure(enabled=True)
+        ctx.call_on_close(functools.partial(write_traces, trace, trace_file, chrome_trace))
+
+
+def print_api_call_counts():
+    counts = session.get_api_call_counts()
+    click.echo("{} AWS API call(s)".format(sum(counts.values())), err=True)
+    for (service, operation), count in sorted(counts.items()):
+        click.echo("  {}.{}: {}".format(service, operation, count), err=True)
+
+
+def print_scheduler_stats():
+    click.echo(scheduler.format_stats(), err=True)
+
+
+def write_traces(show_summary, trace_file, chrome_trace):
+    if show_summary:
+        click.echo(tracing.format_summary(tracing.get_calls()), err=True)
+    if trace_file is not None:
+        tracing.write_trace(trace_file)
+    if chrome_trace is not None:
+        tracing.write_chrome_trace(chrome_trace)
+
+
+def transfer_options(function):
+    """
+    Adds the options that tune a file transfer to a command. The command gets them as a
+    `transfer_settings` dict and a `show_progress` flag.
+    """
+    @functools.wraps(function)
+    def wrapper(transfer_profile, multipart_threshold, multipart_chunksize, max_concurrency,
+                max_bandwidth, show_progress, **kwargs):
+        transfer_settings = transfer.get_transfer_settings(
+            transfer_profile, multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize, max_concurrency=max_concurrency,
+            max_bandwidth=max_bandwidth)
+        return function(transfer_settings=transfer_settings, show_progress=show_progress,
+                        **kwargs)
+
+    options = [
+        click.option("--transfer-profile", type=click.Choice(sorted(transfer.TRANSFER_PROFILES)),
+                     default="default", envvar="INNDIE_TRANSFER_PROFILE", show_default=True,
+                     help="Named transfer settings to start from."),
+        click.option("--multipart-threshold", type=ByteSize(),
+                     help="Files at least this big are transferred in parts."),
+        click.option("--multipart-chunksize", type=ByteSize(), help="The size of each part."),
+        click.option("--max-concurrency", type=click.IntRange(min=1),
+                     help="The most parts transferred at once."),
+        click.option("--max-bandwidth", type=ByteSize(),
+                     help="The most bytes per second to transfer."),
+        click.option("--progress", "show_progress", is_flag=True,
+                     help="Print progress and throughput to stderr during the transfer.")
+    ]
+    for option in reversed(options):
+        wrapper = option(wrapper)
+    return wrapper
 
 
 region_choices = ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1',
@@ -455,33 +1495,53 @@ def ensure_configuration(region):
     """
     Ensures that AWS is configured for INNDiE.
     """
-    impl_ensure_configuration(region)
+    try:
+        impl_ensure_configuration(region)
+    except steps.StepError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command(name="ensure-security-group")
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--dry-run", is_flag=True,
+              help="Only print the permission changes that would be made.")
+def ensure_security_group(region, dry_run):
+    """
+    Ensures that the EC2 security group INNDiE uses exists and has the right permissions. Only
+    the rules that have drifted are changed.
+    """
+    ensure_ec2_security_group(region, dry_run)
 
 
 @cli.command(name="upload-model")
 @click.argument("model-path")
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def upload_model(model_path, region):
+@transfer_options
+def upload_model(model_path, region, transfer_settings, show_progress):
     """
     Uploads a model from a local file.
 
     MODEL_PATH The path to the model to upload, ending with the name of the model.
     """
-    impl_upload_model(model_path, ensure_s3_bucket(region), region)
+    impl_upload_model(model_path, ensure_s3_bucket(region), region, transfer_settings,
+                      show_progress)
 
 
 @cli.command(name="download-model")
 @click.argument("model-path")
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def download_model(model_path, region):
+@transfer_options
+def download_model(model_path, region, transfer_settings, show_progress):
     """
     Downloads a model to a local file.
 
     MODEL_PATH The path to download the model to, ending with the name of the model.
     """
-    impl_download_model(model_path, ensure_s3_bucket(region), region)
+    impl_download_model(model_path, ensure_s3_bucket(region), region, transfer_settings,
+                        show_progress)
 
 
 @cli.command(name="download-training-script")
@@ -501,26 +1561,56 @@ def download_training_script(script_path, region):
 @click.argument("dataset-path")
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def upload_dataset(dataset_path, region):
+@transfer_options
+@click.option("--max-workers", type=click.IntRange(min=1), default=transfer.DEFAULT_MAX_WORKERS,
+              show_default=True, help="The most files of a directory to upload at once.")
+@click.option("--pack-small-files", "pack", is_flag=True,
+              help="Pack the small files of a directory into larger shard objects.")
+@click.option("--small-file-threshold", type=ByteSize(),
+              default=packing.DEFAULT_SMALL_FILE_THRESHOLD, show_default=True,
+              help="Files smaller than this are packed.")
+@click.option("--shard-size", type=ByteSize(), default=packing.DEFAULT_SHARD_SIZE,
+              show_default=True, help="The most file bytes put in one shard.")
+@click.option("--resume/--no-resume", default=True, show_default=True,
+              help="Save the upload's progress so that running the command again after an "
+                   "interruption sends only the missing parts.")
+def upload_dataset(dataset_path, region, transfer_settings, show_progress, max_workers, pack,
+                   small_file_threshold, shard_size, resume):
     """
-    Uploads a dataset.
+    Uploads a dataset. The dataset can be a file or a directory.
 
     DATASET_PATH The path to the dataset to upload, ending with the name of the dataset.
     """
-    impl_upload_dataset(dataset_path, ensure_s3_bucket(region), region)
+    try:
+        impl_upload_dataset(dataset_path, ensure_s3_bucket(region), region, transfer_settings,
+                            show_progress, max_workers, pack, small_file_threshold, shard_size,
+                            resume)
+    except (transfer.TransferError, resumable.IntegrityError) as e:
+        raise click.ClickException(str(e))
 
 
 @cli.command(name="download-dataset")
 @click.argument("dataset-path")
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def download_dataset(dataset_path, region):
+@transfer_options
+@click.option("--max-workers", type=click.IntRange(min=1), default=transfer.DEFAULT_MAX_WORKERS,
+              show_default=True, help="The most files of a directory to download at once.")
+@click.option("--resume/--no-resume", default=True, show_default=True,
+              help="Save the download's progress so that running the command again after an "
+                   "interruption fetches only the missing ranges.")
+def download_dataset(dataset_path, region, transfer_settings, show_progress, max_workers,
+                     resume):
     """
-    Downloads a dataset.
+    Downloads a dataset. A dataset uploaded from a directory is downloaded into a directory.
 
     DATASET_PATH The path to download the dataset to, ending with the name of the dataset.
     """
-    impl_download_dataset(dataset_path, ensure_s3_bucket(region), region)
+    try:
+        impl_download_dataset(dataset_path, ensure_s3_bucket(region), region, transfer_settings,
+                              show_progress, max_workers, resume)
+    except (transfer.TransferError, resumable.IntegrityError) as e:
+        raise click.ClickException(str(e))
 
 
 @cli.command(name="update-training-progress")
@@ -541,17 +1631,83 @@ def update_training_progress(job_id, progress_text, region):
                                   region)
 
 
+@cli.command(name="put-training-metrics")
+@click.argument("job-id")
+@click.argument("records", nargs=-1)
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--min-flush-interval", type=click.FloatRange(min=0),
+              default=metrics.DEFAULT_MIN_FLUSH_INTERVAL, show_default=True,
+              help="The fewest seconds between writes to S3.")
+@click.option("--max-batch-records", type=click.IntRange(min=1),
+              default=metrics.DEFAULT_MAX_BATCH_RECORDS, show_default=True,
+              help="The most records held in memory before they are written early.")
+def put_training_metrics(job_id, records, region, min_flush_interval, max_batch_records):
+    """
+    Writes structured training metrics, such as {"step": 10, "epoch": 1, "loss": 0.3}. Records
+    are batched and written as compressed JSON-lines chunks, and progress.txt is updated to the
+    latest record. A training script can pipe records in for the whole job.
+
+    JOB_ID The unique Job ID.
+
+    RECORDS The records to write, each a JSON object. Reads one record per line from stdin if
+    none are given.
+    """
+    lines = records if len(records) > 0 else click.get_text_stream("stdin")
+
+    def parse_records():
+        for line in lines:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise click.ClickException("Invalid record: {}".format(e))
+            if not isinstance(record, dict):
+                raise click.ClickException("Invalid record: {}".format(line))
+            yield record
+
+    impl_put_training_metrics(job_id, parse_records(), ensure_s3_bucket(region), region,
+                              min_flush_interval, max_batch_records)
+
+
 @cli.command(name="create-heartbeat")
 @click.argument("job-id")
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def create_heartbeat(job_id, region):
+@click.option("--lease", type=click.FloatRange(min=0),
+              help="Write a timestamped heartbeat that is only valid for this many seconds.")
+@click.option("--step", type=int, help="The training step to include with a leased heartbeat.")
+def create_heartbeat(job_id, region, lease, step):
     """
     Creates a heartbeat that INNDiE uses to check if the training script is running properly.
 
     JOB_ID The unique Job ID.
     """
-    impl_create_heartbeat(job_id, ensure_s3_bucket(region), region)
+    impl_create_heartbeat(job_id, ensure_s3_bucket(region), region, lease, step)
+
+
+@cli.command(name="emit-heartbeats")
+@click.argument("job-id")
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--interval", type=click.FloatRange(min=0.1), default=heartbeat.DEFAULT_INTERVAL,
+              show_default=True, help="The number of seconds between heartbeats.")
+@click.option("--lease", type=click.FloatRange(min=0),
+              help="The number of seconds each heartbeat is valid for. Defaults to {} intervals."
+              .format(heartbeat.DEFAULT_LEASE_INTERVALS))
+@click.option("--until-pid", type=int,
+              help="Stop when this process exits. Otherwise, run until interrupted.")
+def emit_heartbeats(job_id, region, interval, lease, until_pid):
+    """
+    Keeps a timestamped heartbeat lease alive from the background. INNDiE treats the job as stale
+    once a lease expires without being renewed. When this command stops (the process given by
+    --until-pid exits, or this command gets SIGINT or SIGTERM), the heartbeat is removed.
+
+    JOB_ID The unique Job ID.
+    """
+    impl_emit_heartbeats(job_id, ensure_s3_bucket(region), region,
+                         make_stop_condition(until_pid), interval, lease)
 
 
 @cli.command(name="remove-heartbeat")
@@ -583,17 +1739,260 @@ def set_training_log_file(job_id, log_file, region):
     impl_set_training_log_file(job_id, log_file, ensure_s3_bucket(region), region)
 
 
+@cli.command(name="stream-training-log")
+@click.argument("job-id")
+@click.argument("log-file")
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--flush-interval", type=click.FloatRange(min=0),
+              default=log_stream.DEFAULT_FLUSH_INTERVAL, show_default=True,
+              help="The number of seconds between uploads of new log output.")
+@click.option("--max-buffer-bytes", type=click.IntRange(min=1),
+              default=log_stream.DEFAULT_MAX_BUFFER_BYTES, show_default=True,
+              help="The most bytes of the log held in memory at once.")
+@click.option("--until-pid", type=int,
+              help="Stop streaming when this process exits. Otherwise, stream until interrupted.")
+def stream_training_log(job_id, log_file, region, flush_interval, max_buffer_bytes, until_pid):
+    """
+    Streams the training log file to INNDiE while it is written. Only new output is uploaded on
+    each flush. When streaming stops (the process given by --until-pid exits, or this command gets
+    SIGINT or SIGTERM), the complete log file is uploaded.
+
+    JOB_ID The unique Job ID.
+
+    LOG_FILE The log file to tail.
+    """
+    impl_stream_training_log(job_id, log_file, ensure_s3_bucket(region), region,
+                             make_stop_condition(until_pid),
+                             flush_interval, max_buffer_bytes)
+
+
 @cli.command(name="upload-training-results")
 @click.argument("job-id")
-@click.argument("output-dir")
+@click.argument("output-dir", type=click.Path(exists=True, file_okay=False))
 @click.option("--region", help="The region to connect to.",
               type=click.Choice(region_choices))
-def upload_training_results(job_id, output_dir, region):
+@click.option("--max-workers", type=click.IntRange(min=1), default=transfer.DEFAULT_MAX_WORKERS,
+              show_default=True, help="The maximum number of files to upload at once.")
+@click.option("--sync", is_flag=True,
+              help="Only upload the files that changed since the last --sync upload.")
+@click.option("--pack-small-files", "pack", is_flag=True,
+              help="Pack small files into larger shard objects. Use fetch-training-results to "
+                   "download them.")
+@click.option("--small-file-threshold", type=ByteSize(),
+              default=packing.DEFAULT_SMALL_FILE_THRESHOLD, show_default=True,
+              help="Files smaller than this are packed.")
+@click.option("--shard-size", type=ByteSize(), default=packing.DEFAULT_SHARD_SIZE,
+              show_default=True, help="The most file bytes put in one shard.")
+def upload_training_results(job_id, output_dir, region, max_workers, sync, pack,
+                            small_file_threshold, shard_size):
     """
-    Uploads the results from running a training script.
+    Uploads the results from running a training script. Subdirectories are uploaded too, keeping
+    their paths relative to OUTPUT_DIR.
 
     JOB_ID The unique Job ID.
 
     OUTPUT_DIR The directory containing the results.
     """
-    impl_upload_training_results(job_id, output_dir, ensure_s3_bucket(region), region)
+    try:
+        impl_upload_training_results(job_id, output_dir, ensure_s3_bucket(region), region,
+                                     max_workers, sync, pack, small_file_threshold, shard_size)
+    except InndieError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command(name="fetch-training-results")
+@click.argument("job-id")
+@click.argument("output-dir")
+@click.argument("relative-paths", nargs=-1)
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--max-workers", type=click.IntRange(min=1), default=transfer.DEFAULT_MAX_WORKERS,
+              show_default=True, help="The maximum number of downloads to run at once.")
+def fetch_training_results(job_id, output_dir, relative_paths, region, max_workers):
+    """
+    Downloads the results of a training job, including files that were packed into shards.
+
+    JOB_ID The unique Job ID.
+
+    OUTPUT_DIR The directory to download the results into.
+
+    RELATIVE_PATHS The result files to download, relative to the directory they were uploaded
+    from. Every result file is downloaded if none are given.
+    """
+    try:
+        impl_fetch_training_results(job_id, output_dir, ensure_s3_bucket(region), region,
+                                    list(relative_paths) or None, max_workers)
+    except transfer.TransferError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command(name="watch-jobs")
+@click.argument("job-ids", nargs=-1)
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--interval", type=click.FloatRange(min=0.1),
+              default=job_status.DEFAULT_WATCH_INTERVAL, show_default=True,
+              help="The number of seconds between polls.")
+@click.option("--max-workers", type=click.IntRange(min=1),
+              default=job_status.DEFAULT_WATCH_WORKERS, show_default=True,
+              help="The most jobs to poll at once.")
+@click.option("--once", is_flag=True, help="Poll once and exit.")
+def watch_jobs(job_ids, region, interval, max_workers, once):
+    """
+    Watches the status of training jobs. Prints one JSON line per job whose status changed, with
+    the job's status object and whether its heartbeat lease has expired. Runs until interrupted.
+    Jobs only have a status object if their commands run with --job-status.
+
+    JOB_IDS The IDs of the jobs to watch. Watches every job if none are given.
+    """
+    def stop_after_one_poll():
+        return True
+
+    should_stop = stop_after_one_poll if once else make_stop_condition(None)
+    impl_watch_jobs(list(job_ids), ensure_s3_bucket(region), region, should_stop, interval,
+                    max_workers)
+
+
+@cli.command(name="invalidate-bucket-cache")
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--all-regions", is_flag=True, help="Invalidate the cache for every region.")
+def invalidate_bucket_cache(region, all_regions):
+    """
+    Removes the locally cached S3 bucket name so that the next command looks it up again.
+    """
+    removed = bucket_cache.invalidate(region, all_regions)
+    output.report("Removed {} cached bucket name(s) from: {}\n".format(
+        removed, bucket_cache.get_cache_file()))
+
+
+@cli.command(name="download-cache-stats")
+def download_cache_stats():
+    """
+    Prints how much the local download cache holds and how often it has been used.
+    """
+    stats = download_cache.get_stats()
+    output.report("{} file(s), {} bytes in: {}".format(
+        stats["entries"], stats["bytes"], download_cache.get_downloads_dir()))
+    output.report("{} hit(s), {} miss(es), {} bytes saved\n".format(
+        stats["hits"], stats["misses"], stats["bytes_saved"]))
+
+
+@cli.command(name="clear-download-cache")
+def clear_download_cache():
+    """
+    Removes every file from the local download cache.
+    """
+    removed = download_cache.clear()
+    output.report("Removed {} cached file(s) from: {}\n".format(
+        removed, download_cache.get_downloads_dir()))
+
+
+@cli.command(name="agent")
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--socket", "socket_path", type=click.Path(dir_okay=False),
+              help="The Unix socket to listen on. Defaults to $INNDIE_AGENT_SOCKET or a socket in "
+                   "the INNDiE cache directory.")
+@click.option("--stdin", "use_stdin", is_flag=True,
+              help="Read events from stdin instead of a socket. The agent stops at EOF.")
+@click.option("--flush-interval", type=click.FloatRange(min=0),
+              default=agent.DEFAULT_FLUSH_INTERVAL, show_default=True,
+              help="The most seconds an event waits before it is written.")
+def run_agent(region, socket_path, use_stdin, flush_interval):
+    """
+    Runs a long-lived agent that writes training events to INNDiE. Events are JSON objects, one
+    per line, with a "type" of:
+
+    progress (job_id, text), heartbeat (job_id, alive, lease, step), log (job_id, log_file),
+    results (job_id, output_dir, sync), flush, or shutdown.
+
+    Redundant events for the same job are coalesced so only the latest is written.
+    """
+    if socket_path is None:
+        socket_path = agent.get_default_socket_path()
+
+    def request_stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    impl_agent(ensure_s3_bucket(region), region, socket_path, use_stdin, flush_interval)
+
+
+@cli.command(name="batch")
+@click.argument("batch_file", type=click.File("r"))
+@click.option("--region", help="The region to connect to.",
+              type=click.Choice(region_choices))
+@click.option("--format", "file_format", type=click.Choice(["jsonl", "yaml"]),
+              help="The format of the batch file. Defaults to yaml for .yaml and .yml files and "
+                   "jsonl otherwise.")
+@click.option("--sequential", is_flag=True,
+              help="Run each operation after the one before it, skipping the rest if one fails.")
+@click.option("--max-concurrency", type=click.IntRange(min=1),
+              default=batch.DEFAULT_MAX_CONCURRENCY, show_default=True,
+              help="The most operations that run at once.")
+def run_batch(batch_file, region, file_format, sequential, max_concurrency):
+    """
+    Runs many operations in one process, sharing its AWS clients and S3 bucket lookup.
+    Operations are read from a JSON-lines file (one object per line) or a YAML list. Each has an
+    "op" naming a command, such as "download-model", and that command's arguments, such as
+    "model-path". An operation can also have an "id" and an "after" list of the ids it must run
+    after. Independent operations run concurrently.
+
+    One JSON result per operation is printed to stdout, in the batch's order. The commands'
+    usual output goes to stderr.
+
+    BATCH_FILE The batch file, or - to read it from stdin.
+    """
+    if file_format is None:
+        is_yaml = os.path.splitext(batch_file.name)[1].lower() in [".yaml", ".yml"]
+        file_format = "yaml" if is_yaml else "jsonl"
+
+    try:
+        operations = batch.load_operations(batch_file.read(), file_format)
+        with contextlib.redirect_stdout(sys.stderr):
+            results = batch.run_operations(operations, make_batch_handlers(region), sequential,
+                                           max_concurrency)
+    except batch.BatchError as e:
+        raise click.ClickException(str(e))
+
+    for result in results:
+        print(json.dumps(result))
+
+    if any(not it["ok"] for it in results):
+        raise click.ClickException("{} of {} operation(s) failed.".format(
+            sum(1 for it in results if not it["ok"]), len(results)))
+
+
+@cli.command(name="agent-send")
+@click.argument("events", nargs=-1)
+@click.option("--socket", "socket_path", type=click.Path(dir_okay=False),
+              help="The agent's Unix socket. Defaults to $INNDIE_AGENT_SOCKET or a socket in "
+                   "the INNDiE cache directory.")
+def agent_send(events, socket_path):
+    """
+    Sends events to a running agent.
+
+    EVENTS The events to send, each a JSON object. Reads one event per line from stdin if none
+    are given.
+    """
+    if socket_path is None:
+        socket_path = agent.get_default_socket_path()
+
+    lines = events if len(events) > 0 else click.get_text_stream("stdin")
+    try:
+        parsed = [json.loads(it) for it in lines if len(it.strip()) > 0]
+    except ValueError as e:
+        raise click.ClickException("Invalid event: {}".format(e))
+
+    try:
+        responses = agent.send_events(socket_path, parsed)
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise click.ClickException("No inndie agent is running on: {}. Start one with "
+                                   "`inndie agent`.".format(socket_path))
+    for response in responses:
+        print(json.dumps(response))
+
+    if any(not it["ok"] for it in responses):
+        raise click.ClickException("The agent rejected one or more events.")
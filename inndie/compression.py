@@ -0,0 +1,176 @@
+import os
+import zlib
+
+from inndie.errors import InndieError
+
+# The metadata key that records the codec an object was compressed with
+CODEC_METADATA = "inndie-codec"
+
+CODECS = ["gzip", "zstd"]
+
+DEFAULT_LEVELS = {
+    "gzip": 6,
+    "zstd": 3
+}
+
+# Formats that are already compressed, so compressing them again only costs CPU time
+COMPRESSED_EXTENSIONS = {
+    ".7z", ".bz2", ".gz", ".h5", ".hdf5", ".jpeg", ".jpg", ".mp4", ".npz", ".png", ".tgz",
+    ".xz", ".zip", ".zst"
+}
+
+READ_SIZE = 1024 * 1024
+
+settings = {
+    "codec": None,
+    "level": None,
+    "threads": 0
+}
+
+
+def configure(codec=None, level=None, threads=None):
+    """
+    Changes the compression settings for this process. Compression is off until a codec is set.
+
+    :param codec: "gzip" or "zstd", or `None` to leave the setting unchanged.
+    :param level: The compression level, or `None` to leave the setting unchanged.
+    :param threads: The number of threads zstd compresses with (0 compresses on the calling
+    thread, -1 uses every CPU), or `None` to leave the setting unchanged.
+    """
+    if codec is not None:
+        settings["codec"] = codec
+    if level is not None:
+        settings["level"] = level
+    if threads is not None:
+        settings["threads"] = threads
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs the zstandard package. Install it with: "
+                           "pip install zstandard")
+    return zstandard
+
+
+def choose_codec(path):
+    """
+    :param path: A file that is about to be uploaded.
+    :return: The codec to compress the file with, or `None` if compression is off or the file is
+    already compressed.
+    """
+    if settings["codec"] is None:
+        return None
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return None
+    return settings["codec"]
+
+
+class TruncatedStreamError(InndieError):
+    """
+    Raised when a compressed stream ends before its compressed data does.
+    """
+
+
+def get_codec(metadata):
+    """
+    :param metadata: An object's metadata.
+    :return: The codec the object was compressed with, or `None`.
+    """
+    return (metadata or {}).get(CODEC_METADATA)
+
+
+def make_compressor(codec):
+    """
+    :return: An object with `compress(data)` and `flush()` for the codec and the configured level.
+    """
+    level = settings["level"]
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+
+    if codec == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if codec == "zstd":
+        zstandard = import_zstandard()
+        return zstandard.ZstdCompressor(level=level, threads=settings["threads"]).compressobj()
+    raise ValueError("Unknown codec: {}".format(codec))
+
+
+def make_decompressor(codec):
+    """
+    :return: An object with `decompress(data)` for the codec.
+    """
+    if codec == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if codec == "zstd":
+        return import_zstandard().ZstdDecompressor().decompressobj()
+    raise ValueError("Unknown codec: {}".format(codec))
+
+
+class CompressingReader:
+    """
+    A readable stream of a file's compressed contents. The file is compressed as it is read, so
+    no compressed copy is written to disk and at most about one read of output is buffered.
+    """
+
+    def __init__(self, source, codec):
+        """
+        :param source: A readable binary stream of the uncompressed data.
+        :param codec: The codec to compress with.
+        """
+        self.source = source
+        self.compressor = make_compressor(codec)
+        self.buffer = bytearray()
+        self.finished = False
+
+    def read(self, size=-1):
+        while not self.finished and (size is None or size < 0 or len(self.buffer) < size):
+            data = self.source.read(READ_SIZE)
+            if len(data) > 0:
+                self.buffer += self.compressor.compress(data)
+            else:
+                self.buffer += self.compressor.flush()
+                self.finished = True
+
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def upload_file(client, bucket_name, path, key, codec, config=None, callback=None):
+    """
+    Uploads a file compressed while it is read. The codec is recorded in the object's metadata.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param path: The file.
+    :param key: The key of the object.
+    :param codec: The codec to compress with.
+    :param config: The TransferConfig, or `None` for boto3's defaults.
+    :param callback: A boto3 transfer callback, which is given compressed bytes, or `None`.
+    """
+    with open(path, "rb") as f:
+        client.upload_fileobj(CompressingReader(f, codec), bucket_name, key, Config=config,
+                              Callback=callback,
+                              ExtraArgs={"Metadata": {CODEC_METADATA: codec}})
+
+
+def decompress_stream(stream, path, codec):
+    """
+    Writes the decompressed contents of a stream to a file. Raises a `TruncatedStreamError`, and
+    removes the file, if the stream ends before the compressed data does.
+
+    :param stream: A readable binary stream, such as a `get_object` body.
+    :param path: The file to write.
+    :param codec: The codec the stream was compressed with.
+    """
+    decompressor = make_decompressor(codec)
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: stream.read(READ_SIZE), b""):
+            f.write(decompressor.decompress(chunk))
+    if not decompressor.eof:
+        os.remove(path)
+        raise TruncatedStreamError("The {} stream written to {} ended early".format(codec, path))
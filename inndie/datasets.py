@@ -0,0 +1,175 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from inndie import packing
+from inndie import scheduler
+from inndie import transfer
+
+MANIFEST_NAME = ".inndie-dataset.json"
+MANIFEST_VERSION = 1
+
+
+def get_manifest_key(prefix):
+    return prefix + "/" + MANIFEST_NAME
+
+
+def load_manifest(client, bucket_name, prefix):
+    """
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param prefix: The dataset's prefix.
+    :return: The dataset manifest, or `None` if the dataset is not a directory dataset.
+    """
+    try:
+        body = client.get_object(Bucket=bucket_name, Key=get_manifest_key(prefix))["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+
+    manifest = json.loads(body.decode("utf-8"))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise RuntimeError("Unsupported dataset manifest version: {}".format(
+            manifest.get("version")))
+    return manifest
+
+
+def upload_directory(client, bucket_name, prefix, root, max_workers=transfer.DEFAULT_MAX_WORKERS,
+                     pack=False, small_file_threshold=packing.DEFAULT_SMALL_FILE_THRESHOLD,
+                     shard_size=packing.DEFAULT_SHARD_SIZE, upload_function=transfer.upload_file):
+    """
+    Uploads every file under a directory in parallel, then writes a manifest of where each file
+    is stored. The manifest is written last, so a partially uploaded dataset is never visible.
+    Shards get new keys on every upload, and the shards of the previous manifest are only deleted
+    once the new manifest is written.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param prefix: The dataset's prefix.
+    :param root: The directory to upload.
+    :param max_workers: The most objects to upload at once.
+    :param pack: Whether to pack small files into tar shards instead of uploading each one.
+    Shards are streamed from the files as they are uploaded.
+    :param small_file_threshold: Files smaller than this are packed.
+    :param shard_size: The most file bytes put in one shard.
+    :param upload_function: The function that uploads each file that is not packed. It takes the
+    same arguments as `transfer.upload_file` and returns the number of bytes uploaded.
+    :return: The `TransferSummary`. Raises a `TransferError` if anything failed to upload.
+    """
+    files = transfer.walk_files(root)
+    if pack:
+        large_files, shards = packing.plan_shards(files, small_file_threshold, shard_size)
+    else:
+        large_files, shards = files, []
+
+    old_manifest = load_manifest(client, bucket_name, prefix)
+    batch = packing.new_shard_batch()
+    entries = {}
+
+    def upload_large_file(path, relative_path):
+        key = prefix + "/" + relative_path
+        size = upload_function(client, bucket_name, path, key)
+        return {relative_path: {"key": key, "size": size}}, 1, size
+
+    def upload_shard(index, members):
+        key = packing.get_shard_key(prefix, batch, index)
+        shard_entries = packing.upload_shard(client, bucket_name, key, members)
+        return shard_entries, len(members), sum(it["size"] for it in shard_entries.values())
+
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for path, relative_path in large_files:
+            futures[executor.submit(upload_large_file, path, relative_path)] = \
+                (path, prefix + "/" + relative_path)
+        for index, members in enumerate(shards):
+            futures[executor.submit(upload_shard, index, members)] = \
+                ("{} packed file(s)".format(len(members)),
+                 packing.get_shard_key(prefix, batch, index))
+
+        for future in as_completed(futures):
+            try:
+                new_entries, files_done, bytes_done = future.result()
+            except Exception as e:
+                path, key = futures[future]
+                summary.failures.append((path, key, e))
+                continue
+
+            entries.update(new_entries)
+            summary.files += files_done
+            summary.bytes += bytes_done
+
+    summary.seconds = time.monotonic() - start
+    summary.raise_for_failures()
+
+    manifest = {"version": MANIFEST_VERSION, "files": entries}
+    client.put_object(Body=json.dumps(manifest).encode("utf-8"), Bucket=bucket_name,
+                      Key=get_manifest_key(prefix), ContentType="application/json")
+    if old_manifest is not None:
+        packing.delete_unused_shards(client, bucket_name, old_manifest["files"], entries)
+    return summary
+
+
+def download_directory(client, bucket_name, manifest, root,
+                       max_workers=transfer.DEFAULT_MAX_WORKERS,
+                       download_function=transfer.download_file):
+    """
+    Downloads a directory dataset in parallel. Packed files are written into place while their
+    shard is read, so shards are never saved to disk.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param manifest: The dataset manifest.
+    :param root: The directory to download into.
+    :param max_workers: The most objects to download at once.
+    :param download_function: The function that downloads each file that is not packed. It takes
+    the same arguments as `transfer.download_file` and returns the number of bytes downloaded.
+    :return: The `TransferSummary`. Raises a `TransferError` if anything failed to download.
+    """
+    files = []
+    shards = {}
+    for relative_path, entry in manifest["files"].items():
+        if "shard" in entry:
+            shards.setdefault(entry["shard"], set()).add(relative_path)
+        else:
+            files.append((relative_path, entry["key"]))
+
+    def download_file(relative_path, key):
+        path = packing.get_safe_path(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return 1, download_function(client, bucket_name, key, path)
+
+    def download_shard(key, wanted):
+        body = client.get_object(Bucket=bucket_name, Key=key)["Body"]
+        try:
+            files_done, bytes_done = packing.extract_shard_stream(body, root, wanted)
+        finally:
+            body.close()
+        scheduler.throttle(bytes_done)
+        return files_done, bytes_done
+
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for relative_path, key in files:
+            futures[executor.submit(download_file, relative_path, key)] = (relative_path, key)
+        for key, wanted in shards.items():
+            futures[executor.submit(download_shard, key, wanted)] = \
+                ("{} packed file(s)".format(len(wanted)), key)
+
+        for future in as_completed(futures):
+            try:
+                files_done, bytes_done = future.result()
+            except Exception as e:
+                path, key = futures[future]
+                summary.failures.append((path, key, e))
+                continue
+
+            summary.files += files_done
+            summary.bytes += bytes_done
+
+    summary.seconds = time.monotonic() - start
+    summary.raise_for_failures()
+    return summary
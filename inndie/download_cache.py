@@ -0,0 +1,217 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import time
+
+from inndie.local_state import get_cache_dir, read_json, write_json
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl. Concurrent commands may then lose each other's index updates, which
+    # only costs extra downloads.
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+# The Linux ioctl that makes a file share another file's data (a reflink)
+FICLONE = 0x40049409
+COPY_SIZE = 1024 * 1024
+
+settings = {
+    "enabled": True,
+    "max_bytes": DEFAULT_MAX_BYTES
+}
+
+
+def configure(enabled=None, max_bytes=None):
+    """
+    Changes the download cache settings for this process.
+
+    :param enabled: Whether to use the cache, or `None` to leave the setting unchanged.
+    :param max_bytes: The byte budget, or `None` to leave the setting unchanged.
+    """
+    if enabled is not None:
+        settings["enabled"] = enabled
+    if max_bytes is not None:
+        settings["max_bytes"] = max_bytes
+
+
+def get_downloads_dir():
+    return os.path.join(get_cache_dir(), "downloads")
+
+
+def get_index_file():
+    return os.path.join(get_downloads_dir(), "index.json")
+
+
+def empty_index():
+    return {"entries": {}, "stats": {"hits": 0, "misses": 0, "bytes_saved": 0}}
+
+
+def read_index():
+    index = read_json(get_index_file(), None)
+    if not isinstance(index, dict) or "entries" not in index or "stats" not in index:
+        return empty_index()
+    return index
+
+
+@contextlib.contextmanager
+def locked_index():
+    """
+    Holds an exclusive lock on the index while it is read and written back.
+
+    :return: A context manager that gives the index and writes it back on exit.
+    """
+    os.makedirs(get_downloads_dir(), exist_ok=True)
+    with open(os.path.join(get_downloads_dir(), "index.lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        index = read_index()
+        yield index
+        write_json(get_index_file(), index)
+
+
+def get_entry_id(bucket_name, key):
+    return hashlib.sha256("{}/{}".format(bucket_name, key).encode("utf-8")).hexdigest()
+
+
+def get_blob_path(entry_id):
+    return os.path.join(get_downloads_dir(), "blobs", entry_id)
+
+
+def place(blob_path, path):
+    """
+    Puts a cached file at a destination as a file of its own, so that writing to the destination
+    never changes the cached copy. The copy is a reflink where the file system supports them,
+    which shares the data until either file is written.
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(blob_path, "rb") as source, open(path, "wb") as destination:
+        try:
+            if fcntl is None or not sys.platform.startswith("linux"):
+                raise OSError("Reflinks are not supported")
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        except OSError:
+            shutil.copyfileobj(source, destination, COPY_SIZE)
+
+
+def evict(index, keep_id=None):
+    """
+    Removes the least recently used entries until the cache fits its byte budget.
+
+    :param index: The index.
+    :param keep_id: An entry that must not be removed, or `None`.
+    :return: The number of entries removed.
+    """
+    entries = index["entries"]
+    total = sum(it["size"] for it in entries.values())
+    removed = 0
+    for entry_id, entry in sorted(entries.items(), key=lambda it: it[1]["last_used"]):
+        if total <= settings["max_bytes"]:
+            break
+        if entry_id == keep_id:
+            continue
+
+        blob_path = get_blob_path(entry_id)
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+        del entries[entry_id]
+        total -= entry["size"]
+        removed += 1
+    return removed
+
+
+def fetch(client, bucket_name, key, path, download):
+    """
+    Puts an object at a local path, serving it from the cache if the cached copy's ETag still
+    matches the object's (checked with a HEAD request).
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param key: The key of the object.
+    :param path: The local file path.
+    :param download: A function that downloads the object to the path it is given.
+    :return: A tuple of whether the cache was hit and the result of `download`, which is `None`
+    on a hit.
+    """
+    etag = client.head_object(Bucket=bucket_name, Key=key)["ETag"]
+    entry_id = get_entry_id(bucket_name, key)
+    blob_path = get_blob_path(entry_id)
+
+    with locked_index() as index:
+        entry = index["entries"].get(entry_id)
+        if entry is not None and entry["etag"] == etag and os.path.exists(blob_path) and \
+                os.path.getsize(blob_path) == entry["size"]:
+            entry["last_used"] = time.time()
+            index["stats"]["hits"] += 1
+            index["stats"]["bytes_saved"] += entry["size"]
+            place(blob_path, path)
+            return True, None
+
+    # Download outside of the lock so that other commands are not held up. The download's path
+    # depends only on the destination, so a resumable download can pick up where it stopped.
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(blob_path), ".download-" + get_entry_id(
+        bucket_name, os.path.abspath(path)))
+    try:
+        result = download(tmp_path)
+        # Objects that were uploaded compressed are larger on disk than in S3
+        size = os.path.getsize(tmp_path)
+        if size > settings["max_bytes"]:
+            # Too big to cache, so hand the download over as-is
+            if os.path.lexists(path):
+                os.remove(path)
+            shutil.move(tmp_path, path)
+            with locked_index() as index:
+                index["stats"]["misses"] += 1
+            return False, result
+
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        with locked_index() as index:
+            os.replace(tmp_path, blob_path)
+            index["entries"][entry_id] = {
+                "bucket": bucket_name,
+                "key": key,
+                "etag": etag,
+                "size": size,
+                "last_used": time.time()
+            }
+            index["stats"]["misses"] += 1
+            evict(index, keep_id=entry_id)
+            place(blob_path, path)
+        return False, result
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_stats():
+    """
+    :return: A dict of hits, misses, bytes_saved, entries and bytes.
+    """
+    index = read_index()
+    stats = dict(index["stats"])
+    stats["entries"] = len(index["entries"])
+    stats["bytes"] = sum(it["size"] for it in index["entries"].values())
+    return stats
+
+
+def clear():
+    """
+    Removes every cached file and resets the statistics.
+
+    :return: The number of entries removed.
+    """
+    with locked_index() as index:
+        removed = len(index["entries"])
+        shutil.rmtree(os.path.join(get_downloads_dir(), "blobs"), ignore_errors=True)
+        index.clear()
+        index.update(empty_index())
+    return removed
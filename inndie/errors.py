@@ -0,0 +1,12 @@
+class InndieError(RuntimeError):
+    """
+    The base class of the errors INNDiE raises.
+    """
+    pass
+
+
+class NotFoundError(InndieError):
+    """
+    Raised when an object that INNDiE needs does not exist in S3.
+    """
+    pass
@@ -0,0 +1,141 @@
+import json
+import posixpath
+import sys
+import threading
+import time
+
+from inndie import job_status
+from inndie import scheduler
+
+DEFAULT_INTERVAL = 30.0
+
+# How many intervals a lease lasts by default, so one slow or failed write does not make a
+# healthy job look stale
+DEFAULT_LEASE_INTERVALS = 3
+
+
+def make_record(alive, lease, sequence=None, step=None, now=None):
+    """
+    Makes a heartbeat record. A reader knows the job is stale once `timestamp + lease` is in the
+    past, from a single GET.
+
+    :param alive: Whether the training script is running.
+    :param lease: The number of seconds the record is valid for.
+    :param sequence: The sequence number of the record, or `None` to omit it.
+    :param step: The training step counter, or `None` to omit it.
+    :param now: The timestamp of the record, or `None` to use the current time.
+    :return: The encoded record.
+    """
+    record = {
+        "alive": alive,
+        "timestamp": round(time.time() if now is None else now, 3),
+        "lease": lease
+    }
+    if sequence is not None:
+        record["sequence"] = sequence
+    if step is not None:
+        record["step"] = step
+    return json.dumps(record, separators=(",", ":")).encode("utf-8")
+
+
+def parse_record(body):
+    """
+    Parses a heartbeat. Heartbeats written without a lease hold just "1" or "0".
+
+    :param body: The contents of the heartbeat object.
+    :return: The record as a dict.
+    """
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    if text.strip() in ["0", "1"]:
+        return {"alive": text.strip() == "1"}
+    return json.loads(text)
+
+
+def make_status_field(body):
+    """
+    :param body: The contents written to the heartbeat object.
+    :return: The heartbeat as it is kept in the job's status object. It always has a timestamp,
+    even if the heartbeat was written without a lease.
+    """
+    record = parse_record(body)
+    record.setdefault("timestamp", round(time.time(), 3))
+    return record
+
+
+def is_stale(record, now=None):
+    """
+    :param record: A parsed heartbeat record.
+    :param now: The current time, or `None` to use the current time.
+    :return: True if the job is not alive or its lease has expired. A heartbeat without a lease
+    never expires.
+    """
+    if not record.get("alive", False):
+        return True
+    if "timestamp" not in record or "lease" not in record:
+        return False
+    return record["timestamp"] + record["lease"] < (time.time() if now is None else now)
+
+
+class HeartbeatEmitter:
+    """
+    Renews a heartbeat lease from a background thread. The thread sleeps until the next write is
+    due, so setting the step counter never causes an extra write.
+    """
+
+    def __init__(self, client, bucket_name, key, interval=DEFAULT_INTERVAL, lease=None):
+        """
+        :param client: The S3 client to use.
+        :param bucket_name: The S3 bucket name.
+        :param key: The key of the heartbeat object.
+        :param interval: The number of seconds between writes.
+        :param lease: The number of seconds each record is valid for, or `None` for
+        `DEFAULT_LEASE_INTERVALS` intervals.
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.interval = interval
+        self.lease = lease if lease is not None else interval * DEFAULT_LEASE_INTERVALS
+        self.sequence = 0
+        self.step = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="inndie-heartbeat", daemon=True)
+
+    def set_step(self, step):
+        """
+        Sets the step counter included in the next record.
+
+        :param step: The training step.
+        """
+        self.step = step
+
+    def write(self, alive):
+        record = make_record(alive, self.lease, self.sequence, self.step)
+        with scheduler.control():
+            self.client.put_object(Body=record, Bucket=self.bucket_name, Key=self.key)
+        self.sequence += 1
+        job_status.update(self.client, self.bucket_name, posixpath.dirname(self.key),
+                          finished=not alive, heartbeat=make_status_field(record))
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops renewing the lease and writes a final record saying the job is no longer alive.
+        """
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.write(alive=False)
+
+    def run(self):
+        next_write = time.monotonic()
+        while not self.stop_event.wait(max(0.0, next_write - time.monotonic())):
+            try:
+                self.write(alive=True)
+            except Exception as e:
+                # The lease outlasts a few intervals, so try again at the next one
+                print("Failed to write heartbeat {}: {}".format(self.key, e), file=sys.stderr)
+            # Skip the writes that are already overdue instead of sending them in a burst
+            next_write = max(next_write + self.interval, time.monotonic())
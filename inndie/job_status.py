@@ -0,0 +1,260 @@
+import contextlib
+import hashlib
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inndie import scheduler
+from inndie.local_state import get_cache_dir, read_json, write_json
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl. Concurrent commands for the same job may then write their fields out
+    # of order, which the next update fixes.
+    fcntl = None
+
+STATUS_NAME = "status.json"
+STATUS_VERSION = 1
+
+# Progress text longer than this is cut short in the status object. progress.txt keeps all of it.
+MAX_PROGRESS_CHARS = 1024
+
+DEFAULT_WATCH_INTERVAL = 5.0
+DEFAULT_WATCH_WORKERS = 16
+
+# Local copies of jobs that never finished, such as jobs whose machine died, are removed once they
+# have not been updated for this many seconds
+LOCAL_STATUS_TTL = 7 * 24 * 60 * 60
+
+settings = {
+    # Off by default, since each update costs a conditional GET and a PUT of the status object
+    # on top of the write it describes
+    "enabled": False
+}
+
+
+def configure(enabled=None):
+    """
+    Changes the job status settings for this process.
+
+    :param enabled: Whether to write the status object, or `None` to leave the setting
+    unchanged.
+    """
+    if enabled is not None:
+        settings["enabled"] = enabled
+
+
+def get_status_key(prefix):
+    """
+    :param prefix: The job's progress prefix.
+    :return: The key of the job's status object.
+    """
+    return prefix + "/" + STATUS_NAME
+
+
+def get_local_dir():
+    return os.path.join(get_cache_dir(), "job-status")
+
+
+def get_local_file(bucket_name, prefix):
+    name = "{}/{}".format(bucket_name, prefix)
+    return os.path.join(get_local_dir(),
+                        hashlib.sha256(name.encode("utf-8")).hexdigest() + ".json")
+
+
+def remove_local_file(local_file):
+    for path in [local_file, local_file + ".lock"]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def prune_local_files(max_age=LOCAL_STATUS_TTL):
+    """
+    Removes the local copies of jobs that have not been updated for `max_age` seconds.
+    """
+    try:
+        names = os.listdir(get_local_dir())
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - max_age
+    for name in names:
+        path = os.path.join(get_local_dir(), name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@contextlib.contextmanager
+def locked(local_file):
+    """
+    Holds an exclusive lock on a job's local status while it is updated, so that commands that
+    update the same job one after another never drop each other's fields.
+    """
+    os.makedirs(os.path.dirname(local_file), exist_ok=True)
+    with open(local_file + ".lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def fetch_status(client, bucket_name, prefix, local):
+    """
+    :param local: The local copy of the job's status, with the ETag it was written with, or
+    `None` if there is none.
+    :return: The job's current status. The local copy is used if the object in S3 still has its
+    ETag, which costs a 304 response and no body.
+    """
+    from botocore.exceptions import ClientError
+
+    kwargs = {}
+    if local is not None:
+        kwargs["IfNoneMatch"] = local["etag"]
+    try:
+        with scheduler.control():
+            response = client.get_object(Bucket=bucket_name, Key=get_status_key(prefix),
+                                         **kwargs)
+            body = response["Body"].read()
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code in ["304", "NotModified"]:
+            return local["status"]
+        if code in ["404", "NoSuchKey"]:
+            return {}
+        raise
+    return json.loads(body.decode("utf-8"))
+
+
+def update(client, bucket_name, prefix, finished=False, **fields):
+    """
+    Updates fields of a job's status object and writes the whole object. S3 replaces an object
+    atomically, so readers always see a complete status. The status is merged with a local copy,
+    which is read again from S3 whenever another writer has changed the object.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param prefix: The job's progress prefix.
+    :param finished: Whether the job has finished. Its local copy is then removed.
+    :param fields: The fields to set, such as `heartbeat={...}`.
+    :return: The new status, or `None` if writing the status is off.
+    """
+    if not settings["enabled"]:
+        return None
+
+    local_file = get_local_file(bucket_name, prefix)
+    with locked(local_file):
+        status = fetch_status(client, bucket_name, prefix, read_json(local_file, None))
+        status.update(fields)
+        status["version"] = STATUS_VERSION
+        status["job_id"] = posixpath.basename(prefix)
+        status["sequence"] = status.get("sequence", 0) + 1
+        status["updated"] = round(time.time(), 3)
+        with scheduler.control():
+            response = client.put_object(
+                Body=json.dumps(status, separators=(",", ":")).encode("utf-8"),
+                Bucket=bucket_name, Key=get_status_key(prefix), ContentType="application/json")
+        if finished:
+            remove_local_file(local_file)
+        else:
+            write_json(local_file, {"etag": response["ETag"], "status": status})
+
+    if finished:
+        prune_local_files()
+    return status
+
+
+def make_progress_field(progress_text, latest=None, chunk=None):
+    """
+    :param progress_text: The contents written to progress.txt.
+    :param latest: The latest metrics record, or `None` if the progress is not from metrics.
+    :param chunk: The key of the metrics chunk with the latest record, or `None`.
+    :return: The progress as it is kept in the job's status object.
+    """
+    return {"text": progress_text[:MAX_PROGRESS_CHARS], "latest": latest, "chunk": chunk,
+            "timestamp": round(time.time(), 3)}
+
+
+def list_jobs(client, bucket_name, root):
+    """
+    :param root: The prefix every job's progress prefix is under, ending with "/".
+    :return: A list of the job IDs under the prefix.
+    """
+    jobs = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=root,
+                                                                 Delimiter="/"):
+        for it in page.get("CommonPrefixes", []):
+            jobs.append(it["Prefix"][len(root):].rstrip("/"))
+    return jobs
+
+
+class JobWatcher:
+    """
+    Polls the status objects of many jobs. Each poll sends a conditional GET per job with the
+    ETag it saw last, so a job that has not changed costs a 304 response and no body.
+    """
+
+    def __init__(self, client, bucket_name, make_prefix, max_workers=DEFAULT_WATCH_WORKERS):
+        """
+        :param client: The S3 client to use.
+        :param bucket_name: The S3 bucket name.
+        :param make_prefix: A function from a job ID to the job's progress prefix.
+        :param max_workers: The most jobs to poll at once.
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.make_prefix = make_prefix
+        self.max_workers = max_workers
+        # The ETag of each job's status, or `None` for a job that has no status object
+        self.etags = {}
+
+    def fetch(self, job_id):
+        """
+        :return: A tuple of whether the status changed, its ETag and the status. The ETag and
+        status are `None` if the job has no status object.
+        """
+        from botocore.exceptions import ClientError
+
+        kwargs = {}
+        if self.etags.get(job_id) is not None:
+            kwargs["IfNoneMatch"] = self.etags[job_id]
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name,
+                                              Key=get_status_key(self.make_prefix(job_id)),
+                                              **kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ["304", "NotModified"]:
+                return False, self.etags[job_id], None
+            if code in ["404", "NoSuchKey"]:
+                return job_id not in self.etags or self.etags[job_id] is not None, None, None
+            raise
+
+        body = response["Body"].read()
+        return response["ETag"] != self.etags.get(job_id), response["ETag"], \
+            json.loads(body.decode("utf-8"))
+
+    def poll(self, job_ids):
+        """
+        Polls jobs concurrently.
+
+        :param job_ids: The IDs of the jobs to poll.
+        :return: A list of `(job_id, status)` tuples, one per job whose status changed since the
+        last poll or that is polled for the first time. The status is `None` if the job has no
+        status object.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(job_ids)))) as \
+                executor:
+            results = list(executor.map(self.fetch, job_ids))
+
+        changes = []
+        for job_id, (changed, etag, status) in zip(job_ids, results):
+            self.etags[job_id] = etag
+            if changed:
+                changes.append((job_id, status))
+        return changes
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+
+
+def get_cache_dir():
+    """
+    :return: The directory INNDiE keeps its local state in. Can be overridden with the
+    `INNDIE_CACHE_DIR` environment variable.
+    """
+    cache_dir = os.environ.get("INNDIE_CACHE_DIR")
+    if cache_dir is None:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        cache_dir = os.path.join(xdg_cache, "inndie")
+    return cache_dir
+
+
+def read_json(path, default):
+    """
+    Reads a JSON state file.
+
+    :param path: The path to the file.
+    :param default: The value to return if the file is missing or unreadable.
+    :return: The parsed contents, or `default`.
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, contents):
+    """
+    Atomically replaces a JSON state file so that concurrent CLI invocations never see a partial
+    write. Local state is only an optimization, so failing to write it is not an error.
+
+    :param path: The path to the file. Missing parent directories are made.
+    :param contents: The value to write.
+    :return: True if the file was written.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = None, None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(contents, f)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
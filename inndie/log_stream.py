@@ -0,0 +1,114 @@
+import os
+import time
+
+from inndie import job_status
+from inndie import scheduler
+from inndie import transfer
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_BUFFER_BYTES = 1024 * 1024
+
+
+class TrainingLogStreamer:
+    """
+    Tails a training log file and uploads only the bytes appended since the last flush. Each
+    flush writes numbered segment objects under `<prefix>/log-segments/`, so the cost of an update
+    grows with the new output instead of with the whole log. `finish` writes the consolidated
+    `<prefix>/log.txt`.
+    """
+
+    def __init__(self, client, bucket_name, prefix, log_file,
+                 max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES):
+        """
+        :param client: The S3 client to use.
+        :param bucket_name: The S3 bucket name.
+        :param prefix: The job's progress prefix.
+        :param log_file: The log file to tail.
+        :param max_buffer_bytes: The most bytes held in memory (and put in one segment) at once.
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.log_file = log_file
+        self.max_buffer_bytes = max_buffer_bytes
+        self.offset = 0
+        self.next_segment = 0
+
+    def segment_key(self, index):
+        return "{}/log-segments/{:08d}.txt".format(self.prefix, index)
+
+    def flush(self, final=False):
+        """
+        Uploads everything appended to the log since the last flush. Unless this is the final
+        flush, a trailing partial line is held back until it is complete (or fills the buffer).
+
+        :param final: Whether to upload a trailing partial line too.
+        :return: The number of bytes uploaded.
+        """
+        if not os.path.exists(self.log_file):
+            return 0
+
+        if os.path.getsize(self.log_file) < self.offset:
+            # The log was truncated or rotated, so start reading it from the beginning again
+            self.offset = 0
+
+        uploaded = 0
+        with open(self.log_file, "rb") as f:
+            while True:
+                f.seek(self.offset)
+                data = f.read(self.max_buffer_bytes)
+                if len(data) == 0:
+                    break
+
+                if not final and len(data) < self.max_buffer_bytes:
+                    end = data.rfind(b"\n") + 1
+                    if end == 0:
+                        break
+                    data = data[:end]
+
+                with scheduler.control():
+                    self.client.put_object(Body=data, Bucket=self.bucket_name,
+                                           Key=self.segment_key(self.next_segment),
+                                           Metadata={"offset": str(self.offset)})
+                self.next_segment += 1
+                self.offset += len(data)
+                uploaded += len(data)
+
+        if uploaded > 0 and not final:
+            job_status.update(self.client, self.bucket_name, self.prefix,
+                              log={"size": self.offset, "segments": self.next_segment,
+                                   "timestamp": round(time.time(), 3)})
+        return uploaded
+
+    def finish(self):
+        """
+        Flushes the rest of the log and uploads the consolidated `log.txt`. The file is streamed
+        from disk, so it is never read into memory in full. It is compressed if compression is
+        on.
+
+        :return: The key of the consolidated log.
+        """
+        self.flush(final=True)
+        key = self.prefix + "/log.txt"
+        transfer.upload_file(self.client, self.bucket_name, self.log_file, key)
+        job_status.update(self.client, self.bucket_name, self.prefix,
+                          log={"key": key, "size": self.offset, "segments": self.next_segment,
+                               "timestamp": round(time.time(), 3)})
+        return key
+
+    def run(self, should_stop, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Flushes the log every `flush_interval` seconds until `should_stop` returns True, then
+        finishes the log.
+
+        :param should_stop: A function that returns True when streaming should end.
+        :param flush_interval: The number of seconds between flushes.
+        :return: The key of the consolidated log.
+        """
+        while not should_stop():
+            self.flush()
+            deadline = time.monotonic() + flush_interval
+            while not should_stop() and time.monotonic() < deadline:
+                time.sleep(min(0.2, flush_interval))
+
+        return self.finish()
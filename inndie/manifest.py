@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from inndie.local_state import get_cache_dir, read_json, write_json
+
+MANIFEST_NAME = ".inndie-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    :param path: The file to hash.
+    :param chunk_size: How many bytes to read at a time.
+    :return: The hex SHA-256 of the file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_local_manifest_path(bucket_name, remote_prefix):
+    return os.path.join(get_cache_dir(), "manifests", bucket_name, remote_prefix + ".json")
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def is_valid_manifest(manifest):
+    return isinstance(manifest, dict) and manifest.get("version") == MANIFEST_VERSION and \
+        isinstance(manifest.get("files"), dict)
+
+
+def load_manifest(client, bucket_name, remote_prefix):
+    """
+    Loads the sync manifest, preferring the local copy and falling back to the copy in S3 (for
+    example, when syncing from a different machine).
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param remote_prefix: The prefix the manifest is stored under.
+    :return: The manifest.
+    """
+    manifest = read_json(get_local_manifest_path(bucket_name, remote_prefix), None)
+    if is_valid_manifest(manifest):
+        return manifest
+
+    try:
+        body = client.get_object(Bucket=bucket_name,
+                                 Key=remote_prefix + "/" + MANIFEST_NAME)["Body"].read()
+        manifest = json.loads(body.decode("utf-8"))
+    except client.exceptions.NoSuchKey:
+        return empty_manifest()
+
+    return manifest if is_valid_manifest(manifest) else empty_manifest()
+
+
+def save_manifest(client, bucket_name, remote_prefix, manifest):
+    """
+    Saves the sync manifest locally and in S3.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param remote_prefix: The prefix the manifest is stored under.
+    :param manifest: The manifest.
+    """
+    write_json(get_local_manifest_path(bucket_name, remote_prefix), manifest)
+    client.put_object(Body=json.dumps(manifest).encode("utf-8"), Bucket=bucket_name,
+                      Key=remote_prefix + "/" + MANIFEST_NAME,
+                      ContentType="application/json")
+
+
+def plan_sync(files, manifest, max_workers):
+    """
+    Works out which files changed since the manifest was written. A file whose size and mtime
+    match its entry is assumed unchanged without reading it. Otherwise the file is hashed, so a
+    file that was only touched is not uploaded again.
+
+    :param files: A list of `(path, relative_path, key)` tuples.
+    :param manifest: The manifest from the last sync.
+    :param max_workers: The maximum number of files to hash at once.
+    :return: A tuple of the list of `(path, relative_path, key)` tuples to upload and a dict of
+    the new manifest entries keyed by relative path.
+    """
+    entries = {}
+    to_hash = []
+    for path, relative_path, key in files:
+        stat = os.stat(path)
+        entry = {"key": key, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        old_entry = manifest["files"].get(relative_path)
+        if old_entry is not None and old_entry.get("key") == key and \
+                old_entry.get("size") == entry["size"] and \
+                old_entry.get("mtime") == entry["mtime"]:
+            entry["sha256"] = old_entry.get("sha256")
+            entries[relative_path] = entry
+        else:
+            to_hash.append((path, relative_path, key, entry))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = list(executor.map(lambda it: hash_file(it[0]), to_hash))
+
+    changed = []
+    for (path, relative_path, key, entry), sha256 in zip(to_hash, hashes):
+        entry["sha256"] = sha256
+        entries[relative_path] = entry
+        old_entry = manifest["files"].get(relative_path)
+        if old_entry is None or old_entry.get("key") != key or \
+                old_entry.get("sha256") != sha256:
+            changed.append((path, relative_path, key))
+
+    return changed, entries
@@ -0,0 +1,181 @@
+import gzip
+import json
+import sys
+import threading
+import time
+
+from inndie import job_status
+from inndie import scheduler
+
+DEFAULT_MIN_FLUSH_INTERVAL = 10.0
+DEFAULT_MAX_BATCH_RECORDS = 10000
+
+# Records whose chunk failed to write are kept for the next flush, up to this many batches. The
+# oldest records beyond that are dropped, so a long outage cannot exhaust memory.
+MAX_UNSENT_BATCHES = 10
+
+
+def encode_chunk(records):
+    """
+    :param records: A list of metrics records.
+    :return: The records as gzip-compressed JSON lines.
+    """
+    lines = "".join(json.dumps(it, separators=(",", ":")) + "\n" for it in records)
+    return gzip.compress(lines.encode("utf-8"))
+
+
+def decode_chunk(body):
+    """
+    :param body: A chunk made by `encode_chunk`.
+    :return: The list of metrics records.
+    """
+    lines = gzip.decompress(body).decode("utf-8").splitlines()
+    return [json.loads(it) for it in lines if len(it) > 0]
+
+
+class MetricsWriter:
+    """
+    Batches structured training metrics in memory and writes them as compressed JSON-lines chunks
+    under `<prefix>/metrics/`, at most once per `min_flush_interval` seconds. After each chunk,
+    `<prefix>/progress.txt` is overwritten with the latest record and a pointer to its chunk.
+    """
+
+    def __init__(self, client, bucket_name, prefix,
+                 min_flush_interval=DEFAULT_MIN_FLUSH_INTERVAL,
+                 max_batch_records=DEFAULT_MAX_BATCH_RECORDS):
+        """
+        :param client: The S3 client to use.
+        :param bucket_name: The S3 bucket name.
+        :param prefix: The job's progress prefix.
+        :param min_flush_interval: The fewest seconds between chunks.
+        :param max_batch_records: The most records held in memory. Reaching it flushes early.
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.min_flush_interval = min_flush_interval
+        self.max_batch_records = max_batch_records
+        self.records = []
+        self.chunks = 0
+        self.next_index = 0
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def chunk_key(self, index):
+        # Keys sort by time and do not collide with chunks written by other processes
+        return "{}/metrics/{:013d}-{:06d}.jsonl.gz".format(self.prefix, int(time.time() * 1000),
+                                                           index)
+
+    def start(self):
+        """
+        Starts a background thread that flushes batched records once they are due, so records
+        are written even while no new ones arrive.
+        """
+        self.thread = threading.Thread(target=self.run, name="inndie-metrics", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(min(1.0, self.min_flush_interval)):
+            try:
+                self.flush_if_due()
+            except Exception as e:
+                print("Failed to write metrics: {}".format(e), file=sys.stderr)
+
+    def record(self, step=None, epoch=None, **metrics):
+        """
+        Adds a metrics record, flushing if a chunk is due.
+
+        :param step: The training step, or `None`.
+        :param epoch: The epoch, or `None`.
+        :param metrics: The metric values, such as `loss=0.1`.
+        """
+        record = {"time": round(time.time(), 3)}
+        if step is not None:
+            record["step"] = step
+        if epoch is not None:
+            record["epoch"] = epoch
+        record.update(metrics)
+        self.add(record)
+
+    def add(self, record):
+        """
+        Adds a metrics record as-is, flushing if a chunk is due.
+
+        :param record: A JSON-serializable dict.
+        """
+        with self.lock:
+            self.records.append(record)
+        self.flush_if_due()
+
+    def is_due(self):
+        with self.lock:
+            return len(self.records) >= self.max_batch_records or \
+                (len(self.records) > 0 and
+                 time.monotonic() - self.last_flush >= self.min_flush_interval)
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def requeue(self, records):
+        """
+        Puts records whose chunk failed to write back at the front of the batch, dropping the
+        oldest records beyond `MAX_UNSENT_BATCHES` batches.
+        """
+        with self.lock:
+            self.records = records + self.records
+            excess = len(self.records) - self.max_batch_records * MAX_UNSENT_BATCHES
+            if excess > 0:
+                del self.records[:excess]
+                self.dropped += excess
+        if excess > 0:
+            print("Dropped {} unsent metrics record(s)".format(excess), file=sys.stderr)
+
+    def flush(self):
+        """
+        Writes every batched record as one chunk, then updates the latest pointer. If the chunk
+        fails to write, its records are batched again before the error is raised.
+
+        :return: The key of the chunk, or `None` if there was nothing to write.
+        """
+        with self.lock:
+            records = self.records
+            self.records = []
+            self.last_flush = time.monotonic()
+            if len(records) == 0:
+                return None
+            index = self.next_index
+            self.next_index += 1
+
+        key = self.chunk_key(index)
+        try:
+            with scheduler.control():
+                self.client.put_object(Body=encode_chunk(records), Bucket=self.bucket_name,
+                                       Key=key, ContentType="application/x-ndjson")
+        except Exception:
+            self.requeue(records)
+            raise
+        with self.lock:
+            self.chunks += 1
+
+        progress_text = json.dumps({"latest": records[-1], "chunk": key}, separators=(",", ":"))
+        with scheduler.control():
+            self.client.put_object(Body=progress_text, Bucket=self.bucket_name,
+                                   Key=self.prefix + "/progress.txt")
+        job_status.update(self.client, self.bucket_name, self.prefix,
+                          progress=job_status.make_progress_field(progress_text, records[-1],
+                                                                  key))
+        return key
+
+    def close(self):
+        """
+        Stops the background thread, if it was started, and writes any records that are still
+        batched.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from inndie import scheduler
+
+BLOB_PREFIX = "inndie-model-blobs/"
+ALIAS_PREFIX = "inndie-model-aliases/"
+MODEL_PREFIX = "inndie-models/"
+
+# The metadata key that records a model object's content hash
+HASH_METADATA = "inndie-content-hash"
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_HASH_WORKERS = 4
+
+settings = {
+    # Whether models are also copied to `inndie-models/<name>`. The copy doubles the storage of
+    # every model, so names are resolved through the alias objects unless readers need it.
+    "named_copies": False
+}
+
+
+def configure(named_copies=None):
+    """
+    Changes the model store settings for this process.
+
+    :param named_copies: Whether to copy each model to `inndie-models/<name>`, or `None` to leave
+    the setting unchanged.
+    """
+    if named_copies is not None:
+        settings["named_copies"] = named_copies
+
+
+def hash_chunk(path, offset, size):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return hashlib.sha256(f.read(size)).digest()
+
+
+def hash_model(path, max_workers=DEFAULT_HASH_WORKERS, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes a model's content hash: the SHA-256 of the SHA-256 digests of its `chunk_size`
+    chunks. The chunks of a large file are hashed in parallel.
+
+    :param path: The model file.
+    :param max_workers: The most chunks to hash at once.
+    :param chunk_size: The size of each chunk. Changing it changes every hash.
+    :return: The hex content hash.
+    """
+    size = os.path.getsize(path)
+    offsets = range(0, max(size, 1), chunk_size)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = list(executor.map(lambda offset: hash_chunk(path, offset, chunk_size),
+                                    offsets))
+    return hashlib.sha256(b"".join(digests)).hexdigest()
+
+
+def get_blob_key(content_hash):
+    return BLOB_PREFIX + content_hash
+
+
+def get_alias_key(name):
+    return ALIAS_PREFIX + name + ".json"
+
+
+def get_model_key(name):
+    return MODEL_PREFIX + name
+
+
+def head_object(client, bucket_name, key):
+    """
+    :return: The `head_object` response, or `None` if the object does not exist.
+    """
+    try:
+        return client.head_object(Bucket=bucket_name, Key=key)
+    except client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+            return None
+        raise
+
+
+def read_alias(client, bucket_name, name):
+    """
+    :return: The model's alias record, or `None` if the model has no alias.
+    """
+    try:
+        body = client.get_object(Bucket=bucket_name, Key=get_alias_key(name))["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+def resolve_model_key(client, bucket_name, name):
+    """
+    :return: The key of the model's content: its blob if the model has an alias, or else
+    `inndie-models/<name>` for models stored before they had aliases.
+    """
+    alias = read_alias(client, bucket_name, name)
+    if alias is None:
+        return get_model_key(name)
+    return alias["blob"]
+
+
+def upload_model(client, bucket_name, path, name, config=None, callback=None):
+    """
+    Uploads a model to the content-addressed store. The content is stored once under its hash,
+    and the upload is skipped if that content is already stored. The name is then pointed at the
+    content with an alias object, which records the hash (and the hash it replaced). If named
+    copies are on, the model is also copied within S3 to `inndie-models/<name>`, which stores it
+    twice.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param path: The model file.
+    :param name: The name of the model.
+    :param config: The TransferConfig, or `None` for boto3's defaults.
+    :param callback: A boto3 transfer callback, or `None`.
+    :return: A tuple of the content hash and the number of bytes uploaded, which is 0 if the
+    content was already stored.
+    """
+    content_hash = hash_model(path)
+    model_key = get_model_key(name)
+
+    old_alias = read_alias(client, bucket_name, name)
+    if old_alias is not None and old_alias["content_hash"] == content_hash:
+        model = head_object(client, bucket_name, model_key) if settings["named_copies"] else None
+        if not settings["named_copies"] or \
+                (model is not None and model.get("Metadata", {}).get(HASH_METADATA) ==
+                 content_hash):
+            # The name already points at this content
+            return content_hash, 0
+
+    blob_key = get_blob_key(content_hash)
+    uploaded = 0
+    if head_object(client, bucket_name, blob_key) is None:
+        client.upload_file(path, bucket_name, blob_key, Config=config,
+                           Callback=scheduler.bulk_callback(callback),
+                           ExtraArgs={"Metadata": {HASH_METADATA: content_hash}})
+        uploaded = os.path.getsize(path)
+
+    if settings["named_copies"]:
+        client.copy({"Bucket": bucket_name, "Key": blob_key}, bucket_name, model_key,
+                    Config=config, ExtraArgs={"Metadata": {HASH_METADATA: content_hash},
+                                              "MetadataDirective": "REPLACE"})
+
+    previous_content_hash = None
+    if old_alias is not None:
+        previous_content_hash = old_alias["content_hash"]
+        if previous_content_hash == content_hash:
+            previous_content_hash = old_alias.get("previous_content_hash")
+    alias = {
+        "name": name,
+        "content_hash": content_hash,
+        "size": os.path.getsize(path),
+        "blob": blob_key,
+        "previous_content_hash": previous_content_hash
+    }
+    client.put_object(Body=json.dumps(alias).encode("utf-8"), Bucket=bucket_name,
+                      Key=get_alias_key(name), ContentType="application/json")
+    return content_hash, uploaded
@@ -0,0 +1,48 @@
+import contextlib
+import functools
+import threading
+
+state = threading.local()
+
+
+def is_silenced():
+    return getattr(state, "silenced", False)
+
+
+def report(*args, **kwargs):
+    """
+    Prints a message for the user, unless output is silenced on this thread. Takes the same
+    arguments as `print`.
+    """
+    if not is_silenced():
+        print(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def silenced():
+    """
+    Silences `report` on this thread while the context is active. Used when INNDiE runs as a
+    library, where results are returned instead of printed.
+    """
+    previous = is_silenced()
+    state.silenced = True
+    try:
+        yield
+    finally:
+        state.silenced = previous
+
+
+def bind(function):
+    """
+    :param function: A function that will run on another thread.
+    :return: The function, wrapped to report with the calling thread's output setting.
+    """
+    if not is_silenced():
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with silenced():
+            return function(*args, **kwargs)
+
+    return wrapper
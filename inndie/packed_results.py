@@ -0,0 +1,187 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from inndie import output
+from inndie import packing
+from inndie import scheduler
+from inndie import transfer
+
+INDEX_NAME = ".inndie-packed-index.json"
+INDEX_VERSION = 1
+
+# Members of a shard that are at most this far apart are read with one ranged GET, since a few
+# wasted bytes cost less than another request
+MAX_RANGE_GAP = 64 * 1024
+MAX_RANGE_SIZE = 8 * transfer.MB
+
+
+def get_index_key(prefix):
+    return prefix + "/" + INDEX_NAME
+
+
+def is_internal_key(prefix, key):
+    """
+    :return: True if the key is a shard or index under the prefix rather than a result file.
+    """
+    return key == get_index_key(prefix) or packing.is_shard_key(prefix, key)
+
+
+def empty_index():
+    return {"version": INDEX_VERSION, "files": {}}
+
+
+def load_index(client, bucket_name, prefix):
+    """
+    :return: The index of the files packed under the prefix, or an empty index if there is none.
+    """
+    try:
+        body = client.get_object(Bucket=bucket_name, Key=get_index_key(prefix))["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return empty_index()
+
+    index = json.loads(body.decode("utf-8"))
+    if index.get("version") != INDEX_VERSION:
+        return empty_index()
+    return index
+
+
+def save_index(client, bucket_name, prefix, index, old_index):
+    """
+    Writes the index, then deletes the shards that only the old index referred to.
+
+    :param index: The new index.
+    :param old_index: The index it replaces.
+    """
+    client.put_object(Body=json.dumps(index).encode("utf-8"), Bucket=bucket_name,
+                      Key=get_index_key(prefix), ContentType="application/json")
+    packing.delete_unused_shards(client, bucket_name, old_index["files"], index["files"])
+
+
+def upload_shards(client, bucket_name, prefix, shards, max_workers=transfer.DEFAULT_MAX_WORKERS):
+    """
+    Uploads shards of small files in parallel. Each shard is a tar archive streamed from the
+    files as it is uploaded, so it is never staged in memory or on disk.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param prefix: The prefix to put the shards under.
+    :param shards: The shards from `packing.plan_shards`.
+    :param max_workers: The most shards to upload at once.
+    :return: A tuple of the index entries of the packed files, keyed by relative path, and the
+    `TransferSummary`. A failed shard fails each file in it.
+    """
+    batch = packing.new_shard_batch()
+
+    entries = {}
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for index, members in enumerate(shards):
+            key = packing.get_shard_key(prefix, batch, index)
+            futures[executor.submit(packing.upload_shard, client, bucket_name, key, members)] = \
+                (key, members)
+
+        for future in as_completed(futures):
+            key, members = futures[future]
+            try:
+                shard_entries = future.result()
+            except Exception as e:
+                summary.failures += [(path, key, e) for path, _ in members]
+                continue
+
+            entries.update(shard_entries)
+            summary.transferred += [(path, key) for path, _ in members]
+            summary.files += len(members)
+            summary.bytes += sum(it["size"] for it in shard_entries.values())
+            output.report("Uploaded {} packed file(s) to: {}\n".format(len(members), key))
+
+    summary.seconds = time.monotonic() - start
+    return entries, summary
+
+
+def plan_ranges(entries, max_gap=MAX_RANGE_GAP, max_size=MAX_RANGE_SIZE):
+    """
+    Groups packed files into ranged GETs. Files of the same shard that lie close together are
+    read with one GET.
+
+    :param entries: A dict of relative path to index entry.
+    :param max_gap: The most unwanted bytes read between two files of one GET.
+    :param max_size: The most bytes read by one GET, unless a single file is larger.
+    :return: A list of `(shard, start, end, members)` tuples, where `end` is exclusive and
+    `members` is a list of `(relative_path, entry)` tuples.
+    """
+    by_shard = {}
+    for relative_path, entry in entries.items():
+        by_shard.setdefault(entry["shard"], []).append((relative_path, entry))
+
+    ranges = []
+    for shard, members in sorted(by_shard.items()):
+        members.sort(key=lambda it: it[1]["offset"])
+        current = None
+        for relative_path, entry in members:
+            end = entry["offset"] + entry["size"]
+            if current is not None and entry["offset"] - current[2] <= max_gap and \
+                    end - current[1] <= max_size:
+                current[2] = max(current[2], end)
+                current[3].append((relative_path, entry))
+            else:
+                current = [shard, entry["offset"], end, [(relative_path, entry)]]
+                ranges.append(current)
+
+    return [tuple(it) for it in ranges]
+
+
+def fetch_range(client, bucket_name, shard, start, end, members, root):
+    """
+    Reads part of a shard with a ranged GET and writes the files in it into place.
+
+    :return: The number of bytes written.
+    """
+    data = b""
+    if end > start:
+        data = client.get_object(Bucket=bucket_name, Key=shard,
+                                 Range="bytes={}-{}".format(start, end - 1))["Body"].read()
+    scheduler.throttle(len(data))
+
+    written = 0
+    for relative_path, entry in members:
+        path = packing.get_safe_path(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data[entry["offset"] - start:entry["offset"] - start + entry["size"]])
+        written += entry["size"]
+    return written
+
+
+def fetch_files(client, bucket_name, entries, root, max_workers=transfer.DEFAULT_MAX_WORKERS):
+    """
+    Downloads packed files with ranged GETs of their shards, so only the bytes of the wanted files
+    (and small gaps between them) are read.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param entries: A dict of relative path to index entry, for the files to download.
+    :param root: The directory to download into.
+    :param max_workers: The most ranged GETs to send at once.
+    :return: The `TransferSummary`.
+    """
+    summary = transfer.TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_range, client, bucket_name, *it, root): it
+                   for it in plan_ranges(entries)}
+        for future in as_completed(futures):
+            shard, _, _, members = futures[future]
+            try:
+                summary.bytes += future.result()
+            except Exception as e:
+                summary.failures += [(relative_path, shard, e) for relative_path, _ in members]
+                continue
+            summary.files += len(members)
+            summary.transferred += [(relative_path, shard) for relative_path, _ in members]
+
+    summary.seconds = time.monotonic() - start
+    return summary
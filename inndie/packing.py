@@ -0,0 +1,204 @@
+import os
+import stat
+import tarfile
+import time
+import uuid
+
+from inndie import scheduler
+
+DEFAULT_SMALL_FILE_THRESHOLD = 1024 * 1024
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+SHARD_DIR = ".inndie-shards"
+
+READ_SIZE = 1024 * 1024
+
+
+def plan_shards(files, small_file_threshold=DEFAULT_SMALL_FILE_THRESHOLD,
+                shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Splits files into the ones that are transferred as their own objects and groups of small
+    files that are packed together into shards.
+
+    :param files: A list of `(path, relative_path)` tuples.
+    :param small_file_threshold: Files smaller than this are packed.
+    :param shard_size: The most file bytes put in one shard.
+    :return: A tuple of the list of `(path, relative_path)` tuples to transfer on their own and a
+    list of shards, each a list of `(path, relative_path)` tuples.
+    """
+    large_files = []
+    shards = []
+    current = []
+    current_size = 0
+    for path, relative_path in files:
+        size = os.path.getsize(path)
+        if size >= small_file_threshold:
+            large_files.append((path, relative_path))
+            continue
+
+        if len(current) > 0 and current_size + size > shard_size:
+            shards.append(current)
+            current = []
+            current_size = 0
+        current.append((path, relative_path))
+        current_size += size
+
+    if len(current) > 0:
+        shards.append(current)
+
+    return large_files, shards
+
+
+class ShardReader:
+    """
+    A readable stream of an uncompressed tar archive of files, generated as it is read. A shard
+    can be uploaded from it without building the archive in memory or on disk.
+
+    Once the stream is read to the end, `index` maps each relative path to
+    `{"offset": ..., "size": ...}`, where `offset` is where the file's data starts in the archive.
+    The index allows reading a single member with a ranged GET.
+    """
+
+    def __init__(self, members):
+        """
+        :param members: A list of `(path, relative_path)` tuples.
+        """
+        self.index = {}
+        self.offset = 0
+        self.buffer = bytearray()
+        self.pieces = self.generate(members)
+
+    def generate(self, members):
+        for path, relative_path in members:
+            st = os.stat(path)
+            info = tarfile.TarInfo(relative_path)
+            info.size = st.st_size
+            info.mtime = int(st.st_mtime)
+            info.mode = stat.S_IMODE(st.st_mode)
+            header = info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+            yield header
+            # The data directly follows the member's header(s) and is padded to whole blocks
+            self.index[relative_path] = {"offset": self.offset, "size": info.size}
+
+            remaining = info.size
+            with open(path, "rb") as f:
+                while remaining > 0:
+                    chunk = f.read(min(READ_SIZE, remaining))
+                    if len(chunk) == 0:
+                        raise ValueError("{} changed while it was packed".format(path))
+                    remaining -= len(chunk)
+                    yield chunk
+
+            if info.size % tarfile.BLOCKSIZE != 0:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+
+        # The end-of-archive marker, padded to a whole record like tarfile does
+        end = self.offset + 2 * tarfile.BLOCKSIZE
+        yield tarfile.NUL * (-(-end // tarfile.RECORDSIZE) * tarfile.RECORDSIZE - self.offset)
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            piece = next(self.pieces, None)
+            if piece is None:
+                break
+            self.offset += len(piece)
+            self.buffer += piece
+
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def new_shard_batch():
+    """
+    :return: A name for the shards of one upload. Every upload writes new shards, so a reader
+    that holds the previous manifest or index never reads a shard that changed under it.
+    """
+    return "{:013d}-{}".format(int(time.time() * 1000), uuid.uuid4().hex[:8])
+
+
+def get_shard_key(prefix, batch, number):
+    """
+    :param prefix: The prefix the shards are under.
+    :param batch: The name from `new_shard_batch`.
+    :param number: The number of the shard within the upload.
+    """
+    return "{}/{}/{}-{:06d}.tar".format(prefix, SHARD_DIR, batch, number)
+
+
+def is_shard_key(prefix, key):
+    return key.startswith(prefix + "/" + SHARD_DIR + "/")
+
+
+def upload_shard(client, bucket_name, key, members):
+    """
+    Uploads a shard while it is generated from the files, so it is never staged in memory or on
+    disk.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param key: The key of the shard.
+    :param members: A list of `(path, relative_path)` tuples.
+    :return: A dict of relative path to `{"shard": ..., "offset": ..., "size": ...}`.
+    """
+    reader = ShardReader(members)
+    client.upload_fileobj(reader, bucket_name, key, Callback=scheduler.bulk_callback())
+    return {relative_path: dict(it, shard=key) for relative_path, it in reader.index.items()}
+
+
+def delete_unused_shards(client, bucket_name, old_entries, entries):
+    """
+    Deletes the shards that only the old manifest or index referred to. Call it after the new
+    one is written.
+
+    :param old_entries: The file entries of the old manifest or index.
+    :param entries: The file entries of the new one.
+    """
+    used = set(it["shard"] for it in entries.values() if "shard" in it)
+    unused = sorted(set(it["shard"] for it in old_entries.values() if "shard" in it) - used)
+    for start in range(0, len(unused), 1000):
+        client.delete_objects(Bucket=bucket_name, Delete={
+            "Objects": [{"Key": key} for key in unused[start:start + 1000]], "Quiet": True})
+
+
+def get_safe_path(root, relative_path):
+    """
+    :param root: The directory files are written under.
+    :param relative_path: A `/`-separated path from a manifest or archive.
+    :return: The local path. Raises a `ValueError` if the path would escape `root`.
+    """
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, *relative_path.split("/")))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("Refusing to write outside of {}: {}".format(root, relative_path))
+    return path
+
+
+def extract_shard_stream(stream, root, wanted=None):
+    """
+    Writes the members of a tar shard into place while it is read, without saving the shard.
+
+    :param stream: A readable binary stream of the shard, such as a `get_object` body.
+    :param root: The directory to write the members under.
+    :param wanted: A set of relative paths to write, or `None` to write every member.
+    :return: A tuple of the number of files and bytes written.
+    """
+    files = 0
+    written = 0
+    with tarfile.open(fileobj=stream, mode="r|") as tar:
+        for info in tar:
+            if not info.isfile() or (wanted is not None and info.name not in wanted):
+                continue
+
+            path = get_safe_path(root, info.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                source = tar.extractfile(info)
+                for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                    f.write(chunk)
+            files += 1
+            written += info.size
+
+    return files, written
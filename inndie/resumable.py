@@ -0,0 +1,392 @@
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from inndie import compression
+from inndie import scheduler
+from inndie import transfer
+from inndie.errors import InndieError
+from inndie.local_state import get_cache_dir, read_json, write_json
+
+# The metadata key that records the part size of a multipart upload, so that a download can
+# recompute the object's ETag
+PART_SIZE_METADATA = "inndie-part-size"
+
+# The metadata key that records the SHA-256 of an object's content. S3 does not use MD5s in the
+# ETags of objects encrypted with SSE-KMS or SSE-C, so those are checked against this instead.
+SHA256_METADATA = "inndie-sha256"
+
+PARTIAL_SUFFIX = ".inndie-partial"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# S3 rejects multipart uploads with more parts than this
+MAX_PARTS = 10000
+
+
+class IntegrityError(InndieError):
+    """
+    Raised when a transferred file does not match the object's ETag or SHA-256.
+    """
+
+
+def get_state_file(direction, bucket_name, key, path):
+    """
+    :return: The file that records the progress of one transfer. It is keyed by the bucket, key
+    and local path, so rerunning the same command finds it.
+    """
+    name = "{}/{}/{}".format(bucket_name, key, os.path.abspath(path))
+    return os.path.join(get_cache_dir(), "resumable", "{}-{}.json".format(
+        direction, hashlib.sha256(name.encode("utf-8")).hexdigest()))
+
+
+def remove_state(state_file):
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+def get_parts(size, part_size):
+    """
+    :return: A list of `(part_number, offset, length)` tuples covering `size` bytes.
+    """
+    return [(index + 1, offset, min(part_size, size - offset))
+            for index, offset in enumerate(range(0, size, part_size))]
+
+
+def choose_part_size(size, part_size):
+    """
+    :return: The part size to upload a file of `size` bytes with: `part_size`, or larger if the
+    file would otherwise need more than `MAX_PARTS` parts.
+    """
+    return max(part_size, -(-size // MAX_PARTS))
+
+
+def make_bulk_callback(callback, max_bandwidth):
+    """
+    :param callback: A boto3 transfer callback, or `None`.
+    :param max_bandwidth: The most bytes per second for the transfer, or `None` for no limit.
+    :return: A boto3 transfer callback that throttles the transfer.
+    """
+    throttled_callback = scheduler.bulk_callback(callback)
+    if max_bandwidth is None:
+        return throttled_callback
+    return transfer.RateLimiter(max_bandwidth).wrap(throttled_callback)
+
+
+def wait_for_all(futures):
+    """
+    Waits for every future, cancelling the ones that have not started if any of them fails, so
+    an interrupted transfer stops instead of sending the rest of its parts first.
+    """
+    try:
+        for future in futures:
+            future.result()
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def read_range(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def md5_range(path, offset, length):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            block = f.read(min(HASH_BLOCK_SIZE, length))
+            if len(block) == 0:
+                break
+            md5.update(block)
+            length -= len(block)
+    return md5.digest()
+
+
+def sha256_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def has_md5_etag(response):
+    """
+    :param response: A HEAD, GET or upload response.
+    :return: True if the object's ETag is made from MD5s of its content, which is not the case
+    for objects encrypted with SSE-KMS or SSE-C.
+    """
+    return response.get("ServerSideEncryption") != "aws:kms" and \
+        "SSECustomerAlgorithm" not in response
+
+
+def compute_etag(path, part_size=None):
+    """
+    :param path: The file.
+    :param part_size: The part size of a multipart upload, or `None` for a single-part upload.
+    :return: The ETag S3 gives the file's content, without quotes. This holds for objects that
+    are not encrypted with SSE-KMS or SSE-C.
+    """
+    size = os.path.getsize(path)
+    if part_size is None:
+        return md5_range(path, 0, size).hex()
+
+    digests = [md5_range(path, offset, length) for _, offset, length in get_parts(size, part_size)]
+    return "{}-{}".format(hashlib.md5(b"".join(digests)).hexdigest(), len(digests))
+
+
+def guess_part_size(size, etag, metadata):
+    """
+    :return: The part size a multipart object was uploaded with, or `None` if it is unknown. It
+    is read from the object's metadata, or else matched against the part sizes of the transfer
+    profiles.
+    """
+    if PART_SIZE_METADATA in metadata:
+        return int(metadata[PART_SIZE_METADATA])
+
+    parts = int(etag.rsplit("-", 1)[1])
+    for part_size in sorted(set(choose_part_size(size, it["multipart_chunksize"])
+                                for it in transfer.TRANSFER_PROFILES.values())):
+        if len(get_parts(size, part_size)) == parts:
+            return part_size
+    return None
+
+
+def verify_file(path, etag, metadata=None, md5_etag=True):
+    """
+    Checks a downloaded file against the object's ETag, or against the SHA-256 in its metadata
+    if the ETag is not made from MD5s. Raises an `IntegrityError` if it does not match.
+
+    :param path: The file.
+    :param etag: The object's ETag.
+    :param metadata: The object's metadata, or `None`.
+    :param md5_etag: The result of `has_md5_etag` for the object.
+    :return: True if the file was checked, or False if neither could be checked.
+    """
+    metadata = metadata or {}
+    if not md5_etag:
+        if SHA256_METADATA not in metadata:
+            return False
+        actual = sha256_file(path)
+        if actual != metadata[SHA256_METADATA]:
+            raise IntegrityError("{} does not match its object: expected SHA-256 {} but got {}"
+                                 .format(path, metadata[SHA256_METADATA], actual))
+        return True
+
+    etag = etag.strip('"')
+    part_size = None
+    if "-" in etag:
+        part_size = guess_part_size(os.path.getsize(path), etag, metadata)
+        if part_size is None:
+            return False
+
+    actual = compute_etag(path, part_size)
+    if actual != etag:
+        raise IntegrityError("{} does not match its object: expected ETag {} but got {}".format(
+            path, etag, actual))
+    return True
+
+
+def list_uploaded_parts(client, bucket_name, key, upload_id):
+    """
+    :return: A dict of part number to ETag, or `None` if the upload no longer exists.
+    """
+    parts = {}
+    try:
+        for page in client.get_paginator("list_parts").paginate(Bucket=bucket_name, Key=key,
+                                                                UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"].strip('"')
+    except client.exceptions.NoSuchUpload:
+        return None
+    return parts
+
+
+def upload_file(client, bucket_name, path, key, part_size=transfer.MB * 8,
+                max_workers=transfer.DEFAULT_MAX_WORKERS, callback=None, max_bandwidth=None):
+    """
+    Uploads a file as a multipart upload whose progress is saved locally. If the upload is
+    interrupted, running it again sends only the parts S3 does not have yet. Parts that S3 has
+    are checked against the local file, and the completed object is checked against the file's
+    ETag unless the bucket encrypts it with SSE-KMS. The file's SHA-256 is stored in the object's
+    metadata so that downloads of encrypted objects can be checked.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param path: The file.
+    :param key: The key of the object.
+    :param part_size: The size of each part. Files smaller than this are uploaded in one request.
+    It is raised for files that would need more than `MAX_PARTS` parts.
+    :param max_workers: The most parts to upload at once.
+    :param callback: A boto3 transfer callback, or `None`.
+    :param max_bandwidth: The most bytes per second to upload, or `None` for no limit.
+    :return: The number of bytes in the file.
+    """
+    size = os.path.getsize(path)
+    # Parts that S3 already has are reported to `callback` but do not count against the
+    # bandwidth
+    throttled_callback = make_bulk_callback(callback, max_bandwidth)
+    codec = compression.choose_codec(path)
+    if codec is not None:
+        # A compressed stream cannot be resumed part by part, so it is uploaded in one go
+        compression.upload_file(client, bucket_name, path, key, codec,
+                                callback=throttled_callback)
+        return size
+    if size < part_size:
+        client.upload_file(path, bucket_name, key, Callback=throttled_callback,
+                           ExtraArgs={"Metadata": {SHA256_METADATA: sha256_file(path)}})
+        return size
+
+    # The part size is saved in the state and the object's metadata, so a resumed upload and a
+    # download of the object use the same parts
+    part_size = choose_part_size(size, part_size)
+    state_file = get_state_file("upload", bucket_name, key, path)
+    identity = {"size": size, "mtime": os.path.getmtime(path), "part_size": part_size}
+    state = read_json(state_file, None)
+    uploaded = None
+    if state is not None:
+        if all(state.get(name) == value for name, value in identity.items()):
+            uploaded = list_uploaded_parts(client, bucket_name, key, state["upload_id"])
+        else:
+            # The file changed since the upload started, so its parts are useless
+            try:
+                client.abort_multipart_upload(Bucket=bucket_name, Key=key,
+                                              UploadId=state["upload_id"])
+            except client.exceptions.NoSuchUpload:
+                pass
+
+    if uploaded is None:
+        upload_id = client.create_multipart_upload(
+            Bucket=bucket_name, Key=key,
+            Metadata={PART_SIZE_METADATA: str(part_size),
+                      SHA256_METADATA: sha256_file(path)})["UploadId"]
+        state = dict(identity, upload_id=upload_id)
+        write_json(state_file, state)
+        uploaded = {}
+
+    upload_id = state["upload_id"]
+    parts = get_parts(size, part_size)
+    digests = {}
+    lock = threading.Lock()
+
+    def upload_part(part_number, offset, length):
+        if part_number in uploaded:
+            digest = md5_range(path, offset, length)
+            if digest.hex() == uploaded[part_number]:
+                digests[part_number] = digest
+                if callback is not None:
+                    callback(length)
+                return
+
+        body = read_range(path, offset, length)
+        digest = hashlib.md5(body).digest()
+        client.upload_part(Body=body, Bucket=bucket_name, Key=key, UploadId=upload_id,
+                           PartNumber=part_number,
+                           ContentMD5=base64.b64encode(digest).decode("ascii"))
+        with lock:
+            digests[part_number] = digest
+        throttled_callback(length)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        wait_for_all([executor.submit(upload_part, *it) for it in parts])
+
+    response = client.complete_multipart_upload(
+        Bucket=bucket_name, Key=key, UploadId=upload_id,
+        MultipartUpload={"Parts": [{"PartNumber": number, "ETag": digests[number].hex()}
+                                   for number, _, _ in parts]})
+    remove_state(state_file)
+
+    expected = "{}-{}".format(hashlib.md5(b"".join(digests[number] for number, _, _ in parts))
+                              .hexdigest(), len(parts))
+    if has_md5_etag(response) and response["ETag"].strip('"') != expected:
+        raise IntegrityError("Uploaded {} does not match {}: expected ETag {} but got {}".format(
+            key, path, expected, response["ETag"]))
+    return size
+
+
+def download_file(client, bucket_name, key, path, part_size=transfer.MB * 8,
+                  max_workers=transfer.DEFAULT_MAX_WORKERS, callback=None, max_bandwidth=None):
+    """
+    Downloads an object with ranged GETs into a partial file next to `path`, saving which ranges
+    are done. If the download is interrupted, running it again fetches only the missing ranges,
+    as long as the object has not changed. The finished file is checked against the object's
+    ETag, or its SHA-256 if the object is encrypted with SSE-KMS or SSE-C, before it is moved
+    into place. An object that was uploaded compressed is decompressed
+    into place after it is checked.
+
+    :param client: The S3 client to use.
+    :param bucket_name: The S3 bucket name.
+    :param key: The key of the object.
+    :param path: The file to download to.
+    :param part_size: The size of each ranged GET.
+    :param max_workers: The most ranges to download at once.
+    :param callback: A boto3 transfer callback, or `None`.
+    :param max_bandwidth: The most bytes per second to download, or `None` for no limit.
+    :return: The number of bytes in the downloaded file.
+    """
+    head = client.head_object(Bucket=bucket_name, Key=key)
+    size = head["ContentLength"]
+    etag = head["ETag"]
+    partial_path = path + PARTIAL_SUFFIX
+    state_file = get_state_file("download", bucket_name, key, path)
+    identity = {"etag": etag, "size": size, "part_size": part_size}
+
+    state = read_json(state_file, None)
+    if state is None or any(state.get(name) != value for name, value in identity.items()) or \
+            not os.path.exists(partial_path) or os.path.getsize(partial_path) != size:
+        with open(partial_path, "wb") as f:
+            f.truncate(size)
+        state = dict(identity, done=[])
+        write_json(state_file, state)
+
+    done = set(state["done"])
+    lock = threading.Lock()
+    throttled_callback = make_bulk_callback(callback, max_bandwidth)
+
+    def download_part(part_number, offset, length):
+        if part_number in done:
+            if callback is not None:
+                callback(length)
+            return
+
+        body = client.get_object(Bucket=bucket_name, Key=key, IfMatch=etag,
+                                 Range="bytes={}-{}".format(offset, offset + length - 1))["Body"]
+        try:
+            with open(partial_path, "r+b") as f:
+                f.seek(offset)
+                for chunk in iter(lambda: body.read(HASH_BLOCK_SIZE), b""):
+                    f.write(chunk)
+                    throttled_callback(len(chunk))
+        finally:
+            body.close()
+
+        with lock:
+            state["done"].append(part_number)
+            write_json(state_file, state)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        wait_for_all([executor.submit(download_part, *it) for it in get_parts(size, part_size)])
+
+    try:
+        verify_file(partial_path, etag, head.get("Metadata"), has_md5_etag(head))
+    except IntegrityError:
+        # Start over next time instead of resuming a corrupt file
+        remove_state(state_file)
+        os.remove(partial_path)
+        raise
+
+    codec = compression.get_codec(head.get("Metadata"))
+    if codec is not None:
+        with open(partial_path, "rb") as f:
+            compression.decompress_stream(f, path, codec)
+        os.remove(partial_path)
+    else:
+        os.replace(partial_path, path)
+    remove_state(state_file)
+    return os.path.getsize(path)
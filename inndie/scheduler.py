@@ -0,0 +1,189 @@
+import contextlib
+import threading
+import time
+
+DEFAULT_CONTROL_CONNECTIONS = 2
+
+# The longest a bulk transfer pauses at once to let control-plane writes through, so a steady
+# stream of control writes cannot starve bulk transfers
+MAX_YIELD_SECONDS = 0.5
+
+
+class TransferScheduler:
+    """
+    Shares the network between control-plane writes (progress, heartbeats, logs and metrics) and
+    bulk transfers (models, datasets and results) in this process.
+
+    Control-plane writes use their own S3 client with a small reserved connection pool and take
+    one of `control_connections` slots. While any control-plane write is waiting or in flight,
+    bulk transfers pause between chunks, so a heartbeat never queues behind gigabytes of parts.
+    Bulk transfers together are limited to `bulk_bandwidth` bytes per second, if it is set.
+    """
+
+    def __init__(self, control_connections=DEFAULT_CONTROL_CONNECTIONS, bulk_bandwidth=None):
+        """
+        :param control_connections: The most control-plane writes in flight at once.
+        :param bulk_bandwidth: The bytes per second shared by every bulk transfer, or `None` for
+        no limit.
+        """
+        self.control_connections = control_connections
+        self.bulk_bandwidth = bulk_bandwidth
+        self.condition = threading.Condition()
+        self.control_active = 0
+        self.control_waiting = 0
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.stats = {
+            "control_operations": 0,
+            "control_max_queue_depth": 0,
+            "control_wait_seconds": 0.0,
+            "control_max_wait_seconds": 0.0,
+            "bulk_bytes": 0,
+            "bulk_yield_seconds": 0.0,
+            "bulk_throttle_seconds": 0.0
+        }
+
+    def configure(self, control_connections=None, bulk_bandwidth=None):
+        """
+        :param control_connections: The most control-plane writes in flight at once, or `None`
+        to leave the setting unchanged.
+        :param bulk_bandwidth: The bytes per second shared by every bulk transfer, or `None` to
+        leave the setting unchanged. 0 removes the limit.
+        """
+        with self.condition:
+            if control_connections is not None:
+                self.control_connections = control_connections
+            if bulk_bandwidth is not None:
+                self.bulk_bandwidth = bulk_bandwidth or None
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def control(self):
+        """
+        Runs a control-plane write in one of the reserved slots.
+        """
+        start = time.monotonic()
+        with self.condition:
+            self.control_waiting += 1
+            self.stats["control_max_queue_depth"] = max(self.stats["control_max_queue_depth"],
+                                                        self.control_waiting)
+            while self.control_active >= self.control_connections:
+                self.condition.wait()
+            self.control_waiting -= 1
+            self.control_active += 1
+
+            waited = time.monotonic() - start
+            self.stats["control_operations"] += 1
+            self.stats["control_wait_seconds"] += waited
+            self.stats["control_max_wait_seconds"] = max(self.stats["control_max_wait_seconds"],
+                                                         waited)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.control_active -= 1
+                self.condition.notify_all()
+
+    def throttle(self, byte_count):
+        """
+        Called by bulk transfers after each chunk. Pauses while control-plane writes are pending
+        and to keep bulk transfers within their bandwidth.
+
+        :param byte_count: The number of bytes the transfer just sent or received.
+        """
+        start = time.monotonic()
+        delay = 0.0
+        with self.condition:
+            deadline = start + MAX_YIELD_SECONDS
+            while self.control_active + self.control_waiting > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            yielded = time.monotonic() - start
+
+            if self.bulk_bandwidth is not None:
+                now = time.monotonic()
+                # Allow bursts of up to one second of bandwidth
+                self.tokens = min(float(self.bulk_bandwidth),
+                                  self.tokens + (now - self.last_refill) * self.bulk_bandwidth)
+                self.last_refill = now
+                self.tokens -= byte_count
+                if self.tokens < 0:
+                    delay = -self.tokens / self.bulk_bandwidth
+
+            self.stats["bulk_bytes"] += byte_count
+            self.stats["bulk_yield_seconds"] += yielded
+            self.stats["bulk_throttle_seconds"] += delay
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def bulk_callback(self, callback=None):
+        """
+        :param callback: A boto3 transfer callback to call too, or `None`.
+        :return: A boto3 transfer callback that throttles the transfer.
+        """
+        def throttled(byte_count):
+            self.throttle(byte_count)
+            if callback is not None:
+                callback(byte_count)
+
+        return throttled
+
+    def get_stats(self):
+        """
+        :return: A dict of statistics, including the current control-plane queue depth.
+        """
+        with self.condition:
+            stats = dict(self.stats)
+            stats["control_queue_depth"] = self.control_waiting
+            return stats
+
+    def format_stats(self):
+        stats = self.get_stats()
+        operations = stats["control_operations"]
+        average = stats["control_wait_seconds"] / operations if operations > 0 else 0.0
+        return "\n".join([
+            "Control-plane writes: {} (queue depth {}, max {}; wait avg {:.3f}s, max {:.3f}s)"
+            .format(operations, stats["control_queue_depth"], stats["control_max_queue_depth"],
+                    average, stats["control_max_wait_seconds"]),
+            "Bulk transfers: {} bytes (paused {:.2f}s for control-plane writes, {:.2f}s for the "
+            "bandwidth limit)".format(stats["bulk_bytes"], stats["bulk_yield_seconds"],
+                                      stats["bulk_throttle_seconds"])
+        ])
+
+
+# The scheduler shared by every operation in this process
+_scheduler = TransferScheduler()
+
+
+def configure(control_connections=None, bulk_bandwidth=None):
+    """
+    Changes the settings of the shared scheduler. See `TransferScheduler.configure`.
+    """
+    _scheduler.configure(control_connections, bulk_bandwidth)
+
+
+def control():
+    """
+    :return: A context manager that runs a control-plane write in one of the shared scheduler's
+    reserved slots.
+    """
+    return _scheduler.control()
+
+
+def throttle(byte_count):
+    _scheduler.throttle(byte_count)
+
+
+def bulk_callback(callback=None):
+    return _scheduler.bulk_callback(callback)
+
+
+def get_stats():
+    return _scheduler.get_stats()
+
+
+def format_stats():
+    return _scheduler.format_stats()
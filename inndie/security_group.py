@@ -0,0 +1,106 @@
+# The lists in an IpPermission and the field that holds the source or destination in each
+SOURCE_FIELDS = [
+    ("IpRanges", "CidrIp"),
+    ("Ipv6Ranges", "CidrIpv6"),
+    ("PrefixListIds", "PrefixListId"),
+    ("UserIdGroupPairs", "GroupId")
+]
+
+
+def get_ports(permission):
+    """
+    :param permission: An IpPermission.
+    :return: The `(FromPort, ToPort)` of the permission. Ports do not apply to all-protocol rules,
+    so AWS omits them when describing such a rule; they are `None` in that case.
+    """
+    if permission["IpProtocol"] == "-1":
+        return None, None
+    return permission.get("FromPort"), permission.get("ToPort")
+
+
+def expand_permissions(permissions):
+    """
+    Splits IpPermissions into one rule per source or destination so that sets of rules can be
+    compared. Descriptions are ignored.
+
+    :param permissions: A list of IpPermissions.
+    :return: A set of `(IpProtocol, FromPort, ToPort, list_field, value)` tuples.
+    """
+    rules = set()
+    for permission in permissions:
+        from_port, to_port = get_ports(permission)
+        for list_field, value_field in SOURCE_FIELDS:
+            for it in permission.get(list_field, []):
+                rules.add((permission["IpProtocol"], from_port, to_port, list_field,
+                           it[value_field]))
+    return rules
+
+
+def collapse_rules(rules):
+    """
+    The inverse of `expand_permissions`. Rules with the same protocol and ports are merged.
+
+    :param rules: A set of rules.
+    :return: A list of IpPermissions.
+    """
+    permissions = {}
+    for protocol, from_port, to_port, list_field, value in sorted(rules, key=str):
+        key = (protocol, from_port, to_port)
+        if key not in permissions:
+            permission = {"IpProtocol": protocol}
+            if from_port is not None:
+                permission["FromPort"] = from_port
+            if to_port is not None:
+                permission["ToPort"] = to_port
+            permissions[key] = permission
+
+        value_field = dict(SOURCE_FIELDS)[list_field]
+        permissions[key].setdefault(list_field, []).append({value_field: value})
+
+    return list(permissions.values())
+
+
+class GressPlan:
+    """
+    The changes needed to make a SecurityGroup's rules match the desired rules.
+    """
+
+    def __init__(self, current_ingress, current_egress, desired_ingress, desired_egress):
+        """
+        :param current_ingress: The SecurityGroup's IpPermissions.
+        :param current_egress: The SecurityGroup's IpPermissionsEgress.
+        :param desired_ingress: The IpPermissions the SecurityGroup should have.
+        :param desired_egress: The IpPermissionsEgress the SecurityGroup should have.
+        """
+        current_ingress = expand_permissions(current_ingress)
+        current_egress = expand_permissions(current_egress)
+        desired_ingress = expand_permissions(desired_ingress)
+        desired_egress = expand_permissions(desired_egress)
+        self.revoke_ingress = current_ingress - desired_ingress
+        self.authorize_ingress = desired_ingress - current_ingress
+        self.revoke_egress = current_egress - desired_egress
+        self.authorize_egress = desired_egress - current_egress
+
+    def is_empty(self):
+        return len(self.revoke_ingress) == 0 and len(self.authorize_ingress) == 0 and \
+            len(self.revoke_egress) == 0 and len(self.authorize_egress) == 0
+
+    def format(self):
+        """
+        :return: One line per rule change, or a line saying nothing has drifted.
+        """
+        if self.is_empty():
+            return "No changes needed."
+
+        lines = []
+        for action, rules in [("revoke ingress", self.revoke_ingress),
+                              ("authorize ingress", self.authorize_ingress),
+                              ("revoke egress", self.revoke_egress),
+                              ("authorize egress", self.authorize_egress)]:
+            for protocol, from_port, to_port, _, value in sorted(rules, key=str):
+                if protocol == "-1":
+                    ports = "all traffic"
+                else:
+                    ports = "{} {}-{}".format(protocol, from_port, to_port)
+                lines.append("{}: {} {}".format(action, ports, value))
+        return "\n".join(lines)
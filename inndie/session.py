@@ -0,0 +1,162 @@
+import os
+import threading
+
+from inndie import tracing
+
+# botocore's own default. Raise it when running many transfers in parallel.
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+# The connections reserved for control-plane writes, which use their own clients
+DEFAULT_CONTROL_POOL_CONNECTIONS = 2
+
+settings = {
+    "max_pool_connections": DEFAULT_MAX_POOL_CONNECTIONS,
+    "control_pool_connections": DEFAULT_CONTROL_POOL_CONNECTIONS,
+    # Lets every client talk to a local stand-in for AWS, such as moto server
+    "endpoint_url": os.environ.get("INNDIE_ENDPOINT_URL") or None
+}
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_generation = 0
+_local = threading.local()
+_api_call_counts = {}
+
+
+def configure(max_pool_connections=None, control_pool_connections=None):
+    """
+    Changes the session settings for this process. Only the clients whose pool size no longer
+    matches a setting are dropped, so the others keep their warm connections. Resources are
+    checked the same way when they are next used.
+
+    :param max_pool_connections: The size of each client's connection pool, or `None` to leave
+    the setting unchanged.
+    :param control_pool_connections: The size of each control-plane client's connection pool, or
+    `None` to leave the setting unchanged.
+    """
+    with _lock:
+        for control, name, value in [(False, "max_pool_connections", max_pool_connections),
+                                     (True, "control_pool_connections",
+                                      control_pool_connections)]:
+            if value is None or value == settings[name]:
+                continue
+            settings[name] = value
+            for key, client in list(_clients.items()):
+                if key[2] == control and client.meta.config.max_pool_connections != value:
+                    del _clients[key]
+
+
+def ensure_max_pool_connections(max_pool_connections):
+    """
+    Grows the connection pool so that it can serve at least this many concurrent requests.
+
+    :param max_pool_connections: The minimum pool size.
+    """
+    if max_pool_connections > settings["max_pool_connections"]:
+        configure(max_pool_connections=max_pool_connections)
+
+
+def reset():
+    """
+    Drops the session and every client and resource made from it.
+    """
+    global _session, _generation
+    with _lock:
+        _session = None
+        _clients.clear()
+        # Resources live in thread-locals, so each thread drops its own on next use
+        _generation += 1
+
+
+def get_session():
+    """
+    :return: The boto3 session shared by every operation in this process.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            # boto3 takes a while to import, so it is only imported once a command needs AWS
+            import boto3.session
+            _session = boto3.session.Session()
+            _session.events.register("before-call", count_api_call)
+            tracing.register(_session.events)
+        return _session
+
+
+def count_api_call(event_name, **kwargs):
+    """
+    Counts an API call. Registered for botocore's `before-call` event, which is emitted once per
+    call no matter how many times the request is retried.
+
+    :param event_name: The event name, such as "before-call.s3.PutObject".
+    """
+    _, service, operation = event_name.split(".", 2)
+    with _lock:
+        key = (service, operation)
+        _api_call_counts[key] = _api_call_counts.get(key, 0) + 1
+
+
+def get_api_call_counts():
+    """
+    :return: A dict of `(service, operation)` to the number of API calls made in this process.
+    """
+    with _lock:
+        return dict(_api_call_counts)
+
+
+def make_config(control=False):
+    from botocore.config import Config
+    if control:
+        return Config(max_pool_connections=settings["control_pool_connections"])
+    return Config(max_pool_connections=settings["max_pool_connections"])
+
+
+def get_client(name, region, control=False):
+    """
+    Gets a client from the registry, making it the first time it is asked for. Clients are
+    thread-safe, so one client (and its connection pool) is shared by every thread. The lock is
+    held while making the client because making anything from a session is not thread-safe.
+
+    :param name: The service name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :param control: Whether to get the client for control-plane writes. It has its own small
+    connection pool, so those writes never wait for a connection behind bulk transfers.
+    :return: The client.
+    """
+    session = get_session()
+    key = (name, region, control)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = session.client(name, region_name=region, config=make_config(control),
+                                    endpoint_url=settings["endpoint_url"])
+            _clients[key] = client
+        return client
+
+
+def get_resource(name, region):
+    """
+    Gets a resource from the registry, making it the first time it is asked for. Resources are
+    not thread-safe, so each thread gets its own.
+
+    :param name: The service name.
+    :param region: The region, or `None` to pull the region from the environment.
+    :return: The resource.
+    """
+    if getattr(_local, "generation", None) != _generation:
+        _local.resources = {}
+        _local.generation = _generation
+    resources = _local.resources
+
+    key = (name, region)
+    resource = resources.get(key)
+    if resource is None or resource.meta.client.meta.config.max_pool_connections != \
+            settings["max_pool_connections"]:
+        session = get_session()
+        # Making anything from a session is not thread-safe
+        with _lock:
+            resource = session.resource(name, region_name=region, config=make_config(),
+                                        endpoint_url=settings["endpoint_url"])
+        resources[key] = resource
+    return resource
@@ -0,0 +1,120 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from inndie import output
+from inndie import tracing
+from inndie.errors import InndieError
+
+DEFAULT_MAX_WORKERS = 16
+
+
+class StepError(InndieError):
+    """
+    Raised when one or more steps failed.
+    """
+
+    def __init__(self, failures, results):
+        self.failures = failures
+        self.results = results
+        lines = ["{} step(s) failed:".format(len(failures))]
+        lines += ["  {}: {}".format(name, error) for name, error in failures]
+        super().__init__("\n".join(lines))
+
+
+class SkippedError(RuntimeError):
+    """
+    Used as the error of a step that did not run because a step it depends on failed.
+    """
+    pass
+
+
+def run_steps(steps, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Runs steps concurrently. Each step starts as soon as the steps it depends on have finished.
+    If a step fails, the steps that depend on it are skipped but independent steps still run.
+
+    :param steps: A list of `(name, function, dependencies)` tuples, where `dependencies` is a
+    list of step names. Each function takes no arguments.
+    :param max_workers: The most steps that run at once.
+    :return: A dict of step name to a tuple of the step's result and its duration in seconds.
+    Raises a `StepError` listing every failed or skipped step, which also holds the results of
+    the steps that finished.
+    """
+    def run_step(name, function):
+        start = time.monotonic()
+        with tracing.span(name):
+            result = function()
+        return result, time.monotonic() - start
+
+    functions = {name: output.bind(function) for name, function, _ in steps}
+    waiting = {name: set(dependencies) for name, _, dependencies in steps}
+    dependents = {}
+    for name, _, dependencies in steps:
+        for dependency in set(dependencies):
+            dependents.setdefault(dependency, []).append(name)
+
+    results = {}
+    errors = {}
+
+    def finish(name, error=None):
+        """
+        Records that a step finished and returns the steps that can start now. The steps that
+        depend on a failed step are skipped, and so are the steps that depend on those.
+        """
+        if error is not None:
+            errors[name] = error
+        ready = []
+        for dependent in dependents.get(name, []):
+            if dependent not in waiting:
+                continue
+            if error is not None:
+                del waiting[dependent]
+                ready += finish(dependent,
+                                SkippedError("Skipped because {} failed".format(name)))
+                continue
+            waiting[dependent].discard(name)
+            if len(waiting[dependent]) == 0:
+                del waiting[dependent]
+                ready.append(dependent)
+        return ready
+
+    # A dependency that is not a step can never finish
+    ready = []
+    for name, _, dependencies in steps:
+        missing = [it for it in dependencies if it not in functions]
+        if name in waiting and len(missing) > 0:
+            del waiting[name]
+            ready += finish(name, SkippedError("Skipped because {} is not a step".format(
+                missing[0])))
+    ready += [name for name, _, _ in steps if name in waiting and len(waiting[name]) == 0]
+    for name in ready:
+        waiting.pop(name, None)
+
+    # Only steps whose dependencies have finished are submitted, so the pool never holds a
+    # thread that is blocked on another step
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(steps)))) as executor:
+        running = {}
+        while len(ready) > 0 or len(running) > 0:
+            for name in ready:
+                running[executor.submit(run_step, name, functions[name])] = name
+            ready = []
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    ready += finish(name, e)
+                    continue
+                ready += finish(name)
+
+    # Steps that wait on each other never become ready
+    for name in waiting:
+        errors[name] = SkippedError("Skipped because it waits on itself")
+
+    failures = [(name, errors[name]) for name, _, _ in steps if name in errors]
+    if len(failures) > 0:
+        raise StepError(failures, results)
+
+    return results
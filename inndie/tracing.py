@@ -0,0 +1,244 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+settings = {
+    "enabled": False
+}
+
+_lock = threading.Lock()
+_calls = []
+_spans = []
+# Times are recorded relative to this, in seconds
+_origin = time.monotonic()
+
+
+def configure(enabled=None):
+    """
+    Changes the tracing settings for this process.
+
+    :param enabled: Whether to record every AWS API call, or `None` to leave the setting
+    unchanged.
+    """
+    if enabled is not None:
+        settings["enabled"] = enabled
+
+
+def register(events):
+    """
+    Registers the tracing handlers with a session's event system. The handlers do nothing while
+    tracing is off.
+
+    :param events: The botocore event system, such as `session.events`.
+    """
+    events.register("before-call", start_call)
+    events.register("after-call", finish_call)
+    events.register("after-call-error", fail_call)
+
+
+def start_call(event_name, params=None, context=None, **kwargs):
+    """
+    Starts timing an API call. Registered for botocore's `before-call` event. The call's record
+    is kept in its request context, which botocore passes to every event of the call.
+
+    :param event_name: The event name, such as "before-call.s3.PutObject".
+    :param params: The serialized request.
+    :param context: The call's request context.
+    """
+    if not settings["enabled"] or context is None:
+        return
+    _, service, operation = event_name.split(".", 2)
+    context["inndie_trace"] = {
+        "service": service,
+        "operation": operation,
+        "start": time.monotonic() - _origin,
+        "thread": threading.get_ident(),
+        "bytes_out": get_body_size((params or {}).get("body")),
+        "bytes_in": 0
+    }
+
+
+def get_body_size(body):
+    """
+    :param body: A request body.
+    :return: The number of bytes in the body, or 0 if it cannot be told without reading it.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    try:
+        position = body.tell()
+        body.seek(0, os.SEEK_END)
+        end = body.tell()
+        body.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def finish_call(http_response=None, parsed=None, context=None, **kwargs):
+    """
+    Records a finished API call. Registered for botocore's `after-call` event, which is emitted
+    once per call after any retries.
+
+    :param http_response: The HTTP response.
+    :param parsed: The parsed response.
+    :param context: The call's request context.
+    """
+    if context is None or "inndie_trace" not in context:
+        return
+    record = context.pop("inndie_trace")
+    metadata = (parsed or {}).get("ResponseMetadata", {})
+    record["retries"] = metadata.get("RetryAttempts", 0)
+    record["status"] = metadata.get("HTTPStatusCode")
+    if http_response is not None:
+        try:
+            record["bytes_in"] = int(http_response.headers.get("content-length", 0))
+        except ValueError:
+            pass
+    if "Error" in (parsed or {}):
+        record["error"] = parsed["Error"].get("Code")
+    add_call(record)
+
+
+def fail_call(exception=None, context=None, **kwargs):
+    """
+    Records an API call that raised before it got a response, such as after running out of
+    retries on connection errors. Registered for botocore's `after-call-error` event.
+
+    :param exception: The exception.
+    :param context: The call's request context.
+    """
+    if context is None or "inndie_trace" not in context:
+        return
+    record = context.pop("inndie_trace")
+    record["retries"] = 0
+    record["status"] = None
+    record["error"] = type(exception).__name__
+    add_call(record)
+
+
+def add_call(record):
+    record["seconds"] = time.monotonic() - _origin - record["start"]
+    with _lock:
+        _calls.append(record)
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Records a named span of work, such as one step of a command, for the Chrome trace. Does
+    nothing while tracing is off.
+
+    :param name: The name shown on the timeline.
+    """
+    if not settings["enabled"]:
+        yield
+        return
+    start = time.monotonic() - _origin
+    try:
+        yield
+    finally:
+        with _lock:
+            _spans.append({"name": name, "start": start,
+                           "seconds": time.monotonic() - _origin - start,
+                           "thread": threading.get_ident()})
+
+
+def reset():
+    """
+    Forgets every recorded call and span.
+    """
+    with _lock:
+        del _calls[:]
+        del _spans[:]
+
+
+def get_calls():
+    """
+    :return: A list of the API calls recorded in this process, in the order they finished.
+    """
+    with _lock:
+        return list(_calls)
+
+
+def summarize(calls):
+    """
+    :param calls: The calls from `get_calls`.
+    :return: A list of dicts, one per service and operation, sorted by the total time spent.
+    """
+    summary = {}
+    for call in calls:
+        name = "{}.{}".format(call["service"], call["operation"])
+        it = summary.setdefault(name, {"operation": name, "calls": 0, "errors": 0, "retries": 0,
+                                       "seconds": 0.0, "max_seconds": 0.0, "bytes_out": 0,
+                                       "bytes_in": 0})
+        it["calls"] += 1
+        it["errors"] += 1 if "error" in call else 0
+        it["retries"] += call["retries"]
+        it["seconds"] += call["seconds"]
+        it["max_seconds"] = max(it["max_seconds"], call["seconds"])
+        it["bytes_out"] += call["bytes_out"]
+        it["bytes_in"] += call["bytes_in"]
+    return sorted(summary.values(), key=lambda it: it["seconds"], reverse=True)
+
+
+def format_summary(calls):
+    """
+    :param calls: The calls from `get_calls`.
+    :return: The summary as a table.
+    """
+    lines = ["{:<40} {:>6} {:>6} {:>7} {:>10} {:>9} {:>9} {:>12} {:>12}".format(
+        "Operation", "Calls", "Errors", "Retries", "Total ms", "Avg ms", "Max ms", "Bytes out",
+        "Bytes in")]
+    for it in summarize(calls):
+        lines.append("{:<40} {:>6} {:>6} {:>7} {:>10.1f} {:>9.1f} {:>9.1f} {:>12} {:>12}".format(
+            it["operation"], it["calls"], it["errors"], it["retries"], it["seconds"] * 1000,
+            it["seconds"] * 1000 / it["calls"], it["max_seconds"] * 1000, it["bytes_out"],
+            it["bytes_in"]))
+    lines.append("{} AWS API call(s), {} retried, {:.1f} ms in total".format(
+        len(calls), sum(1 for call in calls if call["retries"] > 0),
+        sum(call["seconds"] for call in calls) * 1000))
+    return "\n".join(lines)
+
+
+def write_trace(path):
+    """
+    Writes every recorded call and the summary as JSON.
+
+    :param path: The file to write.
+    """
+    calls = get_calls()
+    with open(path, "w") as f:
+        json.dump({"calls": calls, "summary": summarize(calls)}, f, indent=2)
+
+
+def write_chrome_trace(path):
+    """
+    Writes the recorded calls and spans in the Chrome trace event format, which chrome://tracing
+    and Perfetto show as a timeline with one row per thread.
+
+    :param path: The file to write.
+    """
+    pid = os.getpid()
+    with _lock:
+        calls = list(_calls)
+        spans = list(_spans)
+
+    events = []
+    for it in spans:
+        events.append({"name": it["name"], "cat": "step", "ph": "X", "pid": pid,
+                       "tid": it["thread"], "ts": it["start"] * 1e6, "dur": it["seconds"] * 1e6})
+    for call in calls:
+        args = {name: call[name] for name in ["retries", "status", "bytes_out", "bytes_in"]}
+        if "error" in call:
+            args["error"] = call["error"]
+        events.append({"name": "{}.{}".format(call["service"], call["operation"]), "cat": "aws",
+                       "ph": "X", "pid": pid, "tid": call["thread"], "ts": call["start"] * 1e6,
+                       "dur": call["seconds"] * 1e6, "args": args})
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
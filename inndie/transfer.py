@@ -0,0 +1,493 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from inndie import compression
+from inndie import output
+from inndie import scheduler
+from inndie.errors import InndieError
+
+DEFAULT_MAX_WORKERS = 8
+
+MB = 1024 * 1024
+
+# Named TransferConfig settings. "default" matches boto3's own defaults.
+TRANSFER_PROFILES = {
+    "default": {
+        "multipart_threshold": 8 * MB,
+        "multipart_chunksize": 8 * MB,
+        "max_concurrency": 10,
+        "max_bandwidth": None
+    },
+    # Few, large parts for multi-GB files on instances with fast links
+    "large-files": {
+        "multipart_threshold": 64 * MB,
+        "multipart_chunksize": 64 * MB,
+        "max_concurrency": 16,
+        "max_bandwidth": None
+    },
+    # Many parts in flight to fill a high-bandwidth, high-latency link
+    "fast-network": {
+        "multipart_threshold": 16 * MB,
+        "multipart_chunksize": 16 * MB,
+        "max_concurrency": 32,
+        "max_bandwidth": None
+    },
+    # Few threads and little buffered data for small instances
+    "low-resource": {
+        "multipart_threshold": 8 * MB,
+        "multipart_chunksize": 8 * MB,
+        "max_concurrency": 2,
+        "max_bandwidth": None
+    }
+}
+
+BYTE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1000,
+    "MB": 1000 ** 2,
+    "GB": 1000 ** 3,
+    "KIB": 1024,
+    "MIB": 1024 ** 2,
+    "GIB": 1024 ** 3
+}
+
+
+def parse_byte_size(text):
+    """
+    :param text: A size such as "8MB", "64MiB" or "1048576".
+    :return: The size in bytes. Raises a `ValueError` if the size cannot be parsed.
+    """
+    text = text.strip().upper()
+    number = text.rstrip("KMGIB")
+    unit = text[len(number):]
+    try:
+        return int(float(number) * BYTE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError("Invalid size: {}".format(text))
+
+
+def get_transfer_settings(profile="default", **overrides):
+    """
+    :param profile: The name of a transfer profile.
+    :param overrides: Settings that replace the profile's, such as `max_concurrency=4`. `None`
+    values are ignored.
+    :return: A dict of TransferConfig settings.
+    """
+    if profile not in TRANSFER_PROFILES:
+        raise ValueError("Unknown transfer profile: {}".format(profile))
+
+    settings = dict(TRANSFER_PROFILES[profile])
+    settings.update((key, value) for key, value in overrides.items() if value is not None)
+    return settings
+
+
+def make_transfer_config(settings):
+    """
+    :param settings: A dict from `get_transfer_settings`.
+    :return: The TransferConfig.
+    """
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(**settings)
+
+
+class RateLimiter:
+    """
+    Keeps one transfer within a number of bytes per second, like TransferConfig's
+    `max_bandwidth` does for boto3's own transfers. Bursts of up to one second are allowed.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.tokens = float(bytes_per_second)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, byte_count):
+        """
+        Takes bytes from the budget, sleeping while the transfer is ahead of its bandwidth.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(float(self.bytes_per_second),
+                              self.tokens + (now - self.last_refill) * self.bytes_per_second)
+            self.last_refill = now
+            self.tokens -= byte_count
+            delay = -self.tokens / self.bytes_per_second if self.tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+    def wrap(self, callback):
+        """
+        :param callback: A boto3 transfer callback.
+        :return: A boto3 transfer callback that also consumes the transferred bytes.
+        """
+        def limited(byte_count):
+            self.consume(byte_count)
+            callback(byte_count)
+
+        return limited
+
+
+class ProgressReporter:
+    """
+    A boto3 transfer callback that prints the progress and throughput of one file to stderr, at
+    most a few times per second.
+    """
+
+    def __init__(self, label, total_bytes=None, interval=0.5, stream=None):
+        """
+        :param label: What is being transferred.
+        :param total_bytes: The size of the file, or `None` if it is not known.
+        :param interval: The fewest seconds between printed updates.
+        :param stream: The stream to print to, or `None` for stderr.
+        """
+        self.label = label
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.last_report = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, bytes_transferred):
+        with self.lock:
+            self.bytes += bytes_transferred
+            now = time.monotonic()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now):
+        seconds = max(now - self.start, 1e-9)
+        if self.total_bytes:
+            done = "{:.1f}/{:.1f} MB ({:.0f}%)".format(
+                self.bytes / MB, self.total_bytes / MB, 100.0 * self.bytes / self.total_bytes)
+        else:
+            done = "{:.1f} MB".format(self.bytes / MB)
+        print("{}: {} at {:.2f} MB/s".format(self.label, done, self.bytes / seconds / MB),
+              file=self.stream if self.stream is not None else sys.stderr, flush=True)
+
+
+def transfer_file(client, direction, bucket_name, key, path, config=None, show_progress=False):
+    """
+    Uploads or downloads one file.
+
+    :param client: The S3 client to use.
+    :param direction: "upload" or "download".
+    :param bucket_name: The S3 bucket name.
+    :param key: The key of the object.
+    :param path: The local file path.
+    :param config: The TransferConfig, or `None` for boto3's defaults.
+    :param show_progress: Whether to print progress while the file transfers.
+    :return: The `TransferSummary`.
+    """
+    summary = TransferSummary()
+    start = time.monotonic()
+    callback = None
+    if direction == "upload":
+        size = os.path.getsize(path)
+        codec = compression.choose_codec(path)
+        if codec is not None:
+            if show_progress:
+                # Progress is counted in compressed bytes, so the total is not known
+                callback = ProgressReporter(key)
+            compression.upload_file(client, bucket_name, path, key, codec, config,
+                                    scheduler.bulk_callback(callback))
+        else:
+            if show_progress:
+                callback = ProgressReporter(key, size)
+            client.upload_file(path, bucket_name, key, Config=config,
+                               Callback=scheduler.bulk_callback(callback))
+    else:
+        head = client.head_object(Bucket=bucket_name, Key=key)
+        codec = compression.get_codec(head.get("Metadata"))
+        if codec is not None:
+            body = client.get_object(Bucket=bucket_name, Key=key)["Body"]
+            try:
+                compression.decompress_stream(body, path, codec)
+            finally:
+                body.close()
+        else:
+            if show_progress:
+                callback = ProgressReporter(key, head["ContentLength"])
+            client.download_file(bucket_name, key, path, Config=config,
+                                 Callback=scheduler.bulk_callback(callback))
+        size = os.path.getsize(path)
+
+    summary.seconds = time.monotonic() - start
+    summary.files = 1
+    summary.bytes = size
+    summary.transferred.append((path, key))
+    return summary
+
+
+class TransferError(InndieError):
+    """
+    Raised when one or more files in a batch failed to transfer.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        lines = ["{} file(s) failed to transfer:".format(len(failures))]
+        lines += ["  {} -> {}: {}".format(path, key, error) for path, key, error in failures]
+        super().__init__("\n".join(lines))
+
+
+class TransferSummary:
+    """
+    The aggregate result of transferring a batch of files.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.transferred = []
+        self.failures = []
+
+    def megabytes_per_second(self):
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes / self.seconds / (1024 * 1024)
+
+    def format(self):
+        return "Transferred {} file(s), {} bytes in {:.2f}s ({:.2f} MB/s), {} failed\n".format(
+            self.files, self.bytes, self.seconds, self.megabytes_per_second(),
+            len(self.failures))
+
+    def raise_for_failures(self):
+        """
+        Raises a `TransferError` if any file failed to transfer.
+        """
+        if len(self.failures) > 0:
+            raise TransferError(self.failures)
+
+
+def walk_files(root):
+    """
+    Recursively lists the files under a directory in a stable order.
+
+    :param root: The directory to walk.
+    :return: A list of `(path, relative_path)` tuples. The relative path always uses `/` so it can
+    be used as part of an S3 key.
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(path, root).replace(os.sep, "/")
+            files.append((path, relative_path))
+    return files
+
+
+def upload_file(client, bucket_name, path, key):
+    """
+    Uploads one file, compressing it if compression is on.
+
+    :return: The number of bytes in the file.
+    """
+    size = os.path.getsize(path)
+    codec = compression.choose_codec(path)
+    if codec is not None:
+        compression.upload_file(client, bucket_name, path, key, codec,
+                                callback=scheduler.bulk_callback())
+    else:
+        client.upload_file(path, bucket_name, key, Callback=scheduler.bulk_callback())
+    return size
+
+
+def get_object_size(response):
+    """
+    :param response: A `get_object` response, for the whole object or a range of it.
+    :return: The size of the whole object.
+    """
+    if "ContentRange" in response:
+        return int(response["ContentRange"].rsplit("/", 1)[1])
+    return response["ContentLength"]
+
+
+def write_body(body, f):
+    for chunk in iter(lambda: body.read(MB), b""):
+        f.write(chunk)
+        scheduler.throttle(len(chunk))
+
+
+class RemainderStream:
+    """
+    Reads the body of a ranged GET from the start of an object, then the rest of the object with
+    one more GET, so that the object can be read as one stream.
+    """
+
+    def __init__(self, client, bucket_name, key, response):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.etag = response["ETag"]
+        self.size = get_object_size(response)
+        self.body = response["Body"]
+        self.offset = 0
+
+    def read(self, size):
+        data = self.body.read(size)
+        if len(data) == 0 and self.offset < self.size:
+            self.body.close()
+            self.body = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                               IfMatch=self.etag,
+                                               Range="bytes={}-".format(self.offset))["Body"]
+            data = self.body.read(size)
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        self.body.close()
+
+
+def download_ranges(client, bucket_name, key, path, etag, offset, size,
+                    settings=TRANSFER_PROFILES["default"]):
+    """
+    Downloads the bytes of an object from `offset` on into the same place in a file that is
+    already `size` bytes long, with parallel ranged GETs.
+
+    :param settings: The transfer settings that give the size of each range and the most ranges
+    to download at once.
+    """
+    part_size = settings["multipart_chunksize"]
+
+    def download_range(start):
+        end = min(start + part_size, size) - 1
+        body = client.get_object(Bucket=bucket_name, Key=key, IfMatch=etag,
+                                 Range="bytes={}-{}".format(start, end))["Body"]
+        try:
+            with open(path, "r+b") as f:
+                f.seek(start)
+                write_body(body, f)
+        finally:
+            body.close()
+
+    with ThreadPoolExecutor(max_workers=settings["max_concurrency"]) as executor:
+        for future in [executor.submit(download_range, start)
+                       for start in range(offset, size, part_size)]:
+            future.result()
+
+
+def download_file(client, bucket_name, key, path):
+    """
+    Downloads one file, decompressing it if it was uploaded compressed. The first GET asks for
+    the first `multipart_threshold` bytes, which is all of a small object. The rest of a larger
+    object is downloaded with parallel ranged GETs, so no byte is downloaded twice.
+
+    :return: The number of bytes in the file.
+    """
+    first_size = TRANSFER_PROFILES["default"]["multipart_threshold"]
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=key,
+                                     Range="bytes=0-{}".format(first_size - 1))
+    except client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "InvalidRange":
+            raise
+        # S3 cannot satisfy a range of an empty object
+        response = client.get_object(Bucket=bucket_name, Key=key)
+
+    codec = compression.get_codec(response.get("Metadata"))
+    if codec is not None:
+        stream = RemainderStream(client, bucket_name, key, response)
+        try:
+            compression.decompress_stream(stream, path, codec)
+        finally:
+            stream.close()
+        return os.path.getsize(path)
+
+    size = get_object_size(response)
+    body = response["Body"]
+    try:
+        with open(path, "wb") as f:
+            write_body(body, f)
+            f.truncate(size)
+    finally:
+        body.close()
+    if size > first_size:
+        download_ranges(client, bucket_name, key, path, response["ETag"], first_size, size)
+    return os.path.getsize(path)
+
+
+def upload_files(client, bucket_name, uploads, max_workers=DEFAULT_MAX_WORKERS,
+                 upload_function=upload_file):
+    """
+    Uploads files in parallel on a bounded thread pool. A failed file does not stop the others;
+    failures are collected in the returned summary.
+
+    :param client: The S3 client to use. It should have at least `max_workers` pool connections.
+    :param bucket_name: The S3 bucket name.
+    :param uploads: A list of `(path, key)` tuples.
+    :param max_workers: The maximum number of files to upload at once.
+    :param upload_function: The function that uploads each file. It takes the same arguments as
+    `upload_file` and returns the number of bytes uploaded.
+    :return: The `TransferSummary`.
+    """
+    summary = TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(upload_function, client, bucket_name, path, key): (path, key)
+                   for path, key in uploads}
+        for future in as_completed(futures):
+            path, key = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                summary.failures.append((path, key, e))
+                continue
+
+            summary.files += 1
+            summary.bytes += size
+            summary.transferred.append((path, key))
+            output.report("Uploaded to: {}\n".format(key))
+
+    summary.seconds = time.monotonic() - start
+    return summary
+
+
+def download_files(client, bucket_name, downloads, max_workers=DEFAULT_MAX_WORKERS,
+                   download_function=download_file):
+    """
+    Downloads files in parallel on a bounded thread pool. A failed file does not stop the others;
+    failures are collected in the returned summary.
+
+    :param client: The S3 client to use. It should have at least `max_workers` pool connections.
+    :param bucket_name: The S3 bucket name.
+    :param downloads: A list of `(path, key)` tuples. Missing parent directories are created.
+    :param max_workers: The maximum number of files to download at once.
+    :param download_function: The function that downloads each file. It takes the same arguments
+    as `download_file` and returns the number of bytes downloaded.
+    :return: The `TransferSummary`.
+    """
+    def download(path, key):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return download_function(client, bucket_name, key, path)
+
+    summary = TransferSummary()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download, path, key): (path, key)
+                   for path, key in downloads}
+        for future in as_completed(futures):
+            path, key = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                summary.failures.append((path, key, e))
+                continue
+
+            summary.files += 1
+            summary.bytes += size
+            summary.transferred.append((path, key))
+            output.report("Downloaded from: {}\n".format(key))
+
+    summary.seconds = time.monotonic() - start
+    return summary
@@ -0,0 +1,44 @@
+import time
+
+from inndie.errors import InndieError
+
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_INITIAL_DELAY = 0.5
+DEFAULT_MAX_DELAY = 10.0
+
+
+class WaiterTimeoutError(InndieError):
+    """
+    Raised when a condition does not become true before the timeout.
+    """
+    pass
+
+
+def wait_until(condition, description, timeout=DEFAULT_TIMEOUT,
+               initial_delay=DEFAULT_INITIAL_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Polls a condition with exponential backoff until it is true.
+
+    :param condition: A function that returns True once the wait is over.
+    :param description: What is being waited for, used in the timeout error.
+    :param timeout: The most seconds to wait.
+    :param initial_delay: The seconds to wait after the first failed check. Each delay after it
+    doubles, up to `max_delay`.
+    :param max_delay: The longest delay between checks.
+    :return: The number of checks made. Raises a `WaiterTimeoutError` on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempts = 0
+    while True:
+        attempts += 1
+        if condition():
+            return attempts
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise WaiterTimeoutError("Timed out after {:.1f}s waiting for {}".format(
+                timeout, description))
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
@@ -17,6 +17,10 @@ setup(
     packages=["inndie"],
     python_requires=">=3.6",
     install_requires=["click==7.0.0", "boto3==1.9.248"],
+    extras_require={
+        "yaml": ["pyyaml"],
+        "zstd": ["zstandard"]
+    },
     entry_points={
         "console_scripts": ["inndie=inndie.client:cli"]
     },
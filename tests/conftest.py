@@ -0,0 +1,43 @@
+import pytest
+
+from inndie import session
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """
+    Keeps the local state of every test in its own directory.
+    """
+    path = tmp_path / "cache"
+    monkeypatch.setenv("INNDIE_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Runs a test against moto's in-process stand-in for AWS.
+    """
+    moto = pytest.importorskip("moto")
+    for name, value in [("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")]:
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    monkeypatch.setitem(session.settings, "endpoint_url", None)
+    # Clients made outside of the mock would talk to AWS
+    session.reset()
+    with moto.mock_aws():
+        yield
+    session.reset()
+
+
+@pytest.fixture
+def s3(aws):
+    from inndie import client
+    return client.make_client("s3", None)
+
+
+@pytest.fixture
+def bucket(s3):
+    s3.create_bucket(Bucket="inndie-test")
+    return "inndie-test"
@@ -0,0 +1,98 @@
+import threading
+
+from click.testing import CliRunner
+
+from inndie import agent
+from inndie import client
+
+
+def test_events_for_the_same_job_are_coalesced():
+    written = []
+    handlers = {it: written.append for it in ["progress", "heartbeat", "log", "results"]}
+    inndie_agent = agent.Agent(handlers)
+
+    for text in ["1", "2", "3"]:
+        assert inndie_agent.submit({"type": "progress", "job_id": "a", "text": text})["ok"]
+    inndie_agent.submit({"type": "progress", "job_id": "b", "text": "1"})
+    inndie_agent.submit({"type": "results", "job_id": "a", "output_dir": "x"})
+    inndie_agent.submit({"type": "results", "job_id": "a", "output_dir": "y"})
+    inndie_agent.start()
+    inndie_agent.stop()
+    inndie_agent.wait()
+
+    assert sorted((it["type"], it["job_id"], it.get("text", it.get("output_dir")))
+                  for it in written) == [
+        ("progress", "a", "3"), ("progress", "b", "1"), ("results", "a", "x"),
+        ("results", "a", "y")]
+
+
+def test_a_slow_results_event_does_not_delay_heartbeats():
+    release = threading.Event()
+    heartbeat_written = threading.Event()
+
+    def write_results(event):
+        release.wait(10)
+
+    inndie_agent = agent.Agent({"results": write_results,
+                                "heartbeat": lambda event: heartbeat_written.set()},
+                               flush_interval=60)
+    inndie_agent.start()
+    try:
+        inndie_agent.submit({"type": "results", "job_id": "a", "output_dir": "x"})
+        inndie_agent.request_flush()
+        inndie_agent.submit({"type": "heartbeat", "job_id": "a"})
+        inndie_agent.request_flush()
+        assert heartbeat_written.wait(5)
+        assert not release.is_set()
+    finally:
+        release.set()
+        inndie_agent.stop()
+        inndie_agent.wait()
+
+
+def test_stopping_waits_for_results_events():
+    written = []
+    inndie_agent = agent.Agent({"results": written.append})
+    inndie_agent.start()
+    inndie_agent.submit({"type": "results", "job_id": "a", "output_dir": "x"})
+    inndie_agent.stop()
+    inndie_agent.wait()
+    assert len(written) == 1
+
+
+def test_unknown_events_are_rejected():
+    inndie_agent = agent.Agent({"progress": lambda event: None})
+    assert not inndie_agent.submit({"type": "heartbeat", "job_id": "a"})["ok"]
+    assert not inndie_agent.submit(["not", "an", "event"])["ok"]
+
+
+def test_a_failed_event_does_not_block_the_others(capsys):
+    written = []
+
+    def write(event):
+        if event["job_id"] == "bad":
+            raise ValueError("boom")
+        written.append(event)
+
+    inndie_agent = agent.Agent({"progress": write})
+    inndie_agent.submit({"type": "progress", "job_id": "bad"})
+    inndie_agent.submit({"type": "progress", "job_id": "good"})
+    inndie_agent.flush()
+    assert [it["job_id"] for it in written] == ["good"]
+    assert "boom" in capsys.readouterr().err
+
+
+def test_handle_lines_reports_invalid_json():
+    responses = []
+    inndie_agent = agent.Agent({"progress": lambda event: None})
+    agent.handle_lines(inndie_agent, ['{"type": "progress", "job_id": "a"}', "", "{"],
+                       responses.append)
+    assert [it["ok"] for it in responses] == [True, False]
+
+
+def test_agent_send_without_an_agent(tmp_path):
+    socket_path = str(tmp_path / "agent.sock")
+    result = CliRunner().invoke(client.cli, ["agent-send", "--socket", socket_path,
+                                             '{"type": "flush"}'])
+    assert result.exit_code == 1
+    assert "No inndie agent is running on: {}".format(socket_path) in result.output
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from inndie import batch
+
+
+def test_load_operations_reads_jsonl():
+    operations = batch.load_operations('{"op": "upload-model", "model-path": "a.h5"}\n\n'
+                                       '{"id": "b", "op": "x", "after": 1}\n')
+    assert operations == [
+        {"id": "1", "op": "upload-model", "after": [], "args": {"model_path": "a.h5"}},
+        {"id": "b", "op": "x", "after": ["1"], "args": {}}
+    ]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("not json", "Line 1 is not valid JSON"),
+    ('{"id": "a"}', "must be an object"),
+    ('{"id": "a", "op": "x"}\n{"id": "a", "op": "x"}', "Duplicate operation id: a"),
+    ('{"op": "x", "after": "nope"}', "runs after unknown operation nope")
+])
+def test_load_operations_rejects_invalid_batches(text, message):
+    with pytest.raises(batch.BatchError, match=message):
+        batch.load_operations(text)
+
+
+def test_find_cycle():
+    assert batch.find_cycle({"a": [], "b": ["a"], "c": ["a", "b"]}) is None
+    assert batch.find_cycle({"a": ["c"], "b": ["a"], "c": ["b"]}) == ["a", "c", "b", "a"]
+
+
+def test_run_operations_skips_operations_after_failures():
+    def fail():
+        raise ValueError("boom")
+
+    operations = batch.load_operations('{"id": "a", "op": "fail"}\n'
+                                       '{"id": "b", "op": "ok", "after": "a"}\n'
+                                       '{"id": "c", "op": "ok"}\n')
+    results = batch.run_operations(operations, {"fail": fail, "ok": lambda: "done"})
+    assert [(it["id"], it["ok"], it.get("skipped")) for it in results] == [
+        ("a", False, False), ("b", False, True), ("c", True, None)]
+    assert results[2]["result"] == "done"
+
+
+def test_run_operations_threads_are_bounded_by_max_concurrency():
+    peak = [0, 0]
+    running = [0]
+    lock = threading.Lock()
+
+    def handler():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            peak[1] = max(peak[1], threading.active_count())
+        time.sleep(0.001)
+        with lock:
+            running[0] -= 1
+
+    operations = [{"id": str(i), "op": "h", "after": [], "args": {}} for i in range(500)]
+    before = threading.active_count()
+    results = batch.run_operations(operations, {"h": handler}, max_concurrency=4)
+    assert all(it["ok"] for it in results)
+    assert peak[0] <= 4
+    assert peak[1] <= before + 4
+
+
+def test_run_operations_rejects_cycles():
+    operations = [{"id": "a", "op": "h", "after": ["b"], "args": {}},
+                  {"id": "b", "op": "h", "after": ["a"], "args": {}}]
+    with pytest.raises(batch.BatchError, match="wait on each other"):
+        batch.run_operations(operations, {"h": lambda: None})
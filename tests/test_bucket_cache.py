@@ -0,0 +1,24 @@
+import os
+
+from inndie import bucket_cache
+from inndie import client
+from inndie import session
+
+
+def test_bucket_cache_entries_depend_on_the_credentials_and_endpoint(aws, monkeypatch):
+    access_key = os.environ["AWS_ACCESS_KEY_ID"]
+    bucket_name = client.ensure_s3_bucket(None)
+    assert bucket_cache.get_entry(None)["bucket"] == bucket_name
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "other-account")
+    session.reset()
+    assert bucket_cache.get_entry(None) is None
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", access_key)
+    monkeypatch.setitem(session.settings, "endpoint_url", "http://localhost:5000")
+    session.reset()
+    assert bucket_cache.get_entry(None) is None
+
+    monkeypatch.setitem(session.settings, "endpoint_url", None)
+    session.reset()
+    assert bucket_cache.get_entry(None)["bucket"] == bucket_name
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from inndie import client
+from inndie.errors import InndieError
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), "wb") as f:
+        f.write(data)
+
+
+def test_model_files_with_the_same_name_are_rejected(s3, bucket, tmp_path):
+    write_file(tmp_path / "out" / "fold1" / "best.h5", b"1")
+    write_file(tmp_path / "out" / "fold2" / "best.h5", b"2")
+    with pytest.raises(InndieError, match="fold1/best.h5, fold2/best.h5"):
+        client.impl_upload_training_results("job", str(tmp_path / "out"), bucket, None)
+    assert s3.list_objects_v2(Bucket=bucket)["KeyCount"] == 0
+
+
+def test_a_missing_output_directory_is_an_error(bucket, tmp_path):
+    with pytest.raises(InndieError, match="Not a directory"):
+        client.impl_upload_training_results("job", str(tmp_path / "missing"), bucket, None)
+
+    result = CliRunner().invoke(client.cli, ["upload-training-results", "job",
+                                             str(tmp_path / "missing")])
+    assert result.exit_code == 2
+    assert "does not exist" in result.output
+
+
+def test_nested_results_keep_their_paths(s3, bucket, tmp_path):
+    write_file(tmp_path / "out" / "a" / "log.txt", b"a")
+    write_file(tmp_path / "out" / "b" / "log.txt", b"b")
+    client.impl_upload_training_results("job", str(tmp_path / "out"), bucket, None)
+    keys = [it["Key"] for it in s3.list_objects_v2(
+        Bucket=bucket, Prefix=client.create_results_prefix("job"))["Contents"]]
+    assert sorted(keys) == ["inndie-training-results/job/a/log.txt",
+                            "inndie-training-results/job/b/log.txt"]
@@ -0,0 +1,33 @@
+import io
+import os
+
+import pytest
+
+from inndie import compression
+
+
+def compress(data, codec):
+    return compression.CompressingReader(io.BytesIO(data), codec).read()
+
+
+@pytest.fixture(params=["gzip", "zstd"])
+def codec(request):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def test_decompress_stream(tmp_path, codec):
+    data = os.urandom(1000) * 10
+    path = str(tmp_path / "file")
+    compression.decompress_stream(io.BytesIO(compress(data, codec)), path, codec)
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_truncated_streams_are_rejected(tmp_path, codec):
+    body = compress(os.urandom(1000) * 10, codec)
+    path = str(tmp_path / "file")
+    with pytest.raises(compression.TruncatedStreamError):
+        compression.decompress_stream(io.BytesIO(body[:len(body) // 2]), path, codec)
+    assert not os.path.exists(path)
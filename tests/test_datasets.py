@@ -0,0 +1,42 @@
+import os
+
+from inndie import datasets
+
+
+def write_dataset(root, files):
+    for relative_path, data in files.items():
+        path = os.path.join(str(root), relative_path)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def get_shards(manifest):
+    return set(it["shard"] for it in manifest["files"].values() if "shard" in it)
+
+
+def test_repacking_writes_new_shards(s3, bucket, tmp_path):
+    root = tmp_path / "dataset"
+    root.mkdir()
+    files = {"{:02d}".format(i): os.urandom(500) for i in range(10)}
+    files["large"] = os.urandom(4096)
+    write_dataset(root, files)
+    datasets.upload_directory(s3, bucket, "ds", str(root), pack=True, small_file_threshold=1024,
+                              shard_size=1000)
+    old_manifest = datasets.load_manifest(s3, bucket, "ds")
+
+    files["03"] = b"changed"
+    write_dataset(root, files)
+    datasets.upload_directory(s3, bucket, "ds", str(root), pack=True, small_file_threshold=1024,
+                              shard_size=1000)
+    manifest = datasets.load_manifest(s3, bucket, "ds")
+
+    # Readers of the old manifest never see its shards change; they are deleted instead
+    assert get_shards(old_manifest) & get_shards(manifest) == set()
+    listed = s3.list_objects_v2(Bucket=bucket, Prefix="ds/.inndie-shards/")["Contents"]
+    assert set(it["Key"] for it in listed) == get_shards(manifest)
+
+    out = tmp_path / "out"
+    datasets.download_directory(s3, bucket, manifest, str(out))
+    for relative_path, data in files.items():
+        with open(str(out / relative_path), "rb") as f:
+            assert f.read() == data
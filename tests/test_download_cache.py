@@ -0,0 +1,70 @@
+import os
+import stat
+
+import pytest
+
+from inndie import client
+from inndie import download_cache
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def read_file(path):
+    with open(str(path), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def model(bucket, tmp_path):
+    path = write_file(tmp_path / "upload" / "model.h5", b"AAAAA")
+    client.impl_upload_model(path, bucket, None)
+    return "model.h5"
+
+
+def test_second_download_is_served_from_the_cache(bucket, model, tmp_path):
+    client.impl_download_model(str(tmp_path / "a" / model), bucket, None)
+    client.impl_download_model(str(tmp_path / "b" / model), bucket, None)
+
+    stats = download_cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"]) == (1, 1, 5)
+    assert read_file(tmp_path / "b" / model) == b"AAAAA"
+
+
+def test_writing_a_download_does_not_change_the_cache(bucket, model, tmp_path):
+    first = str(tmp_path / "a" / model)
+    client.impl_download_model(first, bucket, None)
+    # Root can write to read-only files, so the mode alone would not protect a shared inode
+    with open(first, "r+b") as f:
+        f.write(b"BBBBB")
+
+    second = str(tmp_path / "b" / model)
+    client.impl_download_model(second, bucket, None)
+    assert download_cache.get_stats()["hits"] == 1
+    assert read_file(second) == b"AAAAA"
+    assert os.stat(first).st_ino != os.stat(second).st_ino
+
+
+def test_downloads_are_writable(bucket, model, tmp_path):
+    for name in ["a", "b"]:
+        path = str(tmp_path / name / model)
+        client.impl_download_model(path, bucket, None)
+        assert os.stat(path).st_mode & stat.S_IWUSR
+
+
+def test_a_changed_object_is_downloaded_again(bucket, model, tmp_path):
+    client.impl_download_model(str(tmp_path / "a" / model), bucket, None)
+    client.impl_upload_model(write_file(tmp_path / "upload2" / model, b"CCCCCC"), bucket, None)
+    client.impl_download_model(str(tmp_path / "b" / model), bucket, None)
+    assert read_file(tmp_path / "b" / model) == b"CCCCCC"
+    assert download_cache.get_stats()["misses"] == 2
+
+
+def test_clear_removes_every_entry(bucket, model, tmp_path):
+    client.impl_download_model(str(tmp_path / "a" / model), bucket, None)
+    assert download_cache.clear() == 1
+    assert download_cache.get_stats()["entries"] == 0
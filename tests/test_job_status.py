@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+
+from inndie import job_status
+from inndie import metrics
+
+PREFIX = "inndie-training-progress/job"
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setitem(job_status.settings, "enabled", True)
+
+
+def read_status(s3, bucket):
+    body = s3.get_object(Bucket=bucket, Key=job_status.get_status_key(PREFIX))["Body"].read()
+    return json.loads(body.decode("utf-8"))
+
+
+def test_updates_are_off_by_default(s3, bucket):
+    assert job_status.update(s3, bucket, PREFIX, progress={}) is None
+    assert "Contents" not in s3.list_objects_v2(Bucket=bucket)
+
+
+def test_changes_by_other_writers_are_kept(s3, bucket, enabled):
+    job_status.update(s3, bucket, PREFIX, heartbeat={"alive": True})
+    other = dict(read_status(s3, bucket), results={"files": 1})
+    s3.put_object(Body=json.dumps(other), Bucket=bucket, Key=job_status.get_status_key(PREFIX))
+
+    job_status.update(s3, bucket, PREFIX, log={"size": 10})
+    status = read_status(s3, bucket)
+    assert status["heartbeat"] == {"alive": True}
+    assert status["results"] == {"files": 1}
+    assert status["log"] == {"size": 10}
+
+
+def test_progress_has_one_shape(s3, bucket, enabled):
+    job_status.update(s3, bucket, PREFIX, progress=job_status.make_progress_field("epoch 1"))
+    text_progress = read_status(s3, bucket)["progress"]
+
+    writer = metrics.MetricsWriter(s3, bucket, PREFIX)
+    writer.record(step=1, loss=0.5)
+    writer.close()
+    metrics_progress = read_status(s3, bucket)["progress"]
+
+    assert set(text_progress) == set(metrics_progress)
+    assert text_progress["text"] == "epoch 1"
+    assert text_progress["latest"] is None
+    assert metrics_progress["latest"]["loss"] == 0.5
+    assert json.loads(metrics_progress["text"])["chunk"] == metrics_progress["chunk"]
+
+
+def test_finished_jobs_leave_no_local_files(s3, bucket, enabled):
+    local_file = job_status.get_local_file(bucket, PREFIX)
+    job_status.update(s3, bucket, PREFIX, heartbeat={"alive": True})
+    assert os.path.exists(local_file)
+
+    job_status.update(s3, bucket, PREFIX, finished=True, heartbeat={"alive": False})
+    assert not os.path.exists(local_file)
+    assert not os.path.exists(local_file + ".lock")
+    assert read_status(s3, bucket)["heartbeat"] == {"alive": False}
+
+
+def test_old_local_files_are_pruned(s3, bucket, enabled):
+    job_status.update(s3, bucket, "inndie-training-progress/abandoned", log={"size": 1})
+    abandoned = job_status.get_local_file(bucket, "inndie-training-progress/abandoned")
+    os.utime(abandoned, (0, 0))
+
+    job_status.update(s3, bucket, PREFIX, finished=True, heartbeat={"alive": False})
+    assert not os.path.exists(abandoned)
@@ -0,0 +1,54 @@
+import pytest
+
+from inndie import metrics
+
+
+class FailingClient:
+    """
+    Keeps written objects in memory and fails every put_object while `failing` is set.
+    """
+
+    def __init__(self):
+        self.failing = True
+        self.objects = {}
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        if self.failing:
+            raise IOError("PUT failed")
+        self.objects[Key] = Body
+
+
+def written_records(client):
+    return [record for key, body in sorted(client.objects.items()) if "/metrics/" in key
+            for record in metrics.decode_chunk(body)]
+
+
+def test_records_of_a_failed_chunk_are_written_later():
+    client = FailingClient()
+    writer = metrics.MetricsWriter(client, "bucket", "prefix")
+    writer.add({"step": 0})
+    writer.add({"step": 1})
+    with pytest.raises(IOError):
+        writer.flush()
+    assert writer.chunks == 0
+
+    writer.add({"step": 2})
+    client.failing = False
+    writer.flush()
+    assert writer.chunks == 1
+    assert written_records(client) == [{"step": 0}, {"step": 1}, {"step": 2}]
+
+
+def test_unsent_records_are_capped(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_UNSENT_BATCHES", 2)
+    client = FailingClient()
+    writer = metrics.MetricsWriter(client, "bucket", "prefix", max_batch_records=2)
+    for step in range(6):
+        writer.records.append({"step": step})
+        with pytest.raises(IOError):
+            writer.flush()
+    assert writer.dropped == 2
+
+    client.failing = False
+    writer.close()
+    assert written_records(client) == [{"step": step} for step in range(2, 6)]
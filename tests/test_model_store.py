@@ -0,0 +1,45 @@
+import os
+
+from inndie import client
+from inndie import model_store
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def list_keys(s3, bucket):
+    return sorted(it["Key"] for it in s3.list_objects_v2(Bucket=bucket).get("Contents", []))
+
+
+def test_models_are_stored_once_and_found_by_alias(s3, bucket, tmp_path):
+    path = write_file(tmp_path / "upload" / "model.h5", b"AAAAA")
+    content_hash, uploaded = model_store.upload_model(s3, bucket, path, "model.h5")
+    assert uploaded == 5
+    assert list_keys(s3, bucket) == [model_store.get_alias_key("model.h5"),
+                                     model_store.get_blob_key(content_hash)]
+    assert model_store.upload_model(s3, bucket, path, "model.h5") == (content_hash, 0)
+
+    client.impl_download_model(str(tmp_path / "download" / "model.h5"), bucket, None)
+    with open(str(tmp_path / "download" / "model.h5"), "rb") as f:
+        assert f.read() == b"AAAAA"
+
+
+def test_named_copies_are_opt_in(s3, bucket, tmp_path, monkeypatch):
+    path = write_file(tmp_path / "model.h5", b"AAAAA")
+    model_store.upload_model(s3, bucket, path, "model.h5")
+    monkeypatch.setitem(model_store.settings, "named_copies", True)
+
+    content_hash, uploaded = model_store.upload_model(s3, bucket, path, "model.h5")
+    assert uploaded == 0
+    copy = s3.get_object(Bucket=bucket, Key=model_store.get_model_key("model.h5"))
+    assert copy["Body"].read() == b"AAAAA"
+    assert copy["Metadata"][model_store.HASH_METADATA] == content_hash
+
+
+def test_models_without_an_alias_are_found_by_name(s3, bucket):
+    assert model_store.resolve_model_key(s3, bucket, "old.h5") == \
+        model_store.get_model_key("old.h5")
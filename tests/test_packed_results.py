@@ -0,0 +1,97 @@
+import os
+
+from inndie import client
+from inndie import packed_results
+
+
+def entry(shard, offset, size):
+    return {"shard": shard, "offset": offset, "size": size}
+
+
+def test_plan_ranges_coalesces_nearby_members():
+    entries = {
+        "a": entry("s1", 512, 10),
+        "b": entry("s1", 1536, 10),
+        "far": entry("s1", 10 ** 6, 5),
+        "other": entry("s2", 512, 0)
+    }
+    ranges = packed_results.plan_ranges(entries, max_gap=64 * 1024)
+    assert [(shard, start, end, [name for name, _ in members])
+            for shard, start, end, members in ranges] == [
+        ("s1", 512, 1546, ["a", "b"]),
+        ("s1", 10 ** 6, 10 ** 6 + 5, ["far"]),
+        ("s2", 512, 512, ["other"])
+    ]
+
+
+def test_plan_ranges_respects_max_size():
+    entries = {"a": entry("s", 0, 100), "b": entry("s", 100, 100), "c": entry("s", 200, 100)}
+    ranges = packed_results.plan_ranges(entries, max_gap=0, max_size=200)
+    assert [(start, end) for _, start, end, _ in ranges] == [(0, 200), (200, 300)]
+
+
+def write_results(root, files):
+    for relative_path, data in files.items():
+        path = os.path.join(str(root), *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def read_results(root):
+    files = {}
+    for dirpath, _, filenames in os.walk(str(root)):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, str(root)).replace(os.sep, "/")] = f.read()
+    return files
+
+
+def list_shards(s3, bucket, job_id):
+    prefix = client.create_results_prefix(job_id) + "/.inndie-shards/"
+    return set(it["Key"] for it in s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
+               .get("Contents", []))
+
+
+def test_packed_results_round_trip(s3, bucket, tmp_path):
+    files = {"logs/{:02d}.txt".format(i): os.urandom(100 + i) for i in range(20)}
+    files["big.bin"] = os.urandom(2 * 1024 * 1024)
+    write_results(tmp_path / "out", files)
+
+    summary = client.impl_upload_training_results("job", str(tmp_path / "out"), bucket, None,
+                                                  pack=True, small_file_threshold=1024,
+                                                  shard_size=1000)
+    assert summary.files == 21
+    index = packed_results.load_index(s3, bucket, client.create_results_prefix("job"))
+    assert sorted(index["files"]) == sorted(it for it in files if it != "big.bin")
+
+    client.impl_fetch_training_results("job", str(tmp_path / "all"), bucket, None)
+    assert read_results(tmp_path / "all") == files
+
+    client.impl_fetch_training_results("job", str(tmp_path / "some"), bucket, None,
+                                       ["logs/03.txt", "big.bin"])
+    assert read_results(tmp_path / "some") == {it: files[it] for it in ["logs/03.txt", "big.bin"]}
+
+
+def test_repacking_deletes_only_unused_shards(s3, bucket, tmp_path):
+    files = {"{:02d}.txt".format(i): os.urandom(100) for i in range(10)}
+    write_results(tmp_path / "out", files)
+    client.impl_upload_training_results("job", str(tmp_path / "out"), bucket, None, sync=True,
+                                        pack=True, small_file_threshold=1024, shard_size=250)
+    first_shards = list_shards(s3, bucket, "job")
+
+    # A file that grows past the threshold is uploaded on its own and leaves the index
+    files["00.txt"] = os.urandom(2048)
+    files["01.txt"] = b"changed"
+    write_results(tmp_path / "out", files)
+    client.impl_upload_training_results("job", str(tmp_path / "out"), bucket, None, sync=True,
+                                        pack=True, small_file_threshold=1024, shard_size=250)
+
+    index = packed_results.load_index(s3, bucket, client.create_results_prefix("job"))
+    assert "00.txt" not in index["files"]
+    assert list_shards(s3, bucket, "job") == set(it["shard"] for it in index["files"].values())
+    assert list_shards(s3, bucket, "job") - first_shards != set()
+
+    client.impl_fetch_training_results("job", str(tmp_path / "all"), bucket, None)
+    assert read_results(tmp_path / "all") == files
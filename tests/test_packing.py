@@ -0,0 +1,84 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from inndie import packing
+
+
+def make_files(root, sizes):
+    files = []
+    for index, size in enumerate(sizes):
+        relative_path = "dir{}/file-{}.bin".format(index % 2, index)
+        path = os.path.join(str(root), *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        files.append((path, relative_path))
+    return files
+
+
+@pytest.mark.parametrize("sizes", [[0], [1, 511, 512, 513], [3 * packing.READ_SIZE + 7, 10]])
+def test_shard_reader_writes_a_tar_with_correct_offsets(tmp_path, sizes):
+    files = make_files(tmp_path, sizes)
+    reader = packing.ShardReader(files)
+    chunks = []
+    for chunk in iter(lambda: reader.read(1000), b""):
+        chunks.append(chunk)
+    data = b"".join(chunks)
+
+    assert len(data) % tarfile.RECORDSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.getnames() == [relative_path for _, relative_path in files]
+
+    for path, relative_path in files:
+        with open(path, "rb") as f:
+            expected = f.read()
+        entry = reader.index[relative_path]
+        assert entry["size"] == len(expected)
+        assert data[entry["offset"]:entry["offset"] + entry["size"]] == expected
+
+
+def test_shard_reader_matches_tarfile_for_long_names(tmp_path):
+    # Names over 100 characters need PAX headers, which move the data further in
+    files = make_files(tmp_path, [10])
+    long_name = "x" * 150 + "/file.bin"
+    reader = packing.ShardReader([(files[0][0], long_name)])
+    data = reader.read()
+    entry = reader.index[long_name]
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.extractfile(long_name).read() == data[entry["offset"]:entry["offset"] + 10]
+
+
+def test_plan_shards_splits_by_threshold_and_shard_size(tmp_path):
+    files = make_files(tmp_path, [100, 100, 100, 5000])
+    large_files, shards = packing.plan_shards(files, small_file_threshold=1000, shard_size=250)
+    assert large_files == [files[3]]
+    assert shards == [files[:2], files[2:3]]
+
+
+def test_extract_shard_stream_writes_wanted_members(tmp_path):
+    files = make_files(tmp_path / "in", [10, 20, 30])
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path, relative_path in files:
+            tar.add(path, relative_path)
+    data = buffer.getvalue()
+    out = tmp_path / "out"
+    assert packing.extract_shard_stream(io.BytesIO(data), str(out), {files[1][1]}) == (1, 20)
+    assert os.listdir(str(out / "dir1")) == ["file-1.bin"]
+
+
+def test_get_safe_path_refuses_to_escape_the_root(tmp_path):
+    with pytest.raises(ValueError):
+        packing.get_safe_path(str(tmp_path), "../outside")
+    assert packing.get_safe_path(str(tmp_path), "a/b") == os.path.join(str(tmp_path), "a", "b")
+
+
+def test_shard_keys_are_new_for_every_upload():
+    first = packing.get_shard_key("prefix", packing.new_shard_batch(), 0)
+    second = packing.get_shard_key("prefix", packing.new_shard_batch(), 0)
+    assert first != second
+    assert packing.is_shard_key("prefix", first)
+    assert not packing.is_shard_key("prefix", "prefix/file.tar")
@@ -0,0 +1,168 @@
+import hashlib
+import os
+
+import pytest
+
+from inndie import resumable
+from inndie import transfer
+
+PART_SIZE = 5 * transfer.MB
+
+
+class Interrupted(Exception):
+    pass
+
+
+def write_file(path, size):
+    with open(str(path), "wb") as f:
+        f.write(os.urandom(size))
+    return str(path)
+
+
+def read_file(path):
+    with open(str(path), "rb") as f:
+        return f.read()
+
+
+def interrupt_after(limit):
+    seen = [0]
+
+    def callback(byte_count):
+        seen[0] += byte_count
+        if seen[0] >= limit:
+            raise Interrupted()
+
+    return callback
+
+
+def test_compute_etag(tmp_path):
+    path = write_file(tmp_path / "file", 2 * PART_SIZE + 1)
+    data = read_file(path)
+    assert resumable.compute_etag(path) == hashlib.md5(data).hexdigest()
+
+    digests = [hashlib.md5(data[offset:offset + PART_SIZE]).digest()
+               for offset in range(0, len(data), PART_SIZE)]
+    assert resumable.compute_etag(path, PART_SIZE) == "{}-3".format(
+        hashlib.md5(b"".join(digests)).hexdigest())
+
+
+def test_guess_part_size():
+    assert resumable.guess_part_size(100, "abc-3", {resumable.PART_SIZE_METADATA: "40"}) == 40
+    assert resumable.guess_part_size(20 * transfer.MB, "abc-3", {}) == 8 * transfer.MB
+    assert resumable.guess_part_size(20 * transfer.MB, "abc-1000", {}) is None
+
+
+def test_verify_file_uses_sha256_when_the_etag_is_not_an_md5(tmp_path):
+    path = write_file(tmp_path / "file", 100)
+    sha256 = hashlib.sha256(read_file(path)).hexdigest()
+    assert resumable.verify_file(path, "not-an-md5", {resumable.SHA256_METADATA: sha256},
+                                 md5_etag=False)
+    assert not resumable.verify_file(path, "not-an-md5", {}, md5_etag=False)
+    with pytest.raises(resumable.IntegrityError):
+        resumable.verify_file(path, "not-an-md5", {resumable.SHA256_METADATA: "0" * 64},
+                              md5_etag=False)
+    with pytest.raises(resumable.IntegrityError):
+        resumable.verify_file(path, "0" * 32)
+
+
+def test_interrupted_upload_resumes(s3, bucket, tmp_path):
+    path = write_file(tmp_path / "file", 3 * PART_SIZE)
+    with pytest.raises(Interrupted):
+        resumable.upload_file(s3, bucket, path, "key", PART_SIZE, max_workers=1,
+                              callback=interrupt_after(PART_SIZE))
+
+    sent = []
+    s3.meta.events.register("provide-client-params.s3.UploadPart",
+                            lambda params, **kwargs: sent.append(params["PartNumber"]))
+    resumable.upload_file(s3, bucket, path, "key", PART_SIZE, max_workers=1)
+    assert 1 not in sent and len(sent) > 0
+    assert s3.get_object(Bucket=bucket, Key="key")["Body"].read() == read_file(path)
+
+
+def test_interrupted_download_resumes(s3, bucket, tmp_path):
+    path = write_file(tmp_path / "file", 3 * PART_SIZE)
+    resumable.upload_file(s3, bucket, path, "key", PART_SIZE)
+    destination = str(tmp_path / "download")
+    with pytest.raises(Interrupted):
+        resumable.download_file(s3, bucket, "key", destination, PART_SIZE, max_workers=1,
+                                callback=interrupt_after(PART_SIZE + 1))
+    assert not os.path.exists(destination)
+
+    ranges = []
+    s3.meta.events.register("provide-client-params.s3.GetObject",
+                            lambda params, **kwargs: ranges.append(params.get("Range")))
+    resumable.download_file(s3, bucket, "key", destination, PART_SIZE, max_workers=1)
+    assert "bytes=0-{}".format(PART_SIZE - 1) not in ranges and len(ranges) > 0
+    assert read_file(destination) == read_file(path)
+
+
+def pretend_sse_kms(s3):
+    """
+    Makes responses look like those of an SSE-KMS bucket, whose ETags are not MD5s.
+    """
+    def handler(parsed, **kwargs):
+        parsed["ServerSideEncryption"] = "aws:kms"
+        if "ETag" in parsed:
+            parsed["ETag"] = '"{}"'.format("f" * 32)
+
+    # moto would check IfMatch against the real ETag
+    s3.meta.events.register("before-parameter-build.s3.GetObject",
+                            lambda params, **kwargs: params.pop("IfMatch", None))
+    for operation in ["HeadObject", "CompleteMultipartUpload"]:
+        s3.meta.events.register("after-call.s3." + operation, handler)
+
+
+@pytest.mark.parametrize("size", [100, 2 * PART_SIZE])
+def test_sse_kms_objects_are_checked_by_sha256(s3, bucket, tmp_path, size):
+    pretend_sse_kms(s3)
+    path = write_file(tmp_path / "file", size)
+    resumable.upload_file(s3, bucket, path, "key", PART_SIZE)
+    assert s3.head_object(Bucket=bucket, Key="key")["Metadata"][resumable.SHA256_METADATA] == \
+        hashlib.sha256(read_file(path)).hexdigest()
+
+    resumable.download_file(s3, bucket, "key", str(tmp_path / "download"), PART_SIZE)
+    assert read_file(tmp_path / "download") == read_file(path)
+
+    s3.copy_object(Bucket=bucket, Key="key", CopySource={"Bucket": bucket, "Key": "key"},
+                   Metadata={resumable.SHA256_METADATA: "0" * 64}, MetadataDirective="REPLACE")
+    with pytest.raises(resumable.IntegrityError):
+        resumable.download_file(s3, bucket, "key", str(tmp_path / "corrupt"), PART_SIZE)
+
+
+def test_part_size_is_raised_to_stay_within_the_part_limit(s3, bucket, tmp_path, monkeypatch):
+    monkeypatch.setattr(resumable, "MAX_PARTS", 2)
+    path = write_file(tmp_path / "file", 3 * PART_SIZE)
+    resumable.upload_file(s3, bucket, path, "key", PART_SIZE)
+
+    head = s3.head_object(Bucket=bucket, Key="key")
+    part_size = int(head["Metadata"][resumable.PART_SIZE_METADATA])
+    assert part_size == -(-3 * PART_SIZE // 2)
+    assert head["ETag"].strip('"').endswith("-2")
+
+    resumable.download_file(s3, bucket, "key", str(tmp_path / "download"), PART_SIZE)
+    assert read_file(tmp_path / "download") == read_file(path)
+
+
+def test_rate_limiter_sleeps_once_the_budget_is_spent(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(transfer.time, "monotonic", lambda: 100.0)
+    monkeypatch.setattr(transfer.time, "sleep", sleeps.append)
+    limiter = transfer.RateLimiter(transfer.MB)
+    limiter.consume(transfer.MB)
+    assert sleeps == []
+    limiter.consume(2 * transfer.MB)
+    assert sleeps == [2.0]
+
+
+def test_max_bandwidth_applies_to_resumable_transfers(s3, bucket, tmp_path, monkeypatch):
+    consumed = []
+    monkeypatch.setattr(transfer.RateLimiter, "consume",
+                        lambda self, byte_count: consumed.append(byte_count))
+    path = write_file(tmp_path / "file", 2 * PART_SIZE)
+    resumable.upload_file(s3, bucket, path, "key", PART_SIZE, max_bandwidth=transfer.MB)
+    assert sum(consumed) == 2 * PART_SIZE
+
+    del consumed[:]
+    resumable.download_file(s3, bucket, "key", str(tmp_path / "download"), PART_SIZE,
+                            max_bandwidth=transfer.MB)
+    assert sum(consumed) == 2 * PART_SIZE
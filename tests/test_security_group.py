@@ -0,0 +1,36 @@
+from inndie.security_group import GressPlan, collapse_rules, expand_permissions
+
+SSH = {"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22,
+       "IpRanges": [{"CidrIp": "0.0.0.0/0", "Description": "ssh"}]}
+ALL_EGRESS = {"IpProtocol": "-1", "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+              "Ipv6Ranges": [{"CidrIpv6": "::/0"}]}
+
+
+def test_matching_rules_need_no_changes():
+    # Descriptions and the order of sources do not matter
+    current = [dict(SSH, IpRanges=[{"CidrIp": "0.0.0.0/0"}])]
+    plan = GressPlan(current, [ALL_EGRESS], [SSH], [ALL_EGRESS])
+    assert plan.is_empty()
+    assert plan.format() == "No changes needed."
+
+
+def test_drifted_rules_are_revoked_and_authorized():
+    http = {"IpProtocol": "tcp", "FromPort": 80, "ToPort": 80,
+            "IpRanges": [{"CidrIp": "10.0.0.0/8"}]}
+    plan = GressPlan([SSH, http], [], [SSH], [ALL_EGRESS])
+
+    assert plan.revoke_ingress == {("tcp", 80, 80, "IpRanges", "10.0.0.0/8")}
+    assert plan.authorize_ingress == set()
+    assert plan.revoke_egress == set()
+    assert plan.authorize_egress == {("-1", None, None, "IpRanges", "0.0.0.0/0"),
+                                     ("-1", None, None, "Ipv6Ranges", "::/0")}
+    assert plan.format().splitlines() == [
+        "revoke ingress: tcp 80-80 10.0.0.0/8",
+        "authorize egress: all traffic 0.0.0.0/0",
+        "authorize egress: all traffic ::/0"
+    ]
+
+
+def test_collapse_rules_inverts_expand_permissions():
+    rules = expand_permissions([SSH, ALL_EGRESS])
+    assert expand_permissions(collapse_rules(rules)) == rules
@@ -0,0 +1,40 @@
+import pytest
+
+from inndie import session
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    for name in ["max_pool_connections", "control_pool_connections"]:
+        monkeypatch.setitem(session.settings, name, session.settings[name])
+    session.reset()
+    yield
+    session.reset()
+
+
+def test_clients_are_shared():
+    assert session.get_client("s3", None) is session.get_client("s3", None)
+    assert session.get_client("s3", None) is not session.get_client("s3", None, control=True)
+
+
+def test_growing_the_pool_keeps_control_clients():
+    control = session.get_client("s3", None, control=True)
+    data = session.get_client("s3", None)
+    session.ensure_max_pool_connections(session.settings["max_pool_connections"] + 10)
+
+    assert session.get_client("s3", None, control=True) is control
+    grown = session.get_client("s3", None)
+    assert grown is not data
+    assert grown.meta.config.max_pool_connections == session.settings["max_pool_connections"]
+
+    # A smaller request leaves the pool as it is
+    session.ensure_max_pool_connections(1)
+    assert session.get_client("s3", None) is grown
+
+
+def test_resources_follow_the_pool_size():
+    resource = session.get_resource("s3", None)
+    assert session.get_resource("s3", None) is resource
+    session.ensure_max_pool_connections(session.settings["max_pool_connections"] + 10)
+    assert session.get_resource("s3", None) is not resource
@@ -0,0 +1,35 @@
+import pytest
+
+from inndie import steps
+
+
+def test_steps_run_after_their_dependencies():
+    order = []
+    results = steps.run_steps([
+        ("c", lambda: order.append("c"), ["a", "b"]),
+        ("b", lambda: order.append("b"), ["a"]),
+        ("a", lambda: order.append("a"), [])
+    ], max_workers=1)
+    assert order == ["a", "b", "c"]
+    assert sorted(results) == ["a", "b", "c"]
+
+
+def test_dependents_of_failed_steps_are_skipped():
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(steps.StepError) as info:
+        steps.run_steps([
+            ("a", fail, []),
+            ("b", lambda: 1, ["a"]),
+            ("c", lambda: 2, ["b"]),
+            ("d", lambda: 3, []),
+            ("e", lambda: 4, ["missing"])
+        ], max_workers=2)
+
+    failures = dict(info.value.failures)
+    assert str(failures["a"]) == "boom"
+    assert isinstance(failures["b"], steps.SkippedError)
+    assert isinstance(failures["c"], steps.SkippedError)
+    assert isinstance(failures["e"], steps.SkippedError)
+    assert info.value.results["d"][0] == 3
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from inndie import compression
+from inndie import transfer
+
+PART_SIZE = 1024
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setitem(transfer.TRANSFER_PROFILES["default"], "multipart_threshold", PART_SIZE)
+    monkeypatch.setitem(transfer.TRANSFER_PROFILES["default"], "multipart_chunksize", PART_SIZE)
+
+
+def record_ranges(s3):
+    ranges = []
+    s3.meta.events.register("provide-client-params.s3.GetObject",
+                            lambda params, **kwargs: ranges.append(params.get("Range")))
+    return ranges
+
+
+def read_file(path):
+    with open(str(path), "rb") as f:
+        return f.read()
+
+
+def test_small_objects_take_one_get(s3, bucket, tmp_path, small_parts):
+    s3.put_object(Body=b"A" * 100, Bucket=bucket, Key="small")
+    ranges = record_ranges(s3)
+    assert transfer.download_file(s3, bucket, "small", str(tmp_path / "small")) == 100
+    assert ranges == ["bytes=0-1023"]
+    assert read_file(tmp_path / "small") == b"A" * 100
+
+
+def test_large_objects_download_each_byte_once(s3, bucket, tmp_path, small_parts):
+    data = os.urandom(3 * PART_SIZE + 10)
+    s3.put_object(Body=data, Bucket=bucket, Key="large")
+    ranges = record_ranges(s3)
+    assert transfer.download_file(s3, bucket, "large", str(tmp_path / "large")) == len(data)
+    assert sorted(ranges) == ["bytes=0-1023", "bytes=1024-2047", "bytes=2048-3071",
+                              "bytes=3072-3081"]
+    assert read_file(tmp_path / "large") == data
+
+
+def test_empty_objects(s3, bucket, tmp_path, small_parts):
+    s3.put_object(Body=b"", Bucket=bucket, Key="empty")
+    assert transfer.download_file(s3, bucket, "empty", str(tmp_path / "empty")) == 0
+    assert read_file(tmp_path / "empty") == b""
+
+
+def test_large_compressed_objects(s3, bucket, tmp_path, small_parts):
+    data = os.urandom(2 * PART_SIZE) * 4
+    path = tmp_path / "data.bin"
+    with open(str(path), "wb") as f:
+        f.write(data)
+    compression.upload_file(s3, bucket, str(path), "compressed", "gzip")
+    assert s3.head_object(Bucket=bucket, Key="compressed")["ContentLength"] > PART_SIZE
+
+    ranges = record_ranges(s3)
+    transfer.download_file(s3, bucket, "compressed", str(tmp_path / "download"))
+    assert ranges == ["bytes=0-1023", "bytes=1024-"]
+    assert read_file(tmp_path / "download") == data